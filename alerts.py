@@ -0,0 +1,531 @@
+import asyncio
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+import html
+import logging
+import re
+import sqlite3
+import time
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from config import ALERT_CHECK_INTERVAL, ALERT_SHARED_POLL_INTERVAL, USER_DB_PATH
+from services.exceptions import WeatherError
+from services.weather_model import WeatherReading
+from services.weather_service import WeatherQuery, WeatherService, weather_service
+
+
+logger = logging.getLogger(__name__)
+
+
+class AlertField(NamedTuple):
+    attr: str  # поле WeatherReading
+    label: str
+    unit: str
+    # Насколько значение должно уйти от порога, чтобы правило сработало снова
+    hysteresis: float
+
+
+ALERT_FIELDS: Dict[str, AlertField] = {
+    "temp": AlertField("temp", "Температура", "°C", 1.0),
+    "feels": AlertField("feels_like", "Ощущается как", "°C", 1.0),
+    "humidity": AlertField("humidity", "Влажность", "%", 5.0),
+    "pressure": AlertField("pressure", "Давление", "гПа", 2.0),
+    "wind": AlertField("wind_speed", "Ветер", "м/с", 2.0),
+}
+
+# "<город> temp<-10", "<город> wind > 15"
+RULE_PATTERN = re.compile(
+    r"^(?P<city>.+?)\s+(?P<field>[a-z]+)\s*(?P<op>[<>])\s*"
+    r"(?P<threshold>[-+]?\d+(?:[.,]\d+)?)$",
+    re.IGNORECASE,
+)
+
+
+def parse_rule(text: str) -> Optional[Tuple[str, str, str, float]]:
+    """Разбирает аргументы /alert: (город, поле, "<" или ">", порог) или None"""
+    match = RULE_PATTERN.match(text.strip())
+    if match is None or match["field"].lower() not in ALERT_FIELDS:
+        return None
+    threshold = float(match["threshold"].replace(",", "."))
+    return match["city"], match["field"].lower(), match["op"], threshold
+
+
+class AlertRule(NamedTuple):
+    id: int
+    chat_id: int
+    city: str  # как ввел пользователь, для повторного resolve
+    key: str  # ключ кэша погоды
+    title: str
+    field: str
+    op: str
+    threshold: float
+
+    def describe(self) -> str:
+        return f"{self.title}: {self.field} {html.escape(self.op)} {self.threshold:g}"
+
+
+class ThresholdBucket:
+    """Правила одного города на одно поле и направление сравнения
+
+    Пороги отсортированы, поэтому сработавшие правила и правила, которые
+    пора снова взвести, - это два непрерывных диапазона, найденные бинарным
+    поиском. Флаги "взведено" лежат в bytearray и меняются срезами целиком.
+    """
+
+    __slots__ = ("op", "thresholds", "rule_ids", "armed")
+
+    def __init__(self, op: str):
+        self.op = op
+        self.thresholds = array("d")
+        self.rule_ids = array("q")
+        self.armed = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.rule_ids)
+
+    @classmethod
+    def build(
+        cls, op: str, thresholds: List[float], rule_ids: List[int], armed: List[int]
+    ) -> "ThresholdBucket":
+        """Бакет сразу из всех правил: одна сортировка вместо вставок по одной"""
+        bucket = cls(op)
+        # Сортировка устойчива: равные пороги идут в порядке добавления, как в add
+        order = sorted(range(len(thresholds)), key=thresholds.__getitem__)
+        bucket.thresholds = array("d", [thresholds[i] for i in order])
+        bucket.rule_ids = array("q", [rule_ids[i] for i in order])
+        bucket.armed = bytearray([armed[i] for i in order])
+        return bucket
+
+    def add(self, rule_id: int, threshold: float, armed: bool = True):
+        index = bisect_right(self.thresholds, threshold)
+        self.thresholds.insert(index, threshold)
+        self.rule_ids.insert(index, rule_id)
+        self.armed.insert(index, 1 if armed else 0)
+
+    def remove(self, rule_id: int, threshold: float):
+        index = self._find(rule_id, threshold)
+        if index is not None:
+            del self.thresholds[index]
+            del self.rule_ids[index]
+            del self.armed[index]
+
+    def set_armed(self, rule_id: int, threshold: float, armed: bool):
+        index = self._find(rule_id, threshold)
+        if index is not None:
+            self.armed[index] = 1 if armed else 0
+
+    def _find(self, rule_id: int, threshold: float) -> Optional[int]:
+        start = bisect_left(self.thresholds, threshold)
+        end = bisect_right(self.thresholds, threshold)
+        for index in range(start, end):
+            if self.rule_ids[index] == rule_id:
+                return index
+        return None
+
+    def evaluate(self, value: float, hysteresis: float) -> List[int]:
+        """Сработавшие правила; они снимаются до возврата значения за порог"""
+        thresholds = self.thresholds
+        if self.op == "<":
+            # value < порог: пороги выше value; взводим пороги <= value - h
+            fire_start, fire_end = bisect_right(thresholds, value), len(thresholds)
+            rearm_start, rearm_end = 0, bisect_right(thresholds, value - hysteresis)
+        else:
+            # value > порог: пороги ниже value; взводим пороги >= value + h
+            fire_start, fire_end = 0, bisect_left(thresholds, value)
+            rearm_start = bisect_left(thresholds, value + hysteresis)
+            rearm_end = len(thresholds)
+
+        armed = self.armed
+        if rearm_start < rearm_end:
+            armed[rearm_start:rearm_end] = b"\x01" * (rearm_end - rearm_start)
+
+        ready = armed.count(1, fire_start, fire_end)
+        if not ready:
+            return []
+        if ready == fire_end - fire_start:
+            # Обычный случай: весь диапазон взведен, берем id одним срезом
+            fired = self.rule_ids[fire_start:fire_end].tolist()
+        else:
+            fired = []
+            index = armed.find(1, fire_start, fire_end)
+            while index != -1:
+                fired.append(self.rule_ids[index])
+                index = armed.find(1, index + 1, fire_end)
+        armed[fire_start:fire_end] = bytes(fire_end - fire_start)
+        return fired
+
+    def disarmed(self) -> Set[int]:
+        result = set()
+        index = self.armed.find(0)
+        while index != -1:
+            result.add(self.rule_ids[index])
+            index = self.armed.find(0, index + 1)
+        return result
+
+
+class AlertStore:
+    """Правила оповещений: SQLite и индекс город -> (поле, сравнение) -> пороги"""
+
+    def __init__(self, path: str = USER_DB_PATH):
+        self.path = path
+        # В многопроцессном режиме правила меняют и другие процессы
+        self.shared = False
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="alerts")
+        self._data_version = 0
+        # Перестройка индекса идет в потоке; изменения правил ждут ее окончания
+        self._lock = asyncio.Lock()
+
+        self.rules: Dict[int, AlertRule] = {}
+        self._by_city: Dict[str, Dict[Tuple[str, str], ThresholdBucket]] = {}
+        self._by_chat: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def start(self):
+        """Открывает базу и загружает все правила в память"""
+        async with self._lock:
+            rows, self._data_version = await self._run(self._open)
+            await self._rebuild(rows)
+        logger.info(f"Загружено правил оповещений: {len(rows)}")
+
+    def _open(self) -> Tuple[List[tuple], int]:
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS alerts ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "chat_id INTEGER NOT NULL, "
+            "city TEXT NOT NULL, "
+            "key TEXT NOT NULL, "
+            "title TEXT NOT NULL, "
+            "field TEXT NOT NULL, "
+            "op TEXT NOT NULL, "
+            "threshold REAL NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS alerts_chat ON alerts (chat_id)"
+        )
+        self._conn.commit()
+        return self._load()
+
+    def _load(self) -> Tuple[List[tuple], int]:
+        rows = self._conn.execute(
+            "SELECT id, chat_id, city, key, title, field, op, threshold FROM alerts"
+        ).fetchall()
+        # data_version меняется, только когда базу изменило другое соединение
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        return rows, version
+
+    def _data_version_now(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    async def close(self):
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+    async def reload(self):
+        """Перечитывает правила, если их меняли другие процессы (только в shared)"""
+        if not self.shared:
+            return
+        async with self._lock:
+            if await self._run(self._data_version_now) == self._data_version:
+                return
+            rows, self._data_version = await self._run(self._load)
+            await self._rebuild(rows)
+
+    async def _rebuild(self, rows: List[tuple]):
+        """Строит индекс в отдельном потоке и подменяет им текущий"""
+        # Сработавшие правила остаются снятыми, иначе оповещение повторится
+        disarmed = self._disarmed()
+        self.rules, self._by_city, self._by_chat = await asyncio.to_thread(
+            self._build, rows, disarmed
+        )
+        # Пока индекс строился, старый продолжал проверяться: переносим итог
+        current = self._disarmed()
+        for rule_id in current ^ disarmed:
+            rule = self.rules.get(rule_id)
+            if rule is not None:
+                bucket = self._by_city[rule.key][rule.field, rule.op]
+                bucket.set_armed(rule.id, rule.threshold, rule_id not in current)
+
+    def _disarmed(self) -> Set[int]:
+        disarmed: Set[int] = set()
+        for buckets in self._by_city.values():
+            for bucket in buckets.values():
+                disarmed |= bucket.disarmed()
+        return disarmed
+
+    @staticmethod
+    def _build(rows: List[tuple], disarmed: Set[int]) -> tuple:
+        rules: Dict[int, AlertRule] = {}
+        by_chat: Dict[int, List[int]] = {}
+        # город -> (поле, сравнение) -> столбцы порогов, id и флагов
+        columns: Dict[str, Dict[Tuple[str, str], tuple]] = {}
+        for row in rows:
+            rule = AlertRule(*row)
+            rules[rule.id] = rule
+            by_chat.setdefault(rule.chat_id, []).append(rule.id)
+            groups = columns.setdefault(rule.key, {})
+            group = groups.get((rule.field, rule.op))
+            if group is None:
+                group = groups[rule.field, rule.op] = ([], [], [])
+            group[0].append(rule.threshold)
+            group[1].append(rule.id)
+            group[2].append(0 if rule.id in disarmed else 1)
+        by_city = {
+            key: {
+                (field, op): ThresholdBucket.build(op, *group)
+                for (field, op), group in groups.items()
+            }
+            for key, groups in columns.items()
+        }
+        return rules, by_city, by_chat
+
+    async def add(
+        self,
+        chat_id: int,
+        city: str,
+        query: WeatherQuery,
+        field: str,
+        op: str,
+        threshold: float,
+    ) -> AlertRule:
+        values = (chat_id, city, query.key, query.title, field, op, threshold)
+        async with self._lock:
+            rule = AlertRule(await self._run(self._insert, *values), *values)
+            self._index(rule)
+        return rule
+
+    def _insert(self, *values) -> int:
+        with self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO alerts "
+                "(chat_id, city, key, title, field, op, threshold, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*values, time.time()),
+            )
+        return cursor.lastrowid
+
+    async def remove(self, chat_id: int, rule_id: Optional[int] = None) -> int:
+        """Удаляет правило чата (или все при rule_id=None); возвращает число"""
+        async with self._lock:
+            ids = [
+                existing
+                for existing in self._by_chat.get(chat_id, ())
+                if rule_id is None or existing == rule_id
+            ]
+            if not ids:
+                return 0
+            await self._run(self._delete, ids)
+            for existing in ids:
+                self._unindex(self.rules[existing])
+        return len(ids)
+
+    def _delete(self, ids: List[int]):
+        with self._conn:
+            self._conn.executemany(
+                "DELETE FROM alerts WHERE id = ?", [(rule_id,) for rule_id in ids]
+            )
+
+    def for_chat(self, chat_id: int) -> List[AlertRule]:
+        return [self.rules[rule_id] for rule_id in self._by_chat.get(chat_id, ())]
+
+    def city_keys(self) -> List[str]:
+        return list(self._by_city)
+
+    def buckets(self, key: str) -> Dict[Tuple[str, str], ThresholdBucket]:
+        return self._by_city.get(key, {})
+
+    def _index(self, rule: AlertRule, armed: bool = True):
+        self.rules[rule.id] = rule
+        self._by_chat.setdefault(rule.chat_id, []).append(rule.id)
+        buckets = self._by_city.setdefault(rule.key, {})
+        bucket = buckets.get((rule.field, rule.op))
+        if bucket is None:
+            bucket = buckets[rule.field, rule.op] = ThresholdBucket(rule.op)
+        bucket.add(rule.id, rule.threshold, armed)
+
+    def _unindex(self, rule: AlertRule):
+        del self.rules[rule.id]
+        chat_rules = self._by_chat[rule.chat_id]
+        chat_rules.remove(rule.id)
+        if not chat_rules:
+            del self._by_chat[rule.chat_id]
+        buckets = self._by_city[rule.key]
+        bucket = buckets[rule.field, rule.op]
+        bucket.remove(rule.id, rule.threshold)
+        if not bucket:
+            del buckets[rule.field, rule.op]
+        if not buckets:
+            del self._by_city[rule.key]
+
+
+class AlertEvaluator:
+    """Проверяет правила города при каждом новом показании его погоды
+
+    Показания приходят от WeatherService сразу после загрузки из API. Раз в
+    interval города с правилами, которые никто не запрашивал, обновляются
+    фоном (известные по id - пакетами), так что каждый город загружается
+    один раз на все его правила. В многопроцессном режиме раз в
+    poll_interval из общего кэша забираются показания других процессов.
+    """
+
+    def __init__(
+        self,
+        store: AlertStore,
+        service: WeatherService,
+        interval: float = ALERT_CHECK_INTERVAL,
+        poll_interval: float = ALERT_SHARED_POLL_INTERVAL,
+    ):
+        self.store = store
+        self.service = service
+        self.interval = interval
+        self.poll_interval = poll_interval
+        self._sender = None
+        self._task: Optional[asyncio.Task] = None
+        # Ключ города -> время наблюдения, по которому правила уже проверены
+        self._evaluated: Dict[str, int] = {}
+        self._queries: Dict[str, WeatherQuery] = {}
+        # Время самой новой записи общего кэша, которую уже видели
+        self._shared_seen = 0.0
+
+        self.readings_checked = 0
+        self.alerts_fired = 0
+        self.messages_queued = 0
+
+    async def start(self, sender):
+        """sender - очередь исходящих сообщений с методом send_nowait()"""
+        self._sender = sender
+        self.service.add_refresh_listener(self.on_reading)
+        self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        self.service.remove_refresh_listener(self.on_reading)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        next_check = loop.time() + self.interval
+        while True:
+            shared = self.service.shared_cache is not None
+            await asyncio.sleep(
+                min(self.poll_interval, self.interval) if shared else self.interval
+            )
+            try:
+                if loop.time() >= next_check:
+                    next_check = loop.time() + self.interval
+                    await self.check_once()
+                elif shared:
+                    await self.poll_shared()
+            except Exception as e:
+                logger.error(f"Ошибка проверки оповещений: {e!r}")
+
+    async def poll_shared(self):
+        """Проверяет правила по показаниям, которые загрузили другие процессы"""
+        await self.store.reload()
+        rows = await self.service.shared_cache.changed_since(self._shared_seen)
+        for key, stored_at, row in rows:
+            self._shared_seen = max(self._shared_seen, stored_at)
+            if self.store.buckets(key):
+                self.on_reading(key, WeatherReading.from_row(row))
+
+    async def check_once(self):
+        """Обновляет устаревшие города с правилами и проверяет их"""
+        await self.store.reload()
+        keys = self.store.city_keys()
+        known = set(keys)
+        self._evaluated = {
+            key: observed for key, observed in self._evaluated.items() if key in known
+        }
+
+        stale = []
+        for key in keys:
+            query = self._query(key)
+            if query is None:
+                continue
+            cached = self.service.cache.peek(key)
+            if cached is None or cached[1] >= self.service.cache.ttl:
+                stale.append(query)
+        await self.service.refresh_many(stale)
+
+        # Показания, загруженные другими процессами, слушатель не видел
+        for key in keys:
+            cached = self.service.cache.peek(key)
+            if cached is not None:
+                self.on_reading(key, cached[0])
+        if self.service.shared_cache is not None:
+            await self.poll_shared()
+
+    def _query(self, key: str) -> Optional[WeatherQuery]:
+        query = self._queries.get(key)
+        if query is None:
+            buckets = self.store.buckets(key)
+            if not buckets:
+                return None
+            rule_id = next(iter(buckets.values())).rule_ids[0]
+            try:
+                query = self.service.resolve(self.store.rules[rule_id].city)
+            except WeatherError:
+                return None
+            self._queries[key] = query
+        return query
+
+    def on_reading(self, key: str, reading: WeatherReading):
+        """Проверяет все правила города по новому показанию"""
+        buckets = self.store.buckets(key)
+        if not buckets or reading.observed_at <= self._evaluated.get(key, 0):
+            return
+        self._evaluated[key] = reading.observed_at
+        self.readings_checked += 1
+
+        fired: Dict[int, List[Tuple[AlertRule, float]]] = {}
+        for (field, _), bucket in list(buckets.items()):
+            spec = ALERT_FIELDS[field]
+            value = getattr(reading, spec.attr)
+            for rule_id in bucket.evaluate(value, spec.hysteresis):
+                rule = self.store.rules[rule_id]
+                fired.setdefault(rule.chat_id, []).append((rule, value))
+        if not fired or self._sender is None:
+            return
+
+        for chat_id, items in fired.items():
+            self.alerts_fired += len(items)
+            lines = [f"🔔 <b>Оповещение: {items[0][0].title}</b>\n"]
+            for rule, value in items:
+                spec = ALERT_FIELDS[rule.field]
+                lines.append(
+                    f"• {spec.label}: {value:g} {spec.unit} "
+                    f"(правило {html.escape(rule.op)} {rule.threshold:g})"
+                )
+            if self._sender.send_nowait(chat_id, "\n".join(lines)):
+                self.messages_queued += 1
+
+    def stats(self) -> dict:
+        return {
+            "rules": len(self.store),
+            "cities": len(self.store.city_keys()),
+            "readings_checked": self.readings_checked,
+            "alerts_fired": self.alerts_fired,
+            "messages_queued": self.messages_queued,
+        }
+
+
+alert_store = AlertStore()
+alert_evaluator = AlertEvaluator(alert_store, weather_service)
@@ -0,0 +1,229 @@
+import asyncio
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import fcntl
+import logging
+from math import fsum
+import mmap
+import os
+import struct
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+from urllib.parse import quote
+
+from config import ARCHIVE_DIR
+from services.weather_model import WeatherReading
+
+
+logger = logging.getLogger(__name__)
+
+# Запись архива: время наблюдения и показания, все поля - double
+RECORD = struct.Struct("<7d")
+FIELDS = 7
+OBSERVED_AT, TEMP, FEELS_LIKE, HUMIDITY, PRESSURE, WIND_SPEED, SUNSET = range(FIELDS)
+
+
+class Range(NamedTuple):
+    low: float
+    high: float
+    mean: float
+
+
+class HistoryStats(NamedTuple):
+    count: int
+    first_at: float
+    last_at: float
+    temp: Range
+    humidity: Range
+    wind_speed: Range
+
+    def render(self, city: str, days: int) -> str:
+        first = datetime.fromtimestamp(self.first_at)
+        wind = self.wind_speed
+        return (
+            f"📈 <b>История погоды в {city} за {days} дн.</b>\n\n"
+            f"Наблюдений: {self.count}, с {first:%d.%m %H:%M}\n"
+            f"🌡 <b>Температура:</b> {self.temp.low:+.1f}…{self.temp.high:+.1f} °C, "
+            f"в среднем {self.temp.mean:+.1f} °C\n"
+            f"💧 <b>Влажность:</b> {self.humidity.low:.0f}–{self.humidity.high:.0f}%, "
+            f"в среднем {self.humidity.mean:.0f}%\n"
+            f"💨 <b>Ветер:</b> {wind.low:.1f}–{wind.high:.1f} м/с, "
+            f"в среднем {wind.mean:.1f} м/с"
+        )
+
+
+class WeatherArchive:
+    """Архив наблюдений погоды: файл записей фиксированной длины на город
+
+    Записи только дописываются в конец и идут по возрастанию времени,
+    поэтому диапазон дат находится бинарным поиском. Статистика считается
+    по отображенному в память файлу через memoryview: столбец - это срез
+    с шагом, в объекты Python файл целиком не превращается.
+    """
+
+    def __init__(self, path: str = ARCHIVE_DIR):
+        self.path = path
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Время последней записи по ключу; доступно только потоку архива
+        self._last_observed: Dict[str, float] = {}
+        # В многопроцессном режиме в те же файлы пишут и другие процессы:
+        # запись идет под блокировкой файла, последняя запись читается с диска
+        self.shared = False
+
+        self.appended = 0
+        self.skipped = 0
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def start(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="weather-archive"
+        )
+        await self._run(os.makedirs, self.path, 0o755, True)
+
+    async def close(self):
+        if self._executor is not None:
+            # Дожидаемся уже поставленных в очередь записей
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, quote(key, safe="") + ".bin")
+
+    def append(self, key: str, reading: WeatherReading):
+        """Ставит наблюдение в очередь на запись, не дожидаясь диска"""
+        if self._executor is None:
+            return
+        record = RECORD.pack(
+            reading.observed_at,
+            reading.temp,
+            reading.feels_like,
+            reading.humidity,
+            reading.pressure,
+            reading.wind_speed,
+            reading.sunset,
+        )
+        future = self._executor.submit(self._append, key, reading.observed_at, record)
+        future.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(future):
+        if future.exception() is not None:
+            logger.warning(f"Не удалось записать в архив: {future.exception()!r}")
+
+    def _append(self, key: str, observed_at: float, record: bytes):
+        path = self._file(key)
+        if self.shared:
+            self._append_locked(path, observed_at, record)
+            return
+        last = self._last_observed.get(key)
+        if last is None:
+            latest = self._read_latest(path)
+            last = latest[OBSERVED_AT] if latest is not None else 0.0
+        # Одно наблюдение API отдает, пока не появится следующее
+        if observed_at <= last:
+            self.skipped += 1
+            return
+        with open(path, "ab") as f:
+            f.write(record)
+        self._last_observed[key] = observed_at
+        self.appended += 1
+
+    def _append_locked(self, path: str, observed_at: float, record: bytes):
+        """Дописывает запись под flock, сверяясь с последней записью в файле"""
+        with open(path, "a+b") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                size = os.fstat(f.fileno()).st_size // RECORD.size * RECORD.size
+                if size:
+                    tail = os.pread(f.fileno(), RECORD.size, size - RECORD.size)
+                    # Запись не новее последней (ее уже дописал другой процесс)
+                    if observed_at <= RECORD.unpack(tail)[OBSERVED_AT]:
+                        self.skipped += 1
+                        return
+                f.write(record)
+                f.flush()
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        self.appended += 1
+
+    @staticmethod
+    def _read_latest(path: str) -> Optional[Tuple[float, ...]]:
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            size = os.fstat(f.fileno()).st_size // RECORD.size * RECORD.size
+            if not size:
+                return None
+            return RECORD.unpack(os.pread(f.fileno(), RECORD.size, size - RECORD.size))
+
+    async def latest(self, key: str) -> Optional[Tuple[WeatherReading, float]]:
+        """Последнее наблюдение и его возраст в секундах или None"""
+        if self._executor is None:
+            return None
+        row = await self._run(self._read_latest, self._file(key))
+        if row is None:
+            return None
+        reading = WeatherReading(
+            description="Нет данных",
+            temp=row[TEMP],
+            feels_like=row[FEELS_LIKE],
+            humidity=int(row[HUMIDITY]),
+            pressure=int(row[PRESSURE]),
+            wind_speed=row[WIND_SPEED],
+            sunset=int(row[SUNSET]),
+            observed_at=int(row[OBSERVED_AT]),
+        )
+        return reading, max(0.0, time.time() - row[OBSERVED_AT])
+
+    async def history(self, key: str, since: float) -> Optional[HistoryStats]:
+        """Статистика наблюдений начиная с since или None, если их нет"""
+        if self._executor is None:
+            return None
+        return await self._run(self._history, self._file(key), since)
+
+    def _history(self, path: str, since: float) -> Optional[HistoryStats]:
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            size = os.fstat(f.fileno()).st_size // RECORD.size * RECORD.size
+            if not size:
+                return None
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mapped:
+                with memoryview(mapped) as raw, raw.cast("d") as values:
+                    return _summarize(values, since)
+
+    def stats(self) -> dict:
+        return {"appended": self.appended, "skipped": self.skipped}
+
+
+def _summarize(values: memoryview, since: float) -> Optional[HistoryStats]:
+    """Итоги по столбцам; срезы с шагом FIELDS не копируют данные"""
+    times = values[OBSERVED_AT::FIELDS]
+    start = bisect_left(times, since)
+    count = len(times) - start
+    if count == 0:
+        return None
+
+    def column(field: int) -> Range:
+        data = values[start * FIELDS + field :: FIELDS]
+        return Range(min(data), max(data), fsum(data) / count)
+
+    return HistoryStats(
+        count=count,
+        first_at=times[start],
+        last_at=times[-1],
+        temp=column(TEMP),
+        humidity=column(HUMIDITY),
+        wind_speed=column(WIND_SPEED),
+    )
+
+
+weather_archive = WeatherArchive()
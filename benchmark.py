@@ -0,0 +1,426 @@
+"""Нагрузочный тест бота на локальных заглушках OpenWeatherMap и Telegram
+
+Прогоняет синтетический поток обновлений через настоящие setup_handlers и
+MessageHandlers и пишет результаты в JSON, чтобы сравнивать версии:
+
+    python benchmark.py --updates 5000 --chats 1000 --output bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Tuple
+
+import aiohttp
+from aiohttp import web
+
+
+logger = logging.getLogger("benchmark")
+
+# Доли типов обновлений в синтетическом потоке
+UPDATE_MIX = (
+    ("text", 0.70),
+    ("weather", 0.10),
+    ("compare", 0.08),
+    ("forecast", 0.07),
+    ("start", 0.05),
+)
+
+
+class FakeOpenWeatherMap:
+    """Заглушка OpenWeatherMap с настраиваемой задержкой и долей ошибок"""
+
+    def __init__(self, latency: float, jitter: float, error_rate: float, seed: int):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls: Dict[str, int] = {}
+        self.errors = 0
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/data/2.5/weather", self.weather)
+        app.router.add_get("/data/2.5/group", self.group)
+        app.router.add_get("/data/2.5/forecast", self.forecast)
+        app.router.add_get("/_stats", self.stats)
+        return app
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"calls": self.calls, "errors": self.errors})
+
+    async def _respond(self, endpoint: str) -> bool:
+        """Учитывает вызов, ждет задержку; False - нужно ответить ошибкой"""
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+        if self.random.random() < self.error_rate:
+            self.errors += 1
+            return False
+        return True
+
+    def _reading(self, city_id: int) -> dict:
+        temp = round(self.random.uniform(-20, 30), 1)
+        return {
+            "id": city_id,
+            "dt": int(time.time()),
+            "weather": [{"description": "переменная облачность"}],
+            "main": {
+                "temp": temp,
+                "feels_like": temp - 2,
+                "humidity": 70,
+                "pressure": 1012,
+            },
+            "wind": {"speed": 3.5},
+            "sys": {"sunset": int(time.time()) + 3600},
+        }
+
+    async def weather(self, request: web.Request) -> web.Response:
+        if not await self._respond("weather"):
+            return web.Response(status=503)
+        return web.json_response(self._reading(int(request.query.get("id", 0))))
+
+    async def group(self, request: web.Request) -> web.Response:
+        if not await self._respond("group"):
+            return web.Response(status=503)
+        ids = [int(city_id) for city_id in request.query["id"].split(",")]
+        items = [self._reading(city_id) for city_id in ids]
+        return web.json_response({"cnt": len(items), "list": items})
+
+    async def forecast(self, request: web.Request) -> web.Response:
+        if not await self._respond("forecast"):
+            return web.Response(status=503)
+        start = int(time.time()) // 10800 * 10800
+        steps = [
+            {
+                "dt": start + i * 10800,
+                "main": {"temp": i % 8, "temp_min": i % 8 - 1, "temp_max": i % 8 + 1},
+                "weather": [{"description": "облачно"}],
+                "pop": 0.2,
+            }
+            for i in range(40)
+        ]
+        return web.json_response({"city": {"timezone": 10800}, "list": steps})
+
+
+class FakeTelegram:
+    """Заглушка Telegram Bot API: принимает любые методы и считает их"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls: Dict[str, int] = {}
+        self._message_id = 0
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.method)
+        app.router.add_get("/_stats", self.stats)
+        return app
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"calls": self.calls})
+
+    async def method(self, request: web.Request) -> web.Response:
+        name = request.match_info["method"]
+        self.calls[name] = self.calls.get(name, 0) + 1
+        data = await request.post()
+        await asyncio.sleep(self.latency)
+        self._message_id += 1
+        chat_id = int(data.get("chat_id", 0) or 0)
+        return web.json_response(
+            {
+                "ok": True,
+                "result": {
+                    "message_id": self._message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "text": data.get("text", ""),
+                },
+            }
+        )
+
+
+async def start_server(app: web.Application) -> Tuple[web.AppRunner, str]:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+def serve_fakes(args: argparse.Namespace, urls: "multiprocessing.Queue"):
+    """Заглушки в отдельном процессе, чтобы не отнимать CPU у бота"""
+
+    async def serve():
+        fake_owm = FakeOpenWeatherMap(
+            args.owm_latency, args.owm_jitter, args.owm_error_rate, args.seed
+        )
+        fake_telegram = FakeTelegram(args.tg_latency)
+        _, weather_url = await start_server(fake_owm.create_app())
+        _, telegram_url = await start_server(fake_telegram.create_app())
+        urls.put((weather_url, telegram_url))
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+async def fetch_stats(url: str) -> dict:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{url}/_stats") as response:
+            return await response.json()
+
+
+def zipf_weights(count: int, exponent: float) -> List[float]:
+    return [1 / rank**exponent for rank in range(1, count + 1)]
+
+
+def generate_updates(args, cities: List[str]) -> List[dict]:
+    """Детерминированный поток обновлений: города по Ципфу, много чатов"""
+    rng = random.Random(args.seed)
+    weights = zipf_weights(len(cities), args.zipf)
+    kinds, kind_weights = zip(*UPDATE_MIX)
+
+    def city() -> str:
+        return rng.choices(cities, weights)[0]
+
+    updates = []
+    for update_id in range(1, args.updates + 1):
+        chat_id = 10_000 + rng.randrange(args.chats)
+        kind = rng.choices(kinds, kind_weights)[0]
+        if kind == "text":
+            text = city()
+        elif kind == "weather":
+            text = f"/weather {city()}"
+        elif kind == "compare":
+            text = "/compare " + ", ".join(city() for _ in range(3))
+        elif kind == "forecast":
+            text = f"/forecast {city()} {rng.randint(1, 5)}"
+        else:
+            text = "/start"
+
+        message = {
+            "message_id": update_id,
+            "date": 1_700_000_000 + update_id,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "bench"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [
+                {"type": "bot_command", "offset": 0, "length": len(command)}
+            ]
+        updates.append({"update_id": update_id, "message": message})
+    return updates
+
+
+def percentile(values: List[float], q: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def configure_environment(args, weather_url: str, telegram_url: str, workdir: str):
+    """Переменные окружения для config.py; заданные явно не перезаписываются"""
+    defaults = {
+        "TG_KEY": "123456:benchmark",
+        "API_KEY": "benchmark",
+        "BOT_MODE": "polling",
+        "WEATHER_API_URL": f"{weather_url}/data/2.5/weather",
+        "TELEGRAM_API_URL": telegram_url,
+        "USER_DB_PATH": os.path.join(workdir, "bench.db"),
+        "ARCHIVE_DIR": os.path.join(workdir, "archive"),
+        "PREFETCH_ENABLED": "false",
+        # Лимиты не должны ограничивать измерение самого бота
+        "WEATHER_CALLS_PER_MINUTE": "1000000",
+        "WEATHER_CALLS_PER_DAY": "100000000",
+        "WEATHER_CALLS_BURST": "100000",
+        "SEND_GLOBAL_RATE": "1000000",
+        "SEND_PER_CHAT_INTERVAL": "0",
+        "THROTTLE_RATE": "1000000",
+    }
+    if args.realistic_limits:
+        for name in (
+            "WEATHER_CALLS_PER_MINUTE",
+            "WEATHER_CALLS_PER_DAY",
+            "WEATHER_CALLS_BURST",
+            "SEND_GLOBAL_RATE",
+            "SEND_PER_CHAT_INTERVAL",
+            "THROTTLE_RATE",
+        ):
+            del defaults[name]
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+
+
+async def run(args) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    urls = ctx.Queue()
+    fakes = ctx.Process(target=serve_fakes, args=(args, urls), daemon=True)
+    fakes.start()
+    loop = asyncio.get_running_loop()
+    weather_url, telegram_url = await loop.run_in_executor(None, urls.get)
+    workdir = tempfile.mkdtemp(prefix="weather-bench-")
+    configure_environment(args, weather_url, telegram_url, workdir)
+
+    # Модули бота читают config при импорте, поэтому импортируем после настройки
+    from aiogram import Dispatcher
+    from aiogram.types import Update
+    from main import create_bot, setup_handlers, start_services, stop_services
+    from services.cities import city_index
+    from services.weather_service import weather_service
+
+    cities = city_index.names[: args.cities]
+    updates = generate_updates(args, cities)
+
+    bot = create_bot()
+    dp = Dispatcher()
+    setup_handlers(dp)
+    await start_services(bot, background=False)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def handle(raw: dict):
+        nonlocal errors
+        update = Update.model_validate(raw, context={"bot": bot})
+        started = time.perf_counter()
+        try:
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            errors += 1
+            logger.debug(f"Ошибка обработки {raw['update_id']}: {e!r}")
+        finally:
+            latencies.append(time.perf_counter() - started)
+            semaphore.release()
+
+    tasks = []
+    started = time.perf_counter()
+    for position, raw in enumerate(updates):
+        if args.burst_size and position and position % args.burst_size == 0:
+            await asyncio.sleep(args.burst_interval)
+        await semaphore.acquire()
+        tasks.append(asyncio.create_task(handle(raw)))
+    await asyncio.gather(*tasks)
+    duration = time.perf_counter() - started
+
+    heap_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    tracemalloc.stop()
+    service_stats = weather_service.stats()
+
+    await stop_services()
+    await bot.session.close()
+    owm_stats = await fetch_stats(weather_url)
+    telegram_stats = await fetch_stats(telegram_url)
+    fakes.terminate()
+
+    # ru_maxrss в Linux - килобайты
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "params": vars(args),
+        "results": {
+            "updates": len(updates),
+            "errors": errors,
+            "duration_s": round(duration, 3),
+            "updates_per_s": round(len(updates) / duration, 1),
+            "latency_ms": {
+                "mean": round(statistics.fmean(latencies) * 1000, 3),
+                "p50": round(percentile(latencies, 50) * 1000, 3),
+                "p95": round(percentile(latencies, 95) * 1000, 3),
+                "p99": round(percentile(latencies, 99) * 1000, 3),
+                "max": round(max(latencies) * 1000, 3),
+            },
+            "upstream_calls": dict(sorted(owm_stats["calls"].items())),
+            "upstream_errors": owm_stats["errors"],
+            "telegram_calls": dict(sorted(telegram_stats["calls"].items())),
+            "weather_cache": service_stats["cache"],
+            "memory": {
+                "max_rss_mb": round(rss_mb, 1),
+                "heap_peak_mb": (
+                    round(heap_peak / 2**20, 2) if heap_peak is not None else None
+                ),
+            },
+        },
+    }
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--chats", type=int, default=1000)
+    parser.add_argument("--cities", type=int, default=50, help="сколько городов")
+    parser.add_argument("--zipf", type=float, default=1.1, help="показатель Ципфа")
+    parser.add_argument(
+        "--concurrency", type=int, default=200, help="обновлений в обработке"
+    )
+    parser.add_argument("--burst-size", type=int, default=0, help="0 - без пауз")
+    parser.add_argument("--burst-interval", type=float, default=0.5)
+    parser.add_argument("--owm-latency", type=float, default=0.05)
+    parser.add_argument("--owm-jitter", type=float, default=0.02)
+    parser.add_argument("--owm-error-rate", type=float, default=0.0)
+    parser.add_argument("--tg-latency", type=float, default=0.005)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--realistic-limits",
+        action="store_true",
+        help="не снимать лимиты OpenWeatherMap и Telegram из config.py",
+    )
+    parser.add_argument(
+        "--tracemalloc", action="store_true", help="мерить пик памяти Python"
+    )
+    parser.add_argument("--output", default="benchmark.json")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.run(run(args))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    results = report["results"]
+    latency = results["latency_ms"]
+    print(
+        f"{results['updates']} обновлений за {results['duration_s']} с "
+        f"({results['updates_per_s']}/с), ошибок: {results['errors']}\n"
+        f"Задержка, мс: p50 {latency['p50']}, p95 {latency['p95']}, "
+        f"p99 {latency['p99']}, max {latency['max']}\n"
+        f"Вызовы OpenWeatherMap: {results['upstream_calls']}\n"
+        f"Вызовы Telegram: {results['telegram_calls']}\n"
+        f"Память: {results['memory']}\n"
+        f"Результаты записаны в {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
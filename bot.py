@@ -1,16 +1,23 @@
 import asyncio
-from datetime import datetime
 import logging
 import os
+from typing import Optional
 
 from aiogram import Bot, Dispatcher, F, types
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.filters import Command
 from aiogram.types import KeyboardButton, ReplyKeyboardMarkup
+import aiohttp
 from dotenv import load_dotenv
-from flask import Flask
-import requests
+from services.exceptions import (
+    CityNotFoundError,
+    UpstreamError,
+    UpstreamUnavailableError,
+    WeatherError,
+)
+from services.user_store import user_store
+from services.weather_model import WeatherReading
 
 
 # Настройка логирования
@@ -24,63 +31,54 @@ load_dotenv()
 TG_KEY = os.getenv("TG_KEY")
 API_KEY = os.getenv("API_KEY")
 PORT = int(os.getenv("PORT", 443))
+WEATHER_REQUEST_TIMEOUT = float(os.getenv("WEATHER_REQUEST_TIMEOUT", 10))
 
 if not TG_KEY:
     raise ValueError("Не найден TG_KEY в переменных окружения")
 if not API_KEY:
     raise ValueError("Не найден API_KEY в переменных окружения")
 
-# Инициализация бота и диспетчера
-bot = Bot(token=TG_KEY, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+# Диспетчер нужен при импорте для декораторов, а бот создается при запуске
 dp = Dispatcher()
 
-# Инициализация Flask приложения
-app = Flask(__name__)
+# Общая HTTP-сессия, создается при запуске бота
+http_session: Optional[aiohttp.ClientSession] = None
 
-# Город по умолчанию
-DEFAULT_CITY = "Saint Petersburg"
 
-
-def get_weather(city: str) -> str:
-    """Получает данные о погоде для указанного города"""
+async def fetch_weather(city: str) -> str:
+    """Погода для города; при ошибке бросает WeatherError с текстом для пользователя"""
+    params = {
+        "q": city,
+        "appid": API_KEY,
+        "units": "metric",
+        "lang": "ru",
+    }
     try:
-        params = {
-            "q": city,
-            "appid": API_KEY,
-            "units": "metric",
-            "lang": "ru",
-        }
-
-        response = requests.get(
+        async with http_session.get(
             "https://api.openweathermap.org/data/2.5/weather", params=params
+        ) as response:
+            if response.status == 404:
+                raise CityNotFoundError(city)
+            response.raise_for_status()
+            reading = WeatherReading.from_json(await response.read())
+    except aiohttp.ClientResponseError as e:
+        raise UpstreamError(f"❌ Ошибка при получении данных: {e.status} {e.message}")
+    except asyncio.TimeoutError:
+        raise UpstreamUnavailableError(
+            "❌ Сервис погоды не ответил вовремя. Попробуйте позже."
         )
-        response.raise_for_status()
-        data = response.json()
+    return reading.render(city)
 
-        weather_info = f"🌤 <b>Погода в {city}</b>\n\n"
-        weather_info += (
-            f"• <b>Состояние:</b> {data['weather'][0]['description'].capitalize()}\n"
-        )
-        weather_info += f"• <b>Температура:</b> {data['main']['temp']} °C\n"
-        weather_info += f"• <b>Ощущается как:</b> {data['main']['feels_like']} °C\n"
-        weather_info += f"• <b>Влажность:</b> {data['main']['humidity']}%\n"
-        weather_info += f"• <b>Давление:</b> {data['main']['pressure']} гПа\n"
-        weather_info += f"• <b>Скорость ветра:</b> {data['wind']['speed']} м/с\n"
-
-        # Время заката
-        sunset_timestamp = data["sys"]["sunset"]
-        sunset_time = datetime.fromtimestamp(sunset_timestamp).strftime("%H:%M:%S")
-        weather_info += f"• <b>Закат:</b> {sunset_time}\n"
-
-        return weather_info
-
-    except requests.exceptions.HTTPError as e:
-        if response.status_code == 404:
-            return f"❌ Город '{city}' не найден. Проверьте правильность написания."
-        else:
-            return f"❌ Ошибка при получении данных: {e}"
-    except Exception as e:
-        return f"❌ Ошибка: {e}"
+
+async def get_weather(city: str) -> str:
+    """Получает данные о погоде для указанного города"""
+    try:
+        return await fetch_weather(city)
+    except WeatherError as e:
+        return str(e)
+    except Exception:
+        logger.exception(f"Не удалось получить погоду для {city!r}")
+        return str(UpstreamUnavailableError())
 
 
 # Создаем клавиатуру
@@ -111,7 +109,8 @@ async def cmd_start(message: types.Message):
         "• Сменить город - установить другой город"
     )
     await message.answer(welcome_text, reply_markup=get_main_keyboard())
-    weather_info = get_weather(DEFAULT_CITY)
+    city = await user_store.get_city(message.from_user.id)
+    weather_info = await get_weather(city)
     await message.answer(weather_info)
 
 
@@ -141,7 +140,7 @@ async def cmd_weather(message: types.Message):
         return
     city = " ".join(command_parts[1:])
     await message.answer(f"🔍 Запрашиваю погоду для {city}...")
-    weather_info = get_weather(city)
+    weather_info = await get_weather(city)
     await message.answer(weather_info)
 
 
@@ -154,21 +153,21 @@ async def cmd_city(message: types.Message):
         )
         return
     city = " ".join(command_parts[1:])
-    weather_info = get_weather(city)
-    if weather_info.startswith("❌"):
-        await message.answer(weather_info)
-    else:
-        global DEFAULT_CITY
-        DEFAULT_CITY = city
-        await message.answer(
-            f"✅ Город по умолчанию изменен на: <b>{city}</b>\n\n{weather_info}"
-        )
+    try:
+        weather_info = await fetch_weather(city)
+    except WeatherError as e:
+        await message.answer(str(e))
+        return
+    user_store.set_city(message.from_user.id, city)
+    await message.answer(
+        f"✅ Город по умолчанию изменен на: <b>{city}</b>\n\n{weather_info}"
+    )
 
 
 @dp.message(F.text == "🌤 Погода в СПб")
 async def weather_spb(message: types.Message):
     await message.answer("🔍 Запрашиваю погоду в Санкт-Петербурге...")
-    weather_info = get_weather("Saint Petersburg")
+    weather_info = await get_weather("Saint Petersburg")
     await message.answer(weather_info)
 
 
@@ -193,33 +192,48 @@ async def handle_city_input(message: types.Message):
         "🏙 Сменить город",
     ] and not text.startswith("/"):
         await message.answer(f"🔍 Запрашиваю погоду для {text}...")
-        weather_info = get_weather(text)
+        weather_info = await get_weather(text)
         await message.answer(weather_info)
 
 
-# Flask маршруты
-@app.route("/")
-def home():
-    return {"status": "Bot is running", "service": "Weather Telegram Bot"}
+def create_flask_app():
+    """Flask приложение со служебными маршрутами; Flask импортируется здесь"""
+    from flask import Flask
 
+    app = Flask(__name__)
 
-@app.route("/health")
-def health():
-    return {"status": "healthy"}
+    @app.route("/")
+    def home():
+        return {"status": "Bot is running", "service": "Weather Telegram Bot"}
 
+    @app.route("/health")
+    def health():
+        return {"status": "healthy"}
 
-@app.route("/ping")
-def ping():
-    return "pong"
+    @app.route("/ping")
+    def ping():
+        return "pong"
+
+    return app
 
 
 async def start_bot():
     """Запуск Telegram бота"""
+    global http_session
     logger.info("Запуск Telegram бота...")
+    http_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=100, keepalive_timeout=30),
+        timeout=aiohttp.ClientTimeout(total=WEATHER_REQUEST_TIMEOUT),
+    )
+    bot = Bot(token=TG_KEY, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    await user_store.start()
     try:
         await dp.start_polling(bot, skip_updates=True)
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {e}")
+    finally:
+        await user_store.close()
+        await http_session.close()
 
 
 def run_bot():
@@ -230,19 +244,12 @@ def run_bot():
 if __name__ == "__main__":
     # ЗАПУСКАЕМ БОТА В ОСНОВНОМ ПОТОКЕ, а Flask в отдельном
     from threading import Thread
-    import time
 
-    # Даем время на запуск
-    time.sleep(2)
+    from werkzeug.serving import make_server
 
-    # Запускаем Flask в отдельном потоке как демона
-    flask_thread = Thread(
-        target=lambda: app.run(
-            host="0.0.0.0", port=PORT, debug=False, use_reloader=False
-        )
-    )
-    flask_thread.daemon = True
-    flask_thread.start()
+    # Сокет открывается сразу, поэтому ждать запуска потока не нужно
+    server = make_server("0.0.0.0", PORT, create_flask_app(), threaded=True)
+    Thread(target=server.serve_forever, daemon=True).start()
 
     logger.info(f"Flask запущен на порту {PORT} в фоновом режиме")
     logger.info("Запускаем Telegram бота в основном потоке...")
@@ -0,0 +1,325 @@
+from array import array
+from bisect import bisect_left
+import csv
+import math
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+CITIES_DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cities.csv")
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Размер ячейки сетки пространственного индекса, градусы
+GRID_CELL = 1.0
+EARTH_RADIUS_KM = 6371.0
+
+# Все, что не буква, пробел, дефис, точка или апостроф, в названии города не бывает
+_NOT_CITY_CHARS = re.compile(r"[^\w\s\-.'’]|[\d_]")
+# Код страны (и штата) через запятую в конце: "London, GB", "Portland,OR,US"
+_COUNTRY_SUFFIX = re.compile(r"(?:\s*,\s*[A-Za-z]{2,3})?\s*,\s*([A-Za-z]{2})\s*$")
+
+
+def normalize_city(city: str) -> str:
+    """Приводит название города к ключу кэша"""
+    key = city.lower().replace("ё", "е")
+    for char in "-.,'’":
+        key = key.replace(char, " ")
+    return " ".join(key.split())
+
+
+def split_country(text: str) -> Tuple[str, Optional[str]]:
+    """Отделяет код страны, как в запросе API: "London, GB" -> ("London", "GB")"""
+    match = _COUNTRY_SUFFIX.search(text)
+    if match is None:
+        return text.strip(), None
+    return text[: match.start()].strip(), match.group(1).upper()
+
+
+def looks_like_city(text: str) -> bool:
+    """Грубая проверка, что текст вообще может быть названием города"""
+    text, _ = split_country(text.strip())
+    if not 2 <= len(text) <= 60 or len(text.split()) > 5:
+        return False
+    return _NOT_CITY_CHARS.search(text) is None
+
+
+def within_edits(a: str, b: str, max_edits: int) -> bool:
+    """Отличаются ли строки не больше чем на max_edits правок
+
+    Правка - вставка, удаление, замена символа или перестановка соседних.
+    """
+    if abs(len(a) - len(b)) > max_edits:
+        return False
+    before: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (a[i - 1] != b[j - 1]),
+            )
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > max_edits:
+            return False
+        before, previous = previous, current
+    return previous[-1] <= max_edits
+
+
+def geohash(lat: float, lon: float, precision: int) -> str:
+    """Geohash точки: соседние точки получают одинаковый префикс"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        # Четные биты делят долготу, нечетные - широту
+        bounds, point = (lon_range, lon) if even else (lat_range, lat)
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if point >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def geohash_center(code: str) -> Tuple[float, float]:
+    """Центр ячейки geohash: (широта, долгота)"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in code:
+        value = _GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            bounds = lon_range if even else lat_range
+            middle = (bounds[0] + bounds[1]) / 2
+            if value >> shift & 1:
+                bounds[0] = middle
+            else:
+                bounds[1] = middle
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по поверхности Земли (формула гаверсинусов)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(d_phi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _grid_cell(lat: float, lon: float) -> Tuple[int, int]:
+    return math.floor(lat / GRID_CELL), math.floor(lon / GRID_CELL)
+
+
+def _trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class City(NamedTuple):
+    index: int
+    id: int  # id OpenWeatherMap (GeoNames) или 0, если неизвестен
+    name: str
+    name_en: str
+    country: str
+    lat: float
+    lon: float
+
+
+class CityIndex:
+    """Локальный индекс городов: точный поиск, префиксы и нечеткие совпадения"""
+
+    def __init__(self):
+        # Данные городов хранятся в компактных параллельных массивах
+        self.ids = array("l")
+        self.lats = array("d")
+        self.lons = array("d")
+        self.names: List[str] = []
+        self.names_en: List[str] = []
+        self.countries: List[str] = []
+
+        # Нормализованные названия и синонимы -> номер города
+        self._exact: Dict[str, int] = {}
+        # Отсортированные ключи для префиксного поиска
+        self._keys: List[str] = []
+        self._key_city = array("H")
+        # Триграммный индекс по ключам для нечеткого поиска
+        self._trigrams: Dict[str, array] = {}
+        self._key_trigram_count = array("B")
+        # Сетка по координатам для поиска ближайшего города
+        self._grid: Dict[Tuple[int, int], array] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def load(cls, path: str = CITIES_DATASET) -> "CityIndex":
+        """Загружает индекс из CSV-файла, поставляемого с ботом"""
+        index = cls()
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                aliases = [a for a in row["aliases"].split("|") if a]
+                index.add(
+                    city_id=int(row["id"] or 0),
+                    name=row["name_ru"],
+                    name_en=row["name_en"],
+                    country=row["country"],
+                    lat=float(row["lat"]),
+                    lon=float(row["lon"]),
+                    aliases=aliases,
+                )
+        index.build()
+        return index
+
+    def add(
+        self,
+        city_id: int,
+        name: str,
+        name_en: str,
+        country: str,
+        lat: float,
+        lon: float,
+        aliases: List[str] = (),
+    ):
+        position = len(self.names)
+        self.ids.append(city_id)
+        self.lats.append(lat)
+        self.lons.append(lon)
+        self.names.append(name)
+        self.names_en.append(name_en)
+        self.countries.append(country)
+        for variant in (name, name_en, *aliases):
+            self._exact.setdefault(normalize_city(variant), position)
+
+    def build(self):
+        """Строит префиксный и триграммный индексы после загрузки городов"""
+        self._keys = sorted(self._exact)
+        self._key_city = array("H", (self._exact[key] for key in self._keys))
+        postings: Dict[str, List[int]] = {}
+        self._key_trigram_count = array("B")
+        for position, key in enumerate(self._keys):
+            grams = _trigrams(key)
+            self._key_trigram_count.append(min(len(grams), 255))
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+        self._trigrams = {gram: array("H", items) for gram, items in postings.items()}
+
+        cells: Dict[Tuple[int, int], List[int]] = {}
+        for position in range(len(self.names)):
+            cell = _grid_cell(self.lats[position], self.lons[position])
+            cells.setdefault(cell, []).append(position)
+        self._grid = {cell: array("H", items) for cell, items in cells.items()}
+
+    def city(self, position: int) -> City:
+        return City(
+            index=position,
+            id=self.ids[position],
+            name=self.names[position],
+            name_en=self.names_en[position],
+            country=self.countries[position],
+            lat=self.lats[position],
+            lon=self.lons[position],
+        )
+
+    def resolve(self, text: str) -> Optional[City]:
+        """Точное совпадение по названию или синониму"""
+        position = self._exact.get(normalize_city(text))
+        return None if position is None else self.city(position)
+
+    def search_prefix(self, prefix: str, limit: int = 10) -> List[City]:
+        """Города, одно из названий которых начинается с prefix"""
+        prefix = normalize_city(prefix)
+        result: List[City] = []
+        seen = set()
+        start = bisect_left(self._keys, prefix)
+        for position in range(start, len(self._keys)):
+            if not self._keys[position].startswith(prefix) or len(result) >= limit:
+                break
+            city_position = self._key_city[position]
+            if city_position not in seen:
+                seen.add(city_position)
+                result.append(self.city(city_position))
+        return result
+
+    def nearest(
+        self, lat: float, lon: float, max_km: float
+    ) -> Optional[Tuple[City, float]]:
+        """Ближайший город не дальше max_km: (город, расстояние в км)"""
+        row, column = _grid_cell(lat, lon)
+        lat_cells = math.ceil(max_km / (111.0 * GRID_CELL))
+        # Градус долготы короче у полюсов, поэтому по долготе ячеек больше
+        cos_lat = max(math.cos(math.radians(lat)), 0.01)
+        lon_cells = min(math.ceil(max_km / (111.0 * GRID_CELL * cos_lat)), 180)
+
+        best: Optional[int] = None
+        best_km = max_km
+        for d_row in range(-lat_cells, lat_cells + 1):
+            for d_column in range(-lon_cells, lon_cells + 1):
+                cell_column = (column + d_column + 180) % 360 - 180
+                for position in self._grid.get((row + d_row, cell_column), ()):
+                    km = distance_km(
+                        lat, lon, self.lats[position], self.lons[position]
+                    )
+                    if km <= best_km:
+                        best, best_km = position, km
+        if best is None:
+            return None
+        return self.city(best), best_km
+
+    def suggest(self, text: str, limit: int = 3, min_score: float = 0.45) -> List[City]:
+        """Похожие города по коэффициенту Дайса на триграммах"""
+        best: Dict[int, float] = {}
+        for position, score in self._similar_keys(normalize_city(text)).items():
+            if score >= min_score:
+                city_position = self._key_city[position]
+                best[city_position] = max(best.get(city_position, 0.0), score)
+
+        ranked = sorted(best, key=best.get, reverse=True)[:limit]
+        return [self.city(position) for position in ranked]
+
+    def near_match(self, text: str, max_edits: int = 1) -> Optional[City]:
+        """Город, название которого отличается от текста на опечатку
+
+        Просто похожие названия (Красногорск и Красноярск) не совпадают.
+        """
+        key = normalize_city(text)
+        similar = self._similar_keys(key)
+        for position in sorted(similar, key=similar.get, reverse=True):
+            if within_edits(key, self._keys[position], max_edits):
+                return self.city(self._key_city[position])
+        return None
+
+    def _similar_keys(self, key: str) -> Dict[int, float]:
+        """Коэффициент Дайса на триграммах для ключей с общими триграммами"""
+        grams = _trigrams(key)
+        common: Dict[int, int] = {}
+        for gram in grams:
+            for position in self._trigrams.get(gram, ()):
+                common[position] = common.get(position, 0) + 1
+        return {
+            position: 2 * count / (len(grams) + self._key_trigram_count[position])
+            for position, count in common.items()
+        }
+
+
+# Индекс загружается один раз при импорте
+city_index = CityIndex.load()
@@ -19,4 +19,147 @@ if not API_KEY:
 
 # Константы
 DEFAULT_CITY = "Saint Petersburg"
-WEATHER_API_URL = "https://api.openweathermap.org/data/2.5/weather"
+WEATHER_API_URL = os.getenv(
+    "WEATHER_API_URL", "https://api.openweathermap.org/data/2.5/weather"
+)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+
+# Режим получения обновлений: "polling" (long-poll + Flask) или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Flask со служебными маршрутами при long polling; в webhook их отдает aiohttp
+HEALTH_SERVER_ENABLED = os.getenv("HEALTH_SERVER_ENABLED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError(f"Неизвестный BOT_MODE: {BOT_MODE}")
+if BOT_MODE == "webhook" and not WEBHOOK_BASE_URL:
+    raise ValueError("Для режима webhook нужен WEBHOOK_BASE_URL")
+
+# HTTP-клиент OpenWeatherMap
+WEATHER_REQUEST_TIMEOUT = float(os.getenv("WEATHER_REQUEST_TIMEOUT", 10))
+WEATHER_CONNECT_TIMEOUT = float(os.getenv("WEATHER_CONNECT_TIMEOUT", 3))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 100))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 30))
+
+# Кэш ответов OpenWeatherMap
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", 1024))
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", 600))
+WEATHER_CACHE_STALE_TTL = float(os.getenv("WEATHER_CACHE_STALE_TTL", 300))
+WEATHER_NOT_FOUND_TTL = float(os.getenv("WEATHER_NOT_FOUND_TTL", 3600))
+
+# Настройки пользователей (город по умолчанию)
+USER_DB_PATH = os.getenv("USER_DB_PATH", "weather_bot.db")
+USER_PREFS_CACHE_SIZE = int(os.getenv("USER_PREFS_CACHE_SIZE", 10000))
+USER_PREFS_FLUSH_INTERVAL = float(os.getenv("USER_PREFS_FLUSH_INTERVAL", 2))
+USER_PREFS_BATCH_SIZE = int(os.getenv("USER_PREFS_BATCH_SIZE", 500))
+# Как часто в многопроцессном режиме сверять кэш с изменениями других процессов
+USER_PREFS_REVALIDATE_INTERVAL = float(
+    os.getenv("USER_PREFS_REVALIDATE_INTERVAL", 1)
+)
+
+# Бюджет запросов к OpenWeatherMap
+WEATHER_CALLS_PER_MINUTE = int(os.getenv("WEATHER_CALLS_PER_MINUTE", 60))
+WEATHER_CALLS_PER_DAY = int(os.getenv("WEATHER_CALLS_PER_DAY", 30000))
+WEATHER_CALLS_BURST = int(os.getenv("WEATHER_CALLS_BURST", 10))
+# Сколько секунд запрос может ждать свободного токена, прежде чем получить отказ
+WEATHER_QUEUE_DEADLINE = float(os.getenv("WEATHER_QUEUE_DEADLINE", 3))
+# Сколько токенов фоновые запросы (прогрев, рассылки) оставляют пользователям
+WEATHER_USER_RESERVE = float(os.getenv("WEATHER_USER_RESERVE", 3))
+
+# Повторы и автоматический выключатель (circuit breaker) для OpenWeatherMap
+WEATHER_RETRY_ATTEMPTS = int(os.getenv("WEATHER_RETRY_ATTEMPTS", 3))
+WEATHER_RETRY_BASE_DELAY = float(os.getenv("WEATHER_RETRY_BASE_DELAY", 0.2))
+WEATHER_RETRY_MAX_DELAY = float(os.getenv("WEATHER_RETRY_MAX_DELAY", 2))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 30))
+
+# Фоновый прогрев популярных городов
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() in ("1", "true", "yes")
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", 20))
+PREFETCH_INTERVAL = float(os.getenv("PREFETCH_INTERVAL", 30))
+# За сколько секунд до истечения TTL обновлять запись
+PREFETCH_REFRESH_AHEAD = float(os.getenv("PREFETCH_REFRESH_AHEAD", 90))
+# Доля бюджета запросов к API, которую может тратить прогрев
+PREFETCH_BUDGET_SHARE = float(os.getenv("PREFETCH_BUDGET_SHARE", 0.2))
+# Период полураспада счетчиков популярности, секунды
+PREFETCH_HALF_LIFE = float(os.getenv("PREFETCH_HALF_LIFE", 1800))
+
+# Очередь исходящих сообщений (лимиты Telegram: ~30 сообщений/с, 1/с на чат)
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", 25))
+SEND_PER_CHAT_INTERVAL = float(os.getenv("SEND_PER_CHAT_INTERVAL", 1))
+# Сколько сообщений подряд можно отправить в чат без интервала
+SEND_PER_CHAT_BURST = int(os.getenv("SEND_PER_CHAT_BURST", 3))
+# Если ответ готов быстрее, сообщение "Запрашиваю погоду..." не отправляется
+SEND_PLACEHOLDER_DELAY = float(os.getenv("SEND_PLACEHOLDER_DELAY", 0.3))
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", 8))
+SEND_QUEUE_SIZE = int(os.getenv("SEND_QUEUE_SIZE", 100000))
+
+# Подписки на ежедневный прогноз
+SUBSCRIPTION_TIMEZONE = os.getenv("SUBSCRIPTION_TIMEZONE", "Europe/Moscow")
+SUBSCRIPTION_CONCURRENCY = int(os.getenv("SUBSCRIPTION_CONCURRENCY", 10))
+# Сколько секунд рассылка минуты дозагружает города фоном, прежде чем
+# отдать последние известные данные, и пауза между попытками
+SUBSCRIPTION_DELIVERY_WINDOW = float(os.getenv("SUBSCRIPTION_DELIVERY_WINDOW", 45))
+SUBSCRIPTION_RETRY_INTERVAL = float(os.getenv("SUBSCRIPTION_RETRY_INTERVAL", 5))
+
+# Многопроцессный режим: супервизор и WORKERS процессов-обработчиков
+WORKERS = int(os.getenv("WORKERS", 1))
+WORKER_DRAIN_TIMEOUT = float(os.getenv("WORKER_DRAIN_TIMEOUT", 30))
+# Как часто процессы передают супервизору свои метрики для /metrics, секунды
+WORKER_METRICS_INTERVAL = float(os.getenv("WORKER_METRICS_INTERVAL", 5))
+# Общий для процессов кэш погоды второго уровня
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "weather_cache.db")
+
+# Сравнение городов: /compare
+COMPARE_MAX_CITIES = int(os.getenv("COMPARE_MAX_CITIES", 10))
+# Сколько id OpenWeatherMap принимает в одном запросе /group
+WEATHER_GROUP_SIZE = 20
+
+# Inline-режим: @bot <город>
+INLINE_RESULTS_LIMIT = int(os.getenv("INLINE_RESULTS_LIMIT", 8))
+# Сколько Telegram кэширует ответ, если погода для всех городов есть
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", 120))
+# Пауза в наборе, после которой догружаем города без данных
+INLINE_DEBOUNCE = float(os.getenv("INLINE_DEBOUNCE", 0.4))
+
+# Прогноз погоды: /forecast
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", 500))
+FORECAST_CACHE_TTL = int(os.getenv("FORECAST_CACHE_TTL", 1800))
+FORECAST_DEFAULT_DAYS = 3
+# API отдает прогноз на 5 дней с шагом 3 часа
+FORECAST_MAX_DAYS = 5
+
+# Погода по геопозиции: точность geohash (5 - ячейка около 5x5 км)
+LOCATION_GEOHASH_PRECISION = int(os.getenv("LOCATION_GEOHASH_PRECISION", 5))
+# Радиус, в котором ищем ближайший известный город для заголовка
+LOCATION_NEAREST_KM = float(os.getenv("LOCATION_NEAREST_KM", 30))
+
+# Ограничение частоты сообщений одного пользователя: не больше
+# THROTTLE_RATE сообщений за скользящее окно THROTTLE_WINDOW секунд
+THROTTLE_RATE = int(os.getenv("THROTTLE_RATE", 5))
+THROTTLE_WINDOW = float(os.getenv("THROTTLE_WINDOW", 10))
+# Как часто удалять из памяти пользователей, молчащих дольше окна
+THROTTLE_EVICT_INTERVAL = 60
+
+# Архив наблюдений: по файлу фиксированных записей на город
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "true").lower() in ("1", "true", "yes")
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "weather_archive")
+# Насколько старое наблюдение из архива можно показать, если API недоступен
+ARCHIVE_FALLBACK_MAX_AGE = float(os.getenv("ARCHIVE_FALLBACK_MAX_AGE", 6 * 3600))
+HISTORY_DEFAULT_DAYS = 7
+HISTORY_MAX_DAYS = 365
+
+# Оповещения о погоде по порогам (/alert)
+ALERTS_PER_CHAT = int(os.getenv("ALERTS_PER_CHAT", 10))
+# Как часто обновлять города с правилами, если их никто не запрашивал
+ALERT_CHECK_INTERVAL = float(os.getenv("ALERT_CHECK_INTERVAL", 600))
+# В многопроцессном режиме: как часто забирать из общего кэша показания,
+# загруженные другими процессами, и перечитывать правила
+ALERT_SHARED_POLL_INTERVAL = float(os.getenv("ALERT_SHARED_POLL_INTERVAL", 15))
@@ -0,0 +1,48 @@
+from typing import Sequence
+
+
+class WeatherError(Exception):
+    """Базовая ошибка получения погоды; текст предназначен пользователю"""
+
+    default_message = "❌ Не удалось получить погоду. Попробуйте позже."
+
+    def __init__(self, message: str = ""):
+        super().__init__(message or self.default_message)
+
+
+class CityNotFoundError(WeatherError):
+    """Город не найден ни в локальном индексе, ни в OpenWeatherMap"""
+
+    def __init__(self, city: str, suggestions: Sequence[str] = ()):
+        self.city = city
+        self.suggestions = list(suggestions)
+        if self.suggestions:
+            message = (
+                f"❌ Город '{city}' не найден. "
+                f"Возможно, вы имели в виду: {', '.join(self.suggestions)}?"
+            )
+        else:
+            message = f"❌ Город '{city}' не найден. Проверьте правильность написания."
+        super().__init__(message)
+
+
+class QuotaExceededError(WeatherError):
+    """Бюджет запросов к API исчерпан"""
+
+    default_message = (
+        "⏳ Сейчас слишком много запросов к сервису погоды. Попробуйте через минуту."
+    )
+
+
+class UpstreamError(WeatherError):
+    """OpenWeatherMap вернул ошибку, которую бессмысленно повторять"""
+
+
+class UpstreamUnavailableError(UpstreamError):
+    """Временная недоступность: таймаут, обрыв соединения или ответ 5xx"""
+
+    default_message = "❌ Сервис погоды временно недоступен. Попробуйте позже."
+
+
+class CircuitOpenError(UpstreamUnavailableError):
+    """Выключатель разомкнут: запросы к API временно не отправляются"""
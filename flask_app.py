@@ -1,5 +1,9 @@
+from threading import Thread
+
 from config import PORT
-from flask import Flask
+from flask import Flask, Response
+from web.health import health_payload, metrics_text
+from werkzeug.serving import make_server
 
 
 def create_flask_app():
@@ -12,12 +16,16 @@ def create_flask_app():
 
     @app.route("/health")
     def health():
-        return {"status": "healthy"}
+        return health_payload()
 
     @app.route("/ping")
     def ping():
         return "pong"
 
+    @app.route("/metrics")
+    def metrics():
+        return Response(metrics_text(), mimetype="text/plain; version=0.0.4")
+
     return app
 
 
@@ -26,5 +34,17 @@ def run_flask(app: Flask, port: int = PORT):
     app.run(host="0.0.0.0", port=port, debug=False, use_reloader=False)
 
 
+def start_flask_thread(app: Flask, port: int = PORT) -> Thread:
+    """Запускает Flask в фоновом потоке, когда порт уже занят сервером
+
+    Сокет открывается до возврата, поэтому ошибка порта видна сразу,
+    а маршруты отвечают без паузы на запуск потока.
+    """
+    server = make_server("0.0.0.0", port, app, threaded=True)
+    thread = Thread(target=server.serve_forever, name="flask", daemon=True)
+    thread.start()
+    return thread
+
+
 # Создаем экземпляр приложения
 flask_app = create_flask_app()
@@ -0,0 +1,226 @@
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+WEEKDAYS = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+
+# Прошедшие шаги прогноза храним сутки: они нужны для итогов текущего дня
+KEEP_PAST = 24 * 3600
+
+# Описания погоды повторяются, поэтому в рядах хранится только их номер
+_descriptions: List[str] = []
+_description_codes: Dict[str, int] = {}
+
+
+def _description_code(description: str) -> int:
+    code = _description_codes.get(description)
+    if code is None:
+        code = _description_codes[description] = len(_descriptions)
+        _descriptions.append(description)
+    return code
+
+
+class DailySummary(NamedTuple):
+    day: date
+    temp_min: float
+    temp_max: float
+    precip: float  # сумма осадков, мм
+    pop: float  # максимальная вероятность осадков, 0..1
+    description: str
+
+
+class ParsedForecast(NamedTuple):
+    tz_offset: Optional[int]
+    steps: List[Tuple[int, float, float, float, float, float, int]]
+
+
+class HourlyStep(NamedTuple):
+    moment: datetime
+    temp: float
+    precip: float
+    description: str
+
+
+class ForecastSeries:
+    """Прогноз для одного города в параллельных массивах
+
+    Обновляется инкрементально: шаги из нового ответа заменяют шаги с тем
+    же и более поздним временем, прошедшие шаги остаются. Итоги по дням
+    и ближайшим часам пересчитываются один раз после обновления.
+    """
+
+    def __init__(self):
+        self.tz_offset = 0
+        self.times = array("q")
+        self.temps = array("d")
+        self.temp_min = array("d")
+        self.temp_max = array("d")
+        self.precip = array("d")
+        self.pop = array("d")
+        self.conditions = array("H")
+        self.updated_at = 0.0
+
+        self._daily: List[DailySummary] = []
+        # (город, дней, текущий шаг или сегодняшняя дата) -> текст
+        self._rendered: Dict[Tuple[str, int, int], str] = {}
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @staticmethod
+    def parse(data: dict) -> "ParsedForecast":
+        """Разбирает ответ /forecast целиком до изменения рядов"""
+        steps = []
+        for step in data.get("list") or ():
+            main = step["main"]
+            precip = step.get("rain", {}).get("3h", 0.0)
+            precip += step.get("snow", {}).get("3h", 0.0)
+            steps.append(
+                (
+                    int(step["dt"]),
+                    float(main["temp"]),
+                    float(main.get("temp_min", main["temp"])),
+                    float(main.get("temp_max", main["temp"])),
+                    float(precip),
+                    float(step.get("pop", 0.0)),
+                    _description_code(step["weather"][0]["description"].capitalize()),
+                )
+            )
+        timezone_offset = data.get("city", {}).get("timezone")
+        return ParsedForecast(
+            None if timezone_offset is None else int(timezone_offset), steps
+        )
+
+    def merge(self, parsed: "ParsedForecast") -> int:
+        """Вливает разобранный ответ /forecast; возвращает число новых шагов"""
+        steps = parsed.steps
+        if not steps:
+            return 0
+        if parsed.tz_offset is not None:
+            self.tz_offset = parsed.tz_offset
+
+        # Старые шаги до начала нового ответа остаются, остальные заменяются
+        cut = bisect_left(self.times, steps[0][0])
+        keep_from = bisect_left(self.times, int(time.time()) - KEEP_PAST, 0, cut)
+        columns = self._columns()
+        for column in columns:
+            del column[cut:]
+            del column[:keep_from]
+        for column, values in zip(columns, zip(*steps)):
+            column.extend(values)
+
+        self.updated_at = time.time()
+        self._aggregate()
+        return len(steps)
+
+    def _columns(self) -> Tuple[array, ...]:
+        return (
+            self.times,
+            self.temps,
+            self.temp_min,
+            self.temp_max,
+            self.precip,
+            self.pop,
+            self.conditions,
+        )
+
+    def _local(self, timestamp: int) -> datetime:
+        return datetime.fromtimestamp(
+            timestamp + self.tz_offset, tz=timezone.utc
+        ).replace(tzinfo=None)
+
+    def _aggregate(self):
+        """Итоги по дням и ближайшие шаги; считаются по срезам массивов"""
+        self._rendered = {}
+        self._daily = []
+        if not self.times:
+            return
+
+        first_day = self._local(self.times[0]).date()
+        last_day = self._local(self.times[-1]).date()
+        day = first_day
+        while day <= last_day:
+            # Границы суток в UTC с учетом часового пояса города
+            midnight = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+            start_ts = int(midnight.timestamp()) - self.tz_offset
+            start = bisect_left(self.times, start_ts)
+            end = bisect_left(self.times, start_ts + 24 * 3600)
+            if start < end:
+                code = Counter(self.conditions[start:end]).most_common(1)[0][0]
+                self._daily.append(
+                    DailySummary(
+                        day=day,
+                        temp_min=min(self.temp_min[start:end]),
+                        temp_max=max(self.temp_max[start:end]),
+                        precip=sum(self.precip[start:end]),
+                        pop=max(self.pop[start:end]),
+                        description=_descriptions[code],
+                    )
+                )
+            day += timedelta(days=1)
+
+    def _current_step(self) -> int:
+        """Индекс шага прогноза, который идет сейчас"""
+        return bisect_left(self.times, int(time.time()) - 3 * 3600)
+
+    def daily(self, days: int) -> List[DailySummary]:
+        """Итоги на days дней, начиная с сегодняшнего по времени города"""
+        today = self._local(int(time.time())).date()
+        upcoming = [summary for summary in self._daily if summary.day >= today]
+        return upcoming[:days]
+
+    def hourly(self) -> List[HourlyStep]:
+        """Ближайшие сутки с шагом прогноза (3 часа)"""
+        now = self._current_step()
+        return [
+            HourlyStep(
+                moment=self._local(self.times[i]),
+                temp=self.temps[i],
+                precip=self.precip[i],
+                description=_descriptions[self.conditions[i]],
+            )
+            for i in range(now, min(now + 8, len(self.times)))
+        ]
+
+    def render(self, city: str, days: int) -> str:
+        """Текст прогноза; запоминается до обновления, смены шага или суток"""
+        # Без обновления данных (например, отдаем последние известные) текст
+        # все равно меняется со временем: уходят прошедшие шаги и дни
+        if days == 1:
+            slot = self._current_step()
+        else:
+            slot = self._local(int(time.time())).date().toordinal()
+        key = (city, days, slot)
+        text = self._rendered.get(key)
+        if text is not None:
+            return text
+
+        lines = [f"📅 <b>Прогноз для {city}</b>\n"]
+        if days == 1:
+            for step in self.hourly():
+                line = (
+                    f"<b>{step.moment:%H:%M}</b> {step.temp:+.0f} °C, "
+                    f"{step.description}"
+                )
+                if step.precip:
+                    line += f", 💧 {step.precip:.1f} мм"
+                lines.append(line)
+        else:
+            for summary in self.daily(days):
+                line = (
+                    f"<b>{WEEKDAYS[summary.day.weekday()]} {summary.day:%d.%m}</b>: "
+                    f"{summary.temp_min:+.0f}…{summary.temp_max:+.0f} °C, "
+                    f"{summary.description}"
+                )
+                if summary.precip:
+                    line += f", 💧 {summary.precip:.1f} мм ({summary.pop:.0%})"
+                lines.append(line)
+        if len(lines) == 1:
+            lines.append("Нет данных прогноза на эти дни.")
+
+        text = self._rendered[key] = "\n".join(lines)
+        return text
@@ -1,12 +1,108 @@
-from aiogram import types
-from bot.keyboards import get_main_keyboard
-from config import DEFAULT_CITY
+import logging
+import re
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+from aiogram import Bot, types
+from bot.keyboards import (
+    BUTTON_CHANGE_CITY,
+    BUTTON_HELP,
+    BUTTON_WEATHER_SPB,
+    get_main_keyboard,
+)
+from bot.sender import message_sender, reply_target
+from config import (
+    ALERTS_PER_CHAT,
+    COMPARE_MAX_CITIES,
+    FORECAST_DEFAULT_DAYS,
+    FORECAST_MAX_DAYS,
+    HISTORY_DEFAULT_DAYS,
+    HISTORY_MAX_DAYS,
+    INLINE_CACHE_TIME,
+    SUBSCRIPTION_TIMEZONE,
+)
+from services.alerts import ALERT_FIELDS, alert_store, parse_rule
+from services.exceptions import UpstreamUnavailableError, WeatherError
+from services.inline import inline_search
+from services.subscriptions import subscription_store
+from services.user_store import user_store
 from services.weather_service import weather_service
 
 
+logger = logging.getLogger(__name__)
+
+# Время рассылки в формате ЧЧ:ММ
+TIME_PATTERN = re.compile(r"^([01]?\d|2[0-3]):([0-5]\d)$")
+
+
+Route = Callable[[types.Message], Awaitable[Any]]
+
+
 class MessageHandlers:
     def __init__(self):
-        self.default_city = DEFAULT_CITY
+        # Таблицы точного совпадения: поиск обработчика не зависит от их числа
+        self.commands: Dict[str, Route] = {
+            "start": self.cmd_start,
+            "help": self.cmd_help,
+            "weather": self.cmd_weather,
+            "city": self.cmd_city,
+            "forecast": self.cmd_forecast,
+            "compare": self.cmd_compare,
+            "history": self.cmd_history,
+            "subscribe": self.cmd_subscribe,
+            "unsubscribe": self.cmd_unsubscribe,
+            "alert": self.cmd_alert,
+            "unalert": self.cmd_unalert,
+        }
+        self.buttons: Dict[str, Route] = {
+            BUTTON_WEATHER_SPB: self.weather_spb,
+            BUTTON_HELP: self.help_button,
+            BUTTON_CHANGE_CITY: self.change_city_button,
+        }
+
+    def route(self, text: str, username: str = "") -> Optional[Route]:
+        """Обработчик текста: команда, кнопка или ввод города
+
+        None - неизвестная команда или команда другому боту в группе.
+        """
+        if not text.startswith("/"):
+            return self.buttons.get(text, self.handle_city_input)
+        parts = text[1:].split(maxsplit=1)
+        if not parts:
+            return None
+        command, _, mention = parts[0].partition("@")
+        if mention and mention.lower() != username.lower():
+            return None
+        return self.commands.get(command)
+
+    async def match_route(
+        self, message: types.Message, bot: Bot
+    ) -> Union[bool, Dict[str, Route]]:
+        """Фильтр aiogram: находит обработчик и передает его в dispatch"""
+        username = ""
+        if "@" in message.text:
+            username = (await bot.me()).username or ""
+        route = self.route(message.text, username)
+        return {"route": route} if route is not None else False
+
+    async def dispatch(self, message: types.Message, route: Route):
+        """Единая точка входа для текстовых сообщений"""
+        await route(message)
+
+    async def _answer(self, message: types.Message, text: str, **kwargs):
+        """Ответ в чат сообщения через общий конвейер отправки"""
+        return await message_sender.reply(
+            message.chat.id, text, **reply_target(message), **kwargs
+        )
+
+    async def _weather_text(self, city: str) -> str:
+        """Текст ответа с погодой или понятное сообщение об ошибке"""
+        try:
+            return await weather_service.get_weather(city)
+        except WeatherError as e:
+            return str(e)
+        except Exception:
+            logger.exception(f"Не удалось получить погоду для {city!r}")
+            return str(UpstreamUnavailableError())
 
     async def cmd_start(self, message: types.Message):
         """Обработчик команды /start"""
@@ -17,14 +113,21 @@ class MessageHandlers:
             "• /start - начать работу\n"
             "• /help - помощь\n"
             "• /weather <город> - погода в указанном городе\n"
-            "• /city <город> - установить город по умолчанию\n\n"
+            "• /city <город> - установить город по умолчанию\n"
+            "• /forecast <город> [дни] - прогноз на несколько дней\n"
+            "• /compare <город>, <город> - сравнить погоду\n"
+            "• /history <город> [дни] - статистика за прошедшие дни\n"
+            "• /subscribe <город> <ЧЧ:ММ> - ежедневная погода\n"
+            "• /alert <город> <условие> - оповещение о погоде\n\n"
             "<b>Быстрые кнопки:</b>\n"
             "• Погода в СПб - текущая погода\n"
-            "• Сменить город - установить другой город"
+            "• Сменить город - установить другой город\n"
+            "• Погода рядом - погода по вашей геопозиции"
         )
-        await message.answer(welcome_text, reply_markup=get_main_keyboard())
-        weather_info = weather_service.get_weather(self.default_city)
-        await message.answer(weather_info)
+        await self._answer(message, welcome_text, reply_markup=get_main_keyboard())
+        city = await user_store.get_city(message.from_user.id)
+        weather_info = await self._weather_text(city)
+        await self._answer(message, weather_info)
 
     async def cmd_help(self, message: types.Message):
         """Обработчик команды /help"""
@@ -34,52 +137,241 @@ class MessageHandlers:
             "• /start - начать работу с ботом\n"
             "• /help - показать эту справку\n"
             "• /weather <город> - погода в указанном городе\n"
-            "• /city <город> - установить город по умолчанию\n\n"
+            "• /city <город> - установить город по умолчанию\n"
+            "• /forecast <город> [дни] - прогноз на 1-5 дней\n"
+            "• /compare <город>, <город>, ... - сравнить погоду в городах\n"
+            "• /history <город> [дни] - минимум, максимум и среднее за дни\n"
+            "• /subscribe <город> <ЧЧ:ММ> - присылать погоду каждый день\n"
+            "• /unsubscribe - отменить ежедневную рассылку\n"
+            "• /alert <город> <условие> - оповестить, когда погода перейдет порог\n"
+            "• /alert - список оповещений, /unalert <номер> - удалить\n"
+            "• @имя_бота <город> в любом чате - погода через inline-режим\n\n"
             "<b>Примеры:</b>\n"
             "<code>/weather Moscow</code> - погода в Москве\n"
-            "<code>/city London</code> - установить Лондон городом по умолчанию"
+            "<code>/city London</code> - установить Лондон городом по умолчанию\n"
+            "<code>/forecast Moscow 5</code> - прогноз для Москвы на 5 дней\n"
+            "<code>/compare Moscow, London, Paris</code> - погода в трех городах\n"
+            "<code>/history Moscow 30</code> - погода в Москве за месяц\n"
+            "<code>/subscribe Moscow 08:00</code> - погода в Москве каждое утро\n"
+            "<code>/alert Moscow temp&lt;-10</code> - сообщить о морозе в Москве"
         )
-        await message.answer(help_text)
+        await self._answer(message, help_text)
 
     async def cmd_weather(self, message: types.Message):
         """Обработчик команды /weather"""
         command_parts = message.text.split()
         if len(command_parts) < 2:
-            await message.answer(
-                "❌ Укажите город после команды.\n<b>Пример:</b> <code>/weather Moscow</code>"
+            await self._answer(
+                message,
+                "❌ Укажите город после команды.\n<b>Пример:</b> <code>/weather Moscow</code>",
             )
             return
 
         city = " ".join(command_parts[1:])
-        await message.answer(f"🔍 Запрашиваю погоду для {city}...")
-        weather_info = weather_service.get_weather(city)
-        await message.answer(weather_info)
+        await message_sender.reply_progress(
+            message.chat.id,
+            f"🔍 Запрашиваю погоду для {city}...",
+            self._weather_text(city),
+            **reply_target(message),
+        )
 
     async def cmd_city(self, message: types.Message):
         """Обработчик команды /city"""
         command_parts = message.text.split()
         if len(command_parts) < 2:
-            await message.answer(
-                "❌ Укажите город после команды.\n<b>Пример:</b> <code>/city London</code>"
+            await self._answer(
+                message,
+                "❌ Укажите город после команды.\n<b>Пример:</b> <code>/city London</code>",
             )
             return
 
         city = " ".join(command_parts[1:])
-        weather_info = weather_service.get_weather(city)
+        try:
+            weather_info = await weather_service.get_weather(city)
+        except WeatherError as e:
+            await self._answer(message, str(e))
+            return
+
+        user_store.set_city(message.from_user.id, city)
+        await self._answer(
+            message,
+            f"✅ Город по умолчанию изменен на: <b>{city}</b>\n\n{weather_info}",
+        )
+
+    async def cmd_forecast(self, message: types.Message):
+        """Обработчик команды /forecast"""
+        command_parts = message.text.split()
+        days = FORECAST_DEFAULT_DAYS
+        if len(command_parts) > 2 and command_parts[-1].isdigit():
+            days = int(command_parts.pop())
+        if len(command_parts) < 2 or not 1 <= days <= FORECAST_MAX_DAYS:
+            await self._answer(
+                message,
+                f"❌ Укажите город и, при желании, число дней (1-{FORECAST_MAX_DAYS}).\n"
+                "<b>Пример:</b> <code>/forecast Moscow 3</code>",
+            )
+            return
+
+        city = " ".join(command_parts[1:])
+        try:
+            forecast = await weather_service.get_forecast(city, days)
+        except WeatherError as e:
+            forecast = str(e)
+        await self._answer(message, forecast)
+
+    async def cmd_history(self, message: types.Message):
+        """Обработчик команды /history"""
+        command_parts = message.text.split()
+        days = HISTORY_DEFAULT_DAYS
+        if len(command_parts) > 2 and command_parts[-1].isdigit():
+            days = int(command_parts.pop())
+        if len(command_parts) < 2 or not 1 <= days <= HISTORY_MAX_DAYS:
+            await self._answer(
+                message,
+                f"❌ Укажите город и, при желании, число дней (1-{HISTORY_MAX_DAYS}).\n"
+                "<b>Пример:</b> <code>/history Moscow 30</code>",
+            )
+            return
+
+        city = " ".join(command_parts[1:])
+        try:
+            history = await weather_service.get_history(city, days)
+        except WeatherError as e:
+            history = str(e)
+        await self._answer(message, history)
+
+    async def cmd_compare(self, message: types.Message):
+        """Обработчик команды /compare"""
+        _, _, args = message.text.partition(" ")
+        cities = [city.strip() for city in args.split(",") if city.strip()]
+        if len(cities) < 2:
+            await self._answer(
+                message,
+                "❌ Перечислите хотя бы два города через запятую.\n"
+                "<b>Пример:</b> <code>/compare Moscow, London, Paris</code>",
+            )
+            return
+        if len(cities) > COMPARE_MAX_CITIES:
+            await self._answer(
+                message,
+                f"❌ Можно сравнить не больше {COMPARE_MAX_CITIES} городов за раз.",
+            )
+            return
+
+        results = await weather_service.get_weather_many(cities)
+        await self._answer(message, weather_service.format_comparison(results))
 
-        if weather_info.startswith("❌"):
-            await message.answer(weather_info)
+    async def cmd_subscribe(self, message: types.Message):
+        """Обработчик команды /subscribe"""
+        command_parts = message.text.split()
+        match = None
+        if len(command_parts) > 2:
+            match = TIME_PATTERN.match(command_parts[-1])
+        if match is None:
+            await self._answer(
+                message,
+                "❌ Укажите город и время рассылки.\n"
+                "<b>Пример:</b> <code>/subscribe Moscow 08:00</code>",
+            )
+            return
+
+        city = " ".join(command_parts[1:-1])
+        try:
+            weather_info = await weather_service.get_weather(city)
+        except WeatherError as e:
+            await self._answer(message, str(e))
+            return
+
+        hours, minutes = int(match.group(1)), int(match.group(2))
+        await subscription_store.subscribe(message.chat.id, city, hours * 60 + minutes)
+        await self._answer(
+            message,
+            f"✅ Каждый день в <b>{hours:02d}:{minutes:02d}</b> "
+            f"({SUBSCRIPTION_TIMEZONE}) "
+            f"буду присылать погоду для <b>{city}</b>.\n"
+            "Отменить: /unsubscribe\n\n"
+            f"{weather_info}",
+        )
+
+    async def cmd_unsubscribe(self, message: types.Message):
+        """Обработчик команды /unsubscribe"""
+        if await subscription_store.unsubscribe(message.chat.id):
+            await self._answer(message, "✅ Ежедневная рассылка отменена.")
         else:
-            self.default_city = city
-            await message.answer(
-                f"✅ Город по умолчанию изменен на: <b>{city}</b>\n\n{weather_info}"
+            await self._answer(message, "ℹ️ У вас нет активной подписки.")
+
+    async def cmd_alert(self, message: types.Message):
+        """Обработчик команды /alert: без аргументов - список оповещений"""
+        _, _, args = message.text.partition(" ")
+        chat_id = message.chat.id
+        if not args.strip():
+            rules = alert_store.for_chat(chat_id)
+            if not rules:
+                await self._answer(message, "ℹ️ У вас нет оповещений.")
+                return
+            lines = ["🔔 <b>Ваши оповещения:</b>"]
+            lines.extend(f"{rule.id}. {rule.describe()}" for rule in rules)
+            lines.append(
+                "\nУдалить: <code>/unalert номер</code> или <code>/unalert all</code>"
+            )
+            await self._answer(message, "\n".join(lines))
+            return
+
+        rule = parse_rule(args)
+        if rule is None:
+            await self._answer(
+                message,
+                "❌ Укажите город и условие: поле, &lt; или &gt; и порог.\n"
+                f"<b>Поля:</b> {', '.join(ALERT_FIELDS)}\n"
+                "<b>Пример:</b> <code>/alert Moscow wind&gt;15</code>",
+            )
+            return
+        if len(alert_store.for_chat(chat_id)) >= ALERTS_PER_CHAT:
+            await self._answer(
+                message, f"❌ Можно завести не больше {ALERTS_PER_CHAT} оповещений."
             )
+            return
+
+        city, field, op, threshold = rule
+        try:
+            query = weather_service.resolve(city)
+        except WeatherError as e:
+            await self._answer(message, str(e))
+            return
+        added = await alert_store.add(chat_id, city, query, field, op, threshold)
+        await self._answer(
+            message,
+            f"✅ Оповещение {added.id} добавлено: {added.describe()}\n"
+            "Сообщу, когда погода перейдет порог.",
+        )
+
+    async def cmd_unalert(self, message: types.Message):
+        """Обработчик команды /unalert"""
+        command_parts = message.text.split()
+        if len(command_parts) != 2 or not (
+            command_parts[1].isdigit() or command_parts[1].lower() == "all"
+        ):
+            await self._answer(
+                message,
+                "❌ Укажите номер оповещения из /alert или all.\n"
+                "<b>Пример:</b> <code>/unalert 3</code>",
+            )
+            return
+
+        rule_id = None if command_parts[1].lower() == "all" else int(command_parts[1])
+        if await alert_store.remove(message.chat.id, rule_id):
+            await self._answer(message, "✅ Оповещение удалено.")
+        else:
+            await self._answer(message, "ℹ️ Такого оповещения нет.")
 
     async def weather_spb(self, message: types.Message):
         """Обработчик кнопки 'Погода в СПб'"""
-        await message.answer("🔍 Запрашиваю погоду в Санкт-Петербурге...")
-        weather_info = weather_service.get_weather("Saint Petersburg")
-        await message.answer(weather_info)
+        await message_sender.reply_progress(
+            message.chat.id,
+            "🔍 Запрашиваю погоду в Санкт-Петербурге...",
+            self._weather_text("Saint Petersburg"),
+            **reply_target(message),
+        )
 
     async def help_button(self, message: types.Message):
         """Обработчик кнопки 'Помощь'"""
@@ -87,23 +379,69 @@ class MessageHandlers:
 
     async def change_city_button(self, message: types.Message):
         """Обработчик кнопки 'Сменить город'"""
-        await message.answer(
+        await self._answer(
+            message,
             "🏙 Чтобы установить город по умолчанию, используйте команду:\n"
             "<code>/city &lt;город&gt;</code>\n\n"
-            "Или просто отправьте название города, и я покажу погоду в нем."
+            "Или просто отправьте название города, и я покажу погоду в нем.",
         )
 
+    async def handle_location(self, message: types.Message):
+        """Обработчик геопозиции: погода в точке, где находится пользователь"""
+        location = message.location
+        try:
+            weather_info = await weather_service.get_weather_at(
+                location.latitude, location.longitude
+            )
+        except WeatherError as e:
+            weather_info = str(e)
+        await self._answer(message, weather_info)
+
     async def handle_city_input(self, message: types.Message):
         """Обработчик произвольного ввода города"""
         text = message.text.strip()
-        if text not in [
-            "🌤 Погода в СПб",
-            "❓ Помощь",
-            "🏙 Сменить город",
-        ] and not text.startswith("/"):
-            await message.answer(f"🔍 Запрашиваю погоду для {text}...")
-            weather_info = weather_service.get_weather(text)
-            await message.answer(weather_info)
+        if text:
+            await message_sender.reply_progress(
+                message.chat.id,
+                f"🔍 Запрашиваю погоду для {text}...",
+                self._weather_text(text),
+                **reply_target(message),
+            )
+
+    async def inline_weather(self, inline_query: types.InlineQuery):
+        """Обработчик inline-запросов: подсказки городов с погодой из кэша"""
+        items = inline_search.search(inline_query.query)
+        ttl = weather_service.cache.ttl
+        cache_time = INLINE_CACHE_TIME
+        results = []
+        for item in items:
+            title = item.query.title
+            if item.reading is None:
+                # Просим Telegram спросить снова, когда данные догрузятся
+                cache_time = 1
+                description = "⏳ Загружаю погоду..."
+                text = f"🌤 <b>{title}</b>: погода загружается, повторите запрос"
+            else:
+                description = item.reading.render(title, "inline")
+                text = item.reading.render(title)
+                if item.age > ttl:
+                    cache_time = 1
+                    description += f" ({int(item.age // 60)} мин назад)"
+                else:
+                    cache_time = min(cache_time, int(ttl - item.age) + 1)
+            results.append(
+                types.InlineQueryResultArticle(
+                    id=item.query.key,
+                    title=title,
+                    description=description,
+                    input_message_content=types.InputTextMessageContent(
+                        message_text=text
+                    ),
+                )
+            )
+
+        await inline_query.answer(results, cache_time=cache_time, is_personal=False)
+        inline_search.warm_later(inline_query.from_user.id, items)
 
 
 # Создаем экземпляр обработчиков
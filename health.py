@@ -0,0 +1,79 @@
+import time
+from typing import Iterable, List, Tuple
+
+from bot.sender import message_sender
+from services.alerts import alert_evaluator
+from services.inline import inline_search
+from services.metrics import registry, runtime, startup
+from services.subscriptions import subscription_scheduler
+from services.weather_service import weather_service
+
+
+# Сколько секунд без успешного getUpdates считать polling живым
+POLLING_GRACE_PERIOD = 60
+
+
+def readiness() -> Tuple[bool, dict]:
+    """Готов ли бот: upstream доступен и обновления Telegram поступают"""
+    breakers = weather_service.stats()["circuit_breakers"]
+    upstream_ok = all(b["state"] != "open" for b in breakers.values())
+
+    if runtime.mode == "polling":
+        receiving = (
+            runtime.running
+            and time.time() - runtime.last_poll_at < POLLING_GRACE_PERIOD
+        )
+    else:
+        receiving = runtime.running
+
+    checks = {"upstream_reachable": upstream_ok, "receiving_updates": receiving}
+    return all(checks.values()), checks
+
+
+def health_payload() -> Tuple[dict, int]:
+    """Тело и код ответа для /health"""
+    ready, checks = readiness()
+    payload = {
+        "status": "healthy" if ready else "unavailable",
+        "mode": runtime.mode,
+        "checks": checks,
+        "quota": weather_service.quota.snapshot(),
+        "startup": startup.snapshot(),
+    }
+    return payload, 200 if ready else 503
+
+
+def _gauges(prefix: str, values: dict) -> List[str]:
+    lines = []
+    for key, value in values.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            lines.append(f"# TYPE {prefix}_{key} gauge")
+            lines.append(f"{prefix}_{key} {value}")
+    return lines
+
+
+def _weather_service_metrics() -> Iterable[str]:
+    stats = weather_service.stats()
+    yield from _gauges("weather_cache", stats["cache"])
+    yield from _gauges("weather_upstream", stats["upstream"])
+    yield from _gauges("weather_quota", stats["quota"])
+    yield "# TYPE weather_circuit_open gauge"
+    for url, breaker in stats["circuit_breakers"].items():
+        state = 1 if breaker["state"] == "open" else 0
+        yield f'weather_circuit_open{{endpoint="{url}"}} {state}'
+
+
+def _delivery_metrics() -> Iterable[str]:
+    yield from _gauges("bot_send_queue", message_sender.stats())
+    yield from _gauges("bot_subscriptions", subscription_scheduler.stats())
+    yield from _gauges("bot_inline", inline_search.stats())
+    yield from _gauges("bot_alerts", alert_evaluator.stats())
+
+
+registry.add_collector(_weather_service_metrics)
+registry.add_collector(_delivery_metrics)
+
+
+def metrics_text() -> str:
+    """Метрики в текстовом формате Prometheus"""
+    return registry.render()
@@ -0,0 +1,70 @@
+import heapq
+import time
+from typing import Any, Dict, Hashable, List, Set
+
+from config import PREFETCH_HALF_LIFE
+
+
+class HotCityTracker:
+    """Популярность городов с экспоненциальным затуханием счетчиков"""
+
+    def __init__(self, half_life: float = PREFETCH_HALF_LIFE, max_keys: int = 10000):
+        self.half_life = half_life
+        self.max_keys = max_keys
+        self._scores: Dict[Hashable, float] = {}
+        self._items: Dict[Hashable, Any] = {}
+        self._pinned: Set[Hashable] = set()
+        self._decayed_at = time.monotonic()
+
+    def record(self, key: Hashable, item: Any):
+        """Учитывает один запрос города"""
+        self._scores[key] = self._scores.get(key, 0.0) + 1.0
+        self._items[key] = item
+        if len(self._scores) > self.max_keys:
+            self._evict()
+
+    def pin(self, key: Hashable, item: Any):
+        """Город, который прогревается всегда (например, город по умолчанию)"""
+        self._pinned.add(key)
+        self._items[key] = item
+
+    def decay(self):
+        """Уменьшает счетчики пропорционально прошедшему времени"""
+        now = time.monotonic()
+        factor = 0.5 ** ((now - self._decayed_at) / self.half_life)
+        self._decayed_at = now
+        self._scores = {
+            key: score * factor
+            for key, score in self._scores.items()
+            if score * factor >= 0.05
+        }
+        for key in list(self._items):
+            if key not in self._scores and key not in self._pinned:
+                del self._items[key]
+
+    def _evict(self):
+        """Освобождает место с запасом в десятую часть лимита
+
+        Так затухание и выбор наименее популярных городов выполняются раз
+        на max_keys / 10 новых городов, а не на каждый запрос.
+        """
+        self.decay()
+        keep = self.max_keys - max(1, self.max_keys // 10)
+        if len(self._scores) <= keep:
+            return
+        coldest = heapq.nsmallest(
+            len(self._scores) - keep, self._scores, key=self._scores.get
+        )
+        for key in coldest:
+            del self._scores[key]
+            if key not in self._pinned:
+                del self._items[key]
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def top(self, n: int) -> List[Any]:
+        """Закрепленные города и n самых популярных"""
+        hottest = heapq.nlargest(n, self._scores, key=self._scores.get)
+        keys = list(self._pinned) + [k for k in hottest if k not in self._pinned]
+        return [self._items[key] for key in keys]
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from typing import Dict, List, NamedTuple, Optional
+
+from config import INLINE_DEBOUNCE, INLINE_RESULTS_LIMIT
+from services.cities import city_index
+from services.weather_model import WeatherReading
+from services.weather_service import WeatherQuery, WeatherService, weather_service
+
+
+logger = logging.getLogger(__name__)
+
+
+class InlineItem(NamedTuple):
+    """Город в ответе на inline-запрос и погода из кэша, если она есть"""
+
+    query: WeatherQuery
+    reading: Optional[WeatherReading]
+    age: float
+
+
+class InlineSearch:
+    """Подсказки городов для inline-запросов без обращений к API
+
+    Ответ строится только из локального индекса и кэша погоды. Города без
+    данных догружаются в фоне, когда пользователь перестает печатать.
+    """
+
+    def __init__(
+        self,
+        service: WeatherService,
+        limit: int = INLINE_RESULTS_LIMIT,
+        debounce: float = INLINE_DEBOUNCE,
+    ):
+        self.service = service
+        self.limit = limit
+        self.debounce = debounce
+        # Отложенная догрузка по пользователям: новый ввод отменяет старую
+        self._warming: Dict[int, asyncio.Task] = {}
+
+        self.queries = 0
+        self.served_from_cache = 0
+        self.warmed = 0
+
+    def search(self, text: str) -> List[InlineItem]:
+        """Города по префиксу (или похожие), а для пустого ввода - популярные"""
+        self.queries += 1
+        text = text.strip()
+        if text:
+            cities = city_index.search_prefix(text, self.limit)
+            if not cities:
+                cities = city_index.suggest(text, limit=self.limit)
+            queries = [self.service.resolve_city(city) for city in cities]
+        else:
+            queries = self.service.hot_cities.top(self.limit)
+
+        items = []
+        for query in queries:
+            cached = self.service.cache.peek(query.key)
+            if cached is None:
+                items.append(InlineItem(query, None, 0.0))
+            else:
+                self.served_from_cache += 1
+                items.append(InlineItem(query, *cached))
+        return items
+
+    def is_fresh(self, item: InlineItem) -> bool:
+        return item.reading is not None and item.age <= self.service.cache.ttl
+
+    def warm_later(self, user_id: int, items: List[InlineItem]):
+        """Догружает устаревшие города после паузы в наборе"""
+        previous = self._warming.pop(user_id, None)
+        if previous is not None:
+            previous.cancel()
+        queries = [item.query for item in items if not self.is_fresh(item)]
+        if not queries:
+            return
+        task = asyncio.create_task(self._warm(queries))
+        self._warming[user_id] = task
+        task.add_done_callback(lambda done: self._forget(user_id, done))
+
+    def _forget(self, user_id: int, task: asyncio.Task):
+        if self._warming.get(user_id) is task:
+            del self._warming[user_id]
+
+    async def _warm(self, queries: List[WeatherQuery]):
+        await asyncio.sleep(self.debounce)
+        results = await asyncio.gather(
+            *(self.service.refresh(query) for query in queries)
+        )
+        self.warmed += sum(results)
+
+    def stats(self) -> dict:
+        return {
+            "queries": self.queries,
+            "served_from_cache": self.served_from_cache,
+            "warmed": self.warmed,
+            "warming": len(self._warming),
+        }
+
+
+# Создаем экземпляр для импорта
+inline_search = InlineSearch(weather_service)
@@ -1,12 +1,25 @@
 from aiogram.types import KeyboardButton, ReplyKeyboardMarkup
 
 
+# Тексты кнопок: по ним же сообщения находят обработчик
+BUTTON_WEATHER_SPB = "🌤 Погода в СПб"
+BUTTON_HELP = "❓ Помощь"
+BUTTON_CHANGE_CITY = "🏙 Сменить город"
+BUTTON_NEARBY = "📍 Погода рядом"
+
+
 def get_main_keyboard() -> ReplyKeyboardMarkup:
     """Создает основную клавиатуру"""
     keyboard = ReplyKeyboardMarkup(
         keyboard=[
-            [KeyboardButton(text="🌤 Погода в СПб"), KeyboardButton(text="❓ Помощь")],
-            [KeyboardButton(text="🏙 Сменить город")],
+            [
+                KeyboardButton(text=BUTTON_WEATHER_SPB),
+                KeyboardButton(text=BUTTON_HELP),
+            ],
+            [
+                KeyboardButton(text=BUTTON_CHANGE_CITY),
+                KeyboardButton(text=BUTTON_NEARBY, request_location=True),
+            ],
         ],
         resize_keyboard=True,
     )
@@ -1,15 +1,36 @@
 import asyncio
 import logging
-from threading import Thread
-import time
 
-from aiogram import Bot, Dispatcher
+from aiogram import Bot, Dispatcher, F
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
-from aiogram.filters import Command
 from bot.handlers import handlers
-from config import PORT, TG_KEY
-from web.flask_app import flask_app, run_flask
+from bot.middlewares import (
+    HandlerMetricsMiddleware,
+    PollingHeartbeatMiddleware,
+    ThrottlingMiddleware,
+    UpdateMetricsMiddleware,
+)
+from bot.sender import message_sender
+from config import (
+    ARCHIVE_ENABLED,
+    BOT_MODE,
+    HEALTH_SERVER_ENABLED,
+    PORT,
+    PREFETCH_ENABLED,
+    TELEGRAM_API_URL,
+    TG_KEY,
+    WORKERS,
+)
+from services.alerts import alert_evaluator, alert_store
+from services.archive import weather_archive
+from services.metrics import loop_lag_monitor, runtime, startup
+from services.prefetch import prefetcher
+from services.subscriptions import subscription_scheduler, subscription_store
+from services.user_store import user_store
+from services.weather_service import weather_service
 
 
 # Настройка логирования
@@ -19,43 +40,122 @@ logger = logging.getLogger(__name__)
 
 def setup_handlers(dp: Dispatcher):
     """Регистрирует все обработчики сообщений"""
-    # Команды
-    dp.message.register(handlers.cmd_start, Command("start"))
-    dp.message.register(handlers.cmd_help, Command("help"))
-    dp.message.register(handlers.cmd_weather, Command("weather"))
-    dp.message.register(handlers.cmd_city, Command("city"))
-
-    # Кнопки
-    dp.message.register(
-        handlers.weather_spb, lambda message: message.text == "🌤 Погода в СПб"
-    )
-    dp.message.register(
-        handlers.help_button, lambda message: message.text == "❓ Помощь"
-    )
-    dp.message.register(
-        handlers.change_city_button, lambda message: message.text == "🏙 Сменить город"
+    # Метрики: все обновления и время работы каждого обработчика
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.inline_query.middleware(HandlerMetricsMiddleware())
+    # Лимит частоты и дубли проверяются до поиска обработчика
+    dp.message.outer_middleware(ThrottlingMiddleware())
+
+    # Геопозиция
+    dp.message.register(handlers.handle_location, F.location)
+
+    # Команды, кнопки и ввод города: одна регистрация, обработчик
+    # выбирается по таблицам точного совпадения
+    dp.message.register(handlers.dispatch, F.text, handlers.match_route)
+
+    # Inline-запросы: @bot <город>
+    dp.inline_query.register(handlers.inline_weather)
+
+
+def create_bot() -> Bot:
+    """Создает клиента Telegram Bot API"""
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+    bot = Bot(
+        token=TG_KEY,
+        session=session,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
-
-    # Произвольный текст (города)
-    dp.message.register(handlers.handle_city_input)
+    bot.session.middleware(PollingHeartbeatMiddleware())
+    return bot
+
+
+async def start_services(bot: Bot, background: bool = True):
+    """Запускает сервисы бота
+
+    background=False не запускает прогрев кэша и рассылку подписок: в
+    многопроцессном режиме их выполняет только один процесс.
+    """
+    # Общий пул соединений к OpenWeatherMap на все время работы бота
+    await weather_service.start()
+
+    # Прогрев кэша идет в фоне и не задерживает запуск
+    if background and PREFETCH_ENABLED:
+        await prefetcher.start()
+
+    # Независимые части поднимаются одновременно: базы и соединение с API
+    warmups = [
+        startup.timed("user_store", user_store.start()),
+        startup.timed("subscription_store", subscription_store.start()),
+        startup.timed("alert_store", alert_store.start()),
+        startup.timed("upstream_connection", weather_service.warm_up()),
+    ]
+    if ARCHIVE_ENABLED:
+        warmups.append(startup.timed("archive", weather_archive.start()))
+    await asyncio.gather(*warmups)
+
+    await message_sender.start(bot)
+    if background:
+        await subscription_scheduler.start(message_sender)
+        await alert_evaluator.start(message_sender)
+
+    loop_lag_monitor.start()
+
+
+async def stop_services():
+    """Останавливает сервисы в порядке, обратном запуску"""
+    runtime.mark_stopped()
+    await loop_lag_monitor.close()
+    await alert_evaluator.close()
+    await subscription_scheduler.close()
+    await message_sender.close()
+    await subscription_store.close()
+    await alert_store.close()
+    await prefetcher.close()
+    await user_store.close()
+    await weather_service.close()
+    await weather_archive.close()
 
 
 async def start_bot():
     """Запускает Telegram бота"""
     logger.info("Инициализация бота...")
 
-    bot = Bot(token=TG_KEY, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    dp = Dispatcher()
-
-    # Регистрируем обработчики
-    setup_handlers(dp)
+    with startup.phase("setup"):
+        bot = create_bot()
+        dp = Dispatcher()
+        # Регистрируем обработчики
+        setup_handlers(dp)
 
-    logger.info("Запуск Telegram бота...")
+    logger.info(f"Запуск Telegram бота в режиме {BOT_MODE}...")
     try:
-        await dp.start_polling(bot, skip_updates=True)
+        if BOT_MODE == "webhook":
+            # Модуль aiohttp-сервера нужен только в режиме webhook
+            from web.webhook_app import run_webhook
+
+            with startup.phase("services"):
+                await start_services(bot)
+            runtime.mark_running(BOT_MODE)
+            await run_webhook(bot, dp, PORT, on_ready=startup.mark_ready)
+        else:
+            # Снимаем вебхук, если бот раньше работал в режиме webhook;
+            # запрос к Telegram идет одновременно с запуском сервисов
+            with startup.phase("services"):
+                await asyncio.gather(
+                    start_services(bot),
+                    startup.timed(
+                        "delete_webhook",
+                        bot.delete_webhook(drop_pending_updates=True),
+                    ),
+                )
+            runtime.mark_running(BOT_MODE)
+            startup.mark_ready()
+            await dp.start_polling(bot)
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {e}")
         raise
+    finally:
+        await stop_services()
 
 
 def run_bot():
@@ -65,14 +165,25 @@ def run_bot():
 
 def main():
     """Основная функция запуска"""
-    # Даем время на инициализацию
-    time.sleep(2)
+    startup.mark_imported()
+
+    if WORKERS > 1:
+        # Супервизор сам принимает обновления и раздает их процессам
+        from supervisor import run_supervisor
+
+        run_supervisor(WORKERS)
+        return
+
+    if BOT_MODE == "polling" and HEALTH_SERVER_ENABLED:
+        # В режиме webhook служебные маршруты обслуживает тот же веб-сервер,
+        # а при long polling запускаем Flask в отдельном потоке как демона.
+        # Flask импортируется только здесь, чтобы не замедлять остальные режимы
+        from web.flask_app import flask_app, start_flask_thread
 
-    # Запускаем Flask в отдельном потоке как демона
-    flask_thread = Thread(target=lambda: run_flask(flask_app, PORT), daemon=True)
-    flask_thread.start()
+        with startup.phase("health_server"):
+            start_flask_thread(flask_app, PORT)
+        logger.info(f"Flask запущен на порту {PORT} в фоновом режиме")
 
-    logger.info(f"Flask запущен на порту {PORT} в фоновом режиме")
     logger.info("Запускаем Telegram бота в основном потоке...")
 
     # Запускаем бота в основном потоке
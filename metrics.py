@@ -0,0 +1,328 @@
+from abc import ABC, abstractmethod
+import asyncio
+from bisect import bisect_left
+from contextlib import contextmanager
+import logging
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric(ABC):
+    """Метрика в формате Prometheus; с labelnames - семейство дочерних метрик"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> "_Metric":
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self) -> "_Metric":
+        """Дочерняя метрика для одного набора значений меток"""
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """Строки значений без заголовков HELP и TYPE"""
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = 0.0
+
+    def _new_child(self) -> "Counter":
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def _samples(self) -> List[str]:
+        if not self.labelnames:
+            return [f"{self.name} {self.value}"]
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {child.value}"
+            for key, child in list(self._children.items())
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def _new_child(self) -> "Gauge":
+        return Gauge(self.name, self.documentation)
+
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = buckets
+        # Последняя корзина - +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def _series(self, labels: Dict[str, str], child: "Histogram") -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*child.buckets, "+Inf"), child.counts):
+            cumulative += count
+            names = (*labels.keys(), "le")
+            values = (*labels.values(), str(bound))
+            lines.append(
+                f"{self.name}_bucket{_format_labels(names, values)} {cumulative}"
+            )
+        suffix = _format_labels(tuple(labels.keys()), tuple(labels.values()))
+        lines.append(f"{self.name}_sum{suffix} {child.sum}")
+        lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+    def _samples(self) -> List[str]:
+        if not self.labelnames:
+            return self._series({}, self)
+        lines = []
+        for key, child in list(self._children.items()):
+            lines.extend(self._series(dict(zip(self.labelnames, key)), child))
+        return lines
+
+
+class Registry:
+    """Набор метрик и коллекторов, отдаваемых на /metrics"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]):
+        """Функция, возвращающая готовые строки метрик в момент запроса"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                logger.error(f"Ошибка коллектора метрик: {e!r}")
+        return "\n".join(lines) + "\n"
+
+
+class LoopLagMonitor:
+    """Измеряет задержку event loop: насколько позже заказанного просыпается sleep"""
+
+    def __init__(self, gauge: Gauge, histogram: Histogram, interval: float = 0.5):
+        self.gauge = gauge
+        self.histogram = histogram
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - started - self.interval)
+            self.gauge.set(lag)
+            self.histogram.observe(lag)
+
+
+class RuntimeState:
+    """Состояние процесса бота для проверки готовности"""
+
+    def __init__(self):
+        self.mode = ""
+        self.started_at = 0.0
+        self.running = False
+        # Время последнего успешного getUpdates (только для polling)
+        self.last_poll_at = 0.0
+
+    def mark_running(self, mode: str):
+        self.mode = mode
+        self.started_at = time.time()
+        self.running = True
+
+    def mark_stopped(self):
+        self.running = False
+
+
+def process_uptime() -> Optional[float]:
+    """Сколько секунд прошло с запуска процесса (только Linux), иначе None"""
+    try:
+        with open("/proc/self/stat") as f:
+            # Имя процесса в скобках может содержать пробелы
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupReport:
+    """Длительность этапов запуска и время до готовности бота"""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.ready_after: Optional[float] = None
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    async def timed(self, name: str, awaitable: Awaitable):
+        """Ожидает awaitable и записывает длительность как этап name"""
+        with self.phase(name):
+            return await awaitable
+
+    def mark_imported(self):
+        """Этап imports: запуск интерпретатора и импорт модулей до main()"""
+        uptime = process_uptime()
+        if uptime is not None:
+            self.phases["imports"] = uptime
+
+    def mark_ready(self):
+        """Фиксирует время до готовности и пишет отчет в лог"""
+        self.ready_after = process_uptime()
+        phases = ", ".join(
+            f"{name} {seconds:.3f}" for name, seconds in self.phases.items()
+        )
+        if self.ready_after is not None:
+            logger.info(f"Бот готов через {self.ready_after:.3f} с: {phases}")
+        else:
+            logger.info(f"Бот готов, этапы запуска (с): {phases}")
+
+    def snapshot(self) -> dict:
+        return {
+            "ready_after": self.ready_after,
+            "phases": {name: round(value, 4) for name, value in self.phases.items()},
+        }
+
+
+registry = Registry()
+runtime = RuntimeState()
+startup = StartupReport()
+
+handler_latency = registry.register(
+    Histogram(
+        "bot_handler_duration_seconds",
+        "Время обработки сообщения обработчиком",
+        ["handler"],
+    )
+)
+handler_errors = registry.register(
+    Counter(
+        "bot_handler_errors_total",
+        "Необработанные исключения в обработчиках",
+        ["handler"],
+    )
+)
+updates_total = registry.register(
+    Counter("bot_updates_total", "Полученные обновления Telegram")
+)
+updates_in_progress = registry.register(
+    Gauge("bot_updates_in_progress", "Обновления, обрабатываемые прямо сейчас")
+)
+updates_throttled = registry.register(
+    Counter(
+        "bot_updates_throttled_total",
+        "Сообщения, отброшенные ограничением частоты или как дубли",
+        ["reason"],
+    )
+)
+upstream_latency = registry.register(
+    Histogram(
+        "weather_upstream_duration_seconds",
+        "Время ответа OpenWeatherMap",
+        ["endpoint"],
+    )
+)
+upstream_responses = registry.register(
+    Counter(
+        "weather_upstream_responses_total",
+        "Ответы OpenWeatherMap по кодам статуса",
+        ["endpoint", "status"],
+    )
+)
+loop_lag = registry.register(
+    Gauge("event_loop_lag_seconds", "Последняя измеренная задержка event loop")
+)
+loop_lag_histogram = registry.register(
+    Histogram(
+        "event_loop_lag_distribution_seconds",
+        "Распределение задержки event loop",
+        buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1),
+    )
+)
+
+loop_lag_monitor = LoopLagMonitor(loop_lag, loop_lag_histogram)
+
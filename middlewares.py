@@ -0,0 +1,173 @@
+from collections import deque
+from math import ceil
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set, Tuple
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.methods import GetUpdates, TelegramMethod
+from aiogram.types import Message, TelegramObject
+from bot.sender import message_sender, reply_target
+from config import THROTTLE_EVICT_INTERVAL, THROTTLE_RATE, THROTTLE_WINDOW
+from services.metrics import (
+    handler_errors,
+    handler_latency,
+    runtime,
+    updates_in_progress,
+    updates_throttled,
+    updates_total,
+)
+
+
+Handler = Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]]
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware: число обновлений и сколько их обрабатывается сейчас"""
+
+    async def __call__(
+        self, handler: Handler, event: TelegramObject, data: Dict[str, Any]
+    ) -> Any:
+        updates_total.inc()
+        updates_in_progress.inc()
+        try:
+            return await handler(event, data)
+        finally:
+            updates_in_progress.dec()
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: время работы и ошибки каждого обработчика"""
+
+    async def __call__(
+        self, handler: Handler, event: TelegramObject, data: Dict[str, Any]
+    ) -> Any:
+        # Текстовые сообщения идут через dispatch, настоящий обработчик - route
+        route = data.get("route")
+        handler_object = data.get("handler")
+        if route is not None:
+            name = route.__name__
+        elif handler_object is not None:
+            name = handler_object.callback.__name__
+        else:
+            name = "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.labels(name).inc()
+            raise
+        finally:
+            handler_latency.labels(name).observe(time.perf_counter() - started)
+
+
+class _UserWindow:
+    """Времена последних сообщений пользователя"""
+
+    __slots__ = ("hits", "warned")
+
+    def __init__(self, rate: int):
+        self.hits: Deque[float] = deque(maxlen=rate)
+        # Предупреждение о лимите отправляется один раз до следующего пропуска
+        self.warned = False
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Внешний middleware сообщений: лимит частоты и дубли в обработке
+
+    Для пользователя хранятся времена последних rate сообщений: новое
+    проходит, если самое старое из них вышло из скользящего окна. Пока
+    запрос обрабатывается, тот же текст из того же чата отбрасывается.
+    Пользователи, молчащие дольше окна, периодически удаляются из памяти.
+    """
+
+    def __init__(
+        self,
+        rate: int = THROTTLE_RATE,
+        window: float = THROTTLE_WINDOW,
+        evict_interval: float = THROTTLE_EVICT_INTERVAL,
+    ):
+        self.rate = rate
+        self.window = window
+        self.evict_interval = evict_interval
+        self._users: Dict[int, _UserWindow] = {}
+        self._in_flight: Set[Tuple[int, str]] = set()
+        self._next_evict = time.monotonic() + evict_interval
+
+    async def __call__(
+        self, handler: Handler, event: TelegramObject, data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Message) or event.from_user is None:
+            return await handler(event, data)
+
+        key = (event.chat.id, event.text) if event.text else None
+        if key is not None and key in self._in_flight:
+            # Ответ на такой же запрос уже готовится
+            updates_throttled.labels("duplicate").inc()
+            return None
+
+        now = time.monotonic()
+        if now >= self._next_evict:
+            self._evict(now)
+        window = self._users.get(event.from_user.id)
+        if window is None:
+            window = self._users[event.from_user.id] = _UserWindow(self.rate)
+        retry_after = self._retry_after(window, now)
+        if retry_after is not None:
+            updates_throttled.labels("rate").inc()
+            if not window.warned:
+                window.warned = True
+                await message_sender.reply(
+                    event.chat.id,
+                    "⏳ Слишком много запросов. "
+                    f"Повторите через {ceil(retry_after)} с.",
+                    **reply_target(event),
+                )
+            return None
+
+        window.hits.append(now)
+        window.warned = False
+        if key is None:
+            return await handler(event, data)
+        self._in_flight.add(key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(key)
+
+    def _retry_after(self, window: _UserWindow, now: float) -> Optional[float]:
+        """Через сколько секунд освободится место в окне; None - уже свободно"""
+        hits = window.hits
+        if len(hits) < self.rate:
+            return None
+        wait = hits[0] + self.window - now
+        return wait if wait > 0 else None
+
+    def _evict(self, now: float):
+        self._users = {
+            user_id: window
+            for user_id, window in self._users.items()
+            if window.hits and now - window.hits[-1] < self.window
+        }
+        self._next_evict = now + self.evict_interval
+
+    def stats(self) -> dict:
+        return {"users": len(self._users), "in_flight": len(self._in_flight)}
+
+
+class PollingHeartbeatMiddleware(BaseRequestMiddleware):
+    """Отмечает каждый успешный getUpdates, чтобы /health видел живой polling"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ):
+        response = await make_request(bot, method)
+        if isinstance(method, GetUpdates):
+            runtime.last_poll_at = time.time()
+        return response
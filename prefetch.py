@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from config import (
+    DEFAULT_CITY,
+    PREFETCH_BUDGET_SHARE,
+    PREFETCH_INTERVAL,
+    PREFETCH_REFRESH_AHEAD,
+    PREFETCH_TOP_N,
+)
+from services.weather_service import WeatherService, weather_service
+
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """Заранее обновляет популярные города, пока их записи не истекли"""
+
+    def __init__(
+        self,
+        service: WeatherService,
+        top_n: int = PREFETCH_TOP_N,
+        interval: float = PREFETCH_INTERVAL,
+        refresh_ahead: float = PREFETCH_REFRESH_AHEAD,
+        budget_share: float = PREFETCH_BUDGET_SHARE,
+    ):
+        self.service = service
+        self.top_n = top_n
+        self.interval = interval
+        self.refresh_ahead = refresh_ahead
+        self.budget_share = budget_share
+        self._task: Optional[asyncio.Task] = None
+
+        self._day_started = time.time()
+        self.calls_today = 0
+        self.refreshed = 0
+        self.skipped_budget = 0
+
+    async def start(self):
+        """Закрепляет город по умолчанию и запускает цикл прогрева
+
+        Первый проход выполняется сразу, но в фоне: запуск бота не ждет
+        ответа API, а запрос того же города объединится с прогревом.
+        """
+        default = self.service.resolve(DEFAULT_CITY)
+        self.service.hot_cities.pin(default.key, default)
+        self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.prefetch_once()
+            except Exception as e:
+                logger.error(f"Ошибка прогрева кэша: {e!r}")
+            await asyncio.sleep(self.interval)
+
+    def _tick_budget(self) -> int:
+        """Сколько запросов прогрев может сделать за один проход"""
+        quota = self.service.quota
+        if time.time() - self._day_started >= 86400:
+            self._day_started = time.time()
+            self.calls_today = 0
+        daily_left = int(quota.per_day * self.budget_share) - self.calls_today
+        per_tick = int(quota.per_minute * self.budget_share * self.interval / 60)
+        return max(0, min(daily_left, max(1, per_tick)))
+
+    async def prefetch_once(self) -> int:
+        """Один проход прогрева; возвращает число обновленных городов"""
+        self.service.hot_cities.decay()
+        budget = self._tick_budget()
+        ttl = self.service.cache.ttl
+        refreshed = 0
+
+        for query in self.service.hot_cities.top(self.top_n):
+            entry = self.service.cache.peek(query.key)
+            if entry is not None and entry[1] < ttl - self.refresh_ahead:
+                continue
+            if budget <= 0:
+                self.skipped_budget += 1
+                continue
+            budget -= 1
+            self.calls_today += 1
+            if await self.service.refresh(query):
+                refreshed += 1
+
+        self.refreshed += refreshed
+        if refreshed:
+            logger.info(f"Прогрев кэша: обновлено городов - {refreshed}")
+        return refreshed
+
+    def stats(self) -> dict:
+        return {
+            "refreshed": self.refreshed,
+            "calls_today": self.calls_today,
+            "skipped_budget": self.skipped_budget,
+        }
+
+
+# Создаем экземпляр прогрева для импорта
+prefetcher = Prefetcher(weather_service)
@@ -0,0 +1,252 @@
+import asyncio
+from datetime import datetime, timezone
+import time
+from typing import Any, Tuple
+
+from config import (
+    WEATHER_CALLS_BURST,
+    WEATHER_CALLS_PER_DAY,
+    WEATHER_CALLS_PER_MINUTE,
+)
+
+
+class TokenBucket:
+    """Классический token bucket: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refilled(self) -> Tuple[float, float]:
+        """Запас с учетом пополнения и момент расчета; состояние не меняет"""
+        now = time.monotonic()
+        refilled = self.tokens + (now - self._updated) * self.rate
+        return min(self.capacity, refilled), now
+
+    def _refill(self):
+        self.tokens, self._updated = self._refilled()
+
+    @property
+    def available(self) -> float:
+        # Только чтение: свойство вызывают и из других потоков (/health, /metrics),
+        # а писать состояние ведра может лишь цикл событий
+        return max(0.0, self._refilled()[0])
+
+    def try_acquire(self, tokens: float = 1, reserve: float = 0) -> bool:
+        """Берет tokens, если после этого останется не меньше reserve"""
+        self._refill()
+        if self.tokens >= tokens + reserve:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def time_until_available(self, tokens: float = 1) -> float:
+        """Через сколько секунд накопится нужное число токенов"""
+        self._refill()
+        if self.tokens >= tokens:
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    def drain(self, seconds: float = 0.0):
+        """Обнуляет запас и откладывает пополнение на seconds секунд"""
+        self._refill()
+        self.tokens = -seconds * self.rate
+
+
+class QuotaGovernor:
+    """Поминутный лимит и суточная квота запросов к внешнему API"""
+
+    def __init__(
+        self,
+        per_minute: int = WEATHER_CALLS_PER_MINUTE,
+        per_day: int = WEATHER_CALLS_PER_DAY,
+        burst: int = WEATHER_CALLS_BURST,
+    ):
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.bucket = TokenBucket(rate=per_minute / 60, capacity=min(burst, per_minute))
+        self._day = self._today()
+        self.used_today = 0
+
+        self.granted = 0
+        self.waited = 0
+        self.rejected = 0
+        self.throttled_by_upstream = 0
+
+    @staticmethod
+    def _today():
+        return datetime.now(timezone.utc).date()
+
+    def _roll_day(self):
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self.used_today = 0
+
+    @property
+    def remaining_today(self) -> int:
+        self._roll_day()
+        return max(0, self.per_day - self.used_today)
+
+    def _used_now(self) -> int:
+        """Расход за сегодня без смены дня: после полуночи он нулевой"""
+        return self.used_today if self._day == self._today() else 0
+
+    def try_acquire(self, reserve: float = 0) -> bool:
+        """Берет токен без ожидания; reserve токенов остаются другим запросам"""
+        if self.remaining_today <= 0 or not self.bucket.try_acquire(reserve=reserve):
+            return False
+        self.used_today += 1
+        self.granted += 1
+        return True
+
+    async def acquire(self, timeout: float) -> bool:
+        """Ждет токен не дольше timeout секунд"""
+        deadline = time.monotonic() + timeout
+        waited = False
+        while not self.try_acquire():
+            delay = self.bucket.time_until_available()
+            if self.remaining_today <= 0 or time.monotonic() + delay > deadline:
+                self.rejected += 1
+                return False
+            waited = True
+            await asyncio.sleep(max(delay, 0.01))
+        if waited:
+            self.waited += 1
+        return True
+
+    def penalize(self, retry_after: float):
+        """Upstream ответил 429: не отправляем запросы retry_after секунд"""
+        self.throttled_by_upstream += 1
+        self.bucket.drain(retry_after)
+
+    def snapshot(self) -> dict:
+        """Состояние бюджета для /health; только читает, вызывается из потоков"""
+        used = self._used_now()
+        return {
+            "per_minute": self.per_minute,
+            "per_day": self.per_day,
+            "tokens_available": round(self.bucket.available, 2),
+            "used_today": used,
+            "remaining_today": max(0, self.per_day - used),
+            "granted": self.granted,
+            "waited": self.waited,
+            "rejected": self.rejected,
+            "throttled_by_upstream": self.throttled_by_upstream,
+        }
+
+
+class SharedQuotaState:
+    """Бюджет запросов в разделяемой памяти: один на все процессы бота
+
+    Создается в супервизоре и передается процессам-обработчикам при запуске.
+    """
+
+    def __init__(self, ctx: Any, capacity: float):
+        # RLock: бюджет берет блокировку и вызывает методы ведра под ней
+        self.lock = ctx.RLock()
+        self.tokens = ctx.Value("d", capacity, lock=False)
+        self.updated = ctx.Value("d", time.time(), lock=False)
+        self.used_today = ctx.Value("q", 0, lock=False)
+        self.day = ctx.Value("q", QuotaGovernor._today().toordinal(), lock=False)
+
+
+class SharedTokenBucket(TokenBucket):
+    """Token bucket, состояние которого лежит в SharedQuotaState
+
+    Время берется из time.time(): monotonic у разных процессов не сравнимо.
+    """
+
+    def __init__(self, rate: float, capacity: float, state: SharedQuotaState):
+        self.rate = rate
+        self.capacity = capacity
+        self.state = state
+
+    @property
+    def tokens(self) -> float:
+        return self.state.tokens.value
+
+    @tokens.setter
+    def tokens(self, value: float):
+        self.state.tokens.value = value
+
+    def _refilled(self) -> Tuple[float, float]:
+        now = time.time()
+        refilled = self.tokens + max(0.0, now - self.state.updated.value) * self.rate
+        return min(self.capacity, refilled), now
+
+    def _refill(self):
+        self.tokens, self.state.updated.value = self._refilled()
+
+    @property
+    def available(self) -> float:
+        with self.state.lock:
+            return super().available
+
+    def try_acquire(self, tokens: float = 1, reserve: float = 0) -> bool:
+        with self.state.lock:
+            return super().try_acquire(tokens, reserve)
+
+    def time_until_available(self, tokens: float = 1) -> float:
+        with self.state.lock:
+            return super().time_until_available(tokens)
+
+    def drain(self, seconds: float = 0.0):
+        with self.state.lock:
+            super().drain(seconds)
+
+
+class SharedQuotaGovernor(QuotaGovernor):
+    """QuotaGovernor с общими для всех процессов токенами и суточным счетчиком
+
+    Счетчики granted/waited/rejected остаются у каждого процесса свои.
+    """
+
+    def __init__(
+        self,
+        state: SharedQuotaState,
+        per_minute: int = WEATHER_CALLS_PER_MINUTE,
+        per_day: int = WEATHER_CALLS_PER_DAY,
+        burst: int = WEATHER_CALLS_BURST,
+    ):
+        self.state = state
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.bucket = SharedTokenBucket(
+            rate=per_minute / 60, capacity=min(burst, per_minute), state=state
+        )
+
+        self.granted = 0
+        self.waited = 0
+        self.rejected = 0
+        self.throttled_by_upstream = 0
+
+    @property
+    def used_today(self) -> int:
+        return self.state.used_today.value
+
+    def _used_now(self) -> int:
+        with self.state.lock:
+            if self.state.day.value != self._today().toordinal():
+                return 0
+            return self.used_today
+
+    def _roll_day(self):
+        today = self._today().toordinal()
+        with self.state.lock:
+            if today != self.state.day.value:
+                self.state.day.value = today
+                self.state.used_today.value = 0
+
+    def try_acquire(self, reserve: float = 0) -> bool:
+        """Берет токен без ожидания; проверка и списание атомарны между процессами"""
+        with self.state.lock:
+            if self.remaining_today <= 0:
+                return False
+            if not self.bucket.try_acquire(reserve=reserve):
+                return False
+            self.state.used_today.value += 1
+        self.granted += 1
+        return True
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Tuple, Type, TypeVar
+
+from config import (
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    WEATHER_RETRY_ATTEMPTS,
+    WEATHER_RETRY_BASE_DELAY,
+    WEATHER_RETRY_MAX_DELAY,
+)
+from services.exceptions import CircuitOpenError
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class CircuitBreaker:
+    """Автоматический выключатель для одного внешнего эндпоинта
+
+    После failure_threshold ошибок подряд размыкается и сразу отклоняет
+    запросы. Через reset_timeout пропускает один пробный запрос
+    (полуоткрытое состояние): успех замыкает цепь, ошибка снова размыкает.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """Можно ли сейчас отправить запрос"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        # Полуоткрытое состояние: пропускаем только один пробный запрос
+        if self._probe_in_flight:
+            self.rejected += 1
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def check(self):
+        """Как allow(), но бросает CircuitOpenError"""
+        if not self.allow():
+            raise CircuitOpenError()
+
+    def release(self):
+        """Освобождает пробный слот, если запрос так и не был отправлен"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info(f"Выключатель {self.name} замкнут: сервис снова отвечает")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Выключатель {self.name} разомкнут после ошибок")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "rejected": self.rejected,
+        }
+
+
+async def retry_with_backoff(
+    func: Callable[[], Awaitable[T]],
+    retry_on: Tuple[Type[BaseException], ...],
+    no_retry_on: Tuple[Type[BaseException], ...] = (),
+    attempts: int = WEATHER_RETRY_ATTEMPTS,
+    base_delay: float = WEATHER_RETRY_BASE_DELAY,
+    max_delay: float = WEATHER_RETRY_MAX_DELAY,
+) -> T:
+    """Повторяет func при временных ошибках с экспоненциальной задержкой
+
+    Используется "полный джиттер": задержка случайна в интервале
+    [0, min(max_delay, base_delay * 2**attempt)], чтобы повторы от разных
+    запросов не приходили к API одновременно.
+    """
+    for attempt in range(attempts):
+        try:
+            return await func()
+        except no_retry_on:
+            raise
+        except retry_on as e:
+            if attempt == attempts - 1:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2**attempt))
+            logger.info(f"Повтор запроса через {delay:.2f} с после ошибки: {e!r}")
+            await asyncio.sleep(delay)
+    raise RuntimeError("attempts должно быть больше нуля")
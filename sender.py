@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramForbiddenError,
+    TelegramRetryAfter,
+)
+from aiogram.types import Message
+from config import (
+    SEND_GLOBAL_RATE,
+    SEND_PER_CHAT_BURST,
+    SEND_PER_CHAT_INTERVAL,
+    SEND_PLACEHOLDER_DELAY,
+    SEND_QUEUE_SIZE,
+    SEND_WORKERS,
+)
+from services.rate_limiter import TokenBucket
+
+
+logger = logging.getLogger(__name__)
+
+
+def reply_target(message: Message) -> Dict[str, Any]:
+    """Куда отвечать на сообщение: тема форума и бизнес-чат, как Message.answer"""
+    return {
+        "message_thread_id": (
+            message.message_thread_id if message.is_topic_message else None
+        ),
+        "business_connection_id": message.business_connection_id,
+    }
+
+
+class OutgoingMessage(NamedTuple):
+    chat_id: int
+    text: str
+    kwargs: dict
+
+
+class MessageSender:
+    """Все исходящие сообщения бота с общим лимитом Telegram и лимитом на чат
+
+    Рассылки идут через очередь (send), ответы пользователям - сразу
+    (reply, edit, reply_progress), но под теми же лимитами и паузами
+    после RetryAfter. Запросы выполняет сессия Bot, переданного в start().
+    """
+
+    def __init__(
+        self,
+        global_rate: float = SEND_GLOBAL_RATE,
+        per_chat_interval: float = SEND_PER_CHAT_INTERVAL,
+        per_chat_burst: int = SEND_PER_CHAT_BURST,
+        workers: int = SEND_WORKERS,
+        max_queue: int = SEND_QUEUE_SIZE,
+        max_attempts: int = 3,
+        placeholder_delay: float = SEND_PLACEHOLDER_DELAY,
+    ):
+        self.per_chat_interval = per_chat_interval
+        # Запас, на который расписание чата может опережать текущее время
+        self.per_chat_slack = (max(per_chat_burst, 1) - 1) * per_chat_interval
+        self.placeholder_delay = placeholder_delay
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self._bucket = TokenBucket(rate=global_rate, capacity=global_rate)
+        self._queue: "asyncio.Queue[OutgoingMessage]" = asyncio.Queue(max_queue)
+        # Расписание чата (time.monotonic): каждое сообщение сдвигает его
+        # на per_chat_interval, писать можно, пока оно опережает время
+        # не больше чем на per_chat_slack
+        self._chat_ready_at: Dict[int, float] = {}
+        # Общая пауза после RetryAfter
+        self._paused_until = 0.0
+        self._bot: Optional[Bot] = None
+        self._tasks: List[asyncio.Task] = []
+
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+        self.edited = 0
+        self.placeholders_skipped = 0
+
+    def set_global_rate(self, rate: float):
+        """Меняет общий лимит, например, чтобы поделить его между процессами"""
+        self._bucket = TokenBucket(rate=rate, capacity=rate)
+
+    async def start(self, bot: Bot):
+        self._bot = bot
+        self._tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+
+    async def close(self, timeout: float = 10):
+        """Дожидается отправки очереди (не дольше timeout) и останавливает воркеры"""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Не отправлено сообщений при остановке: {self._queue.qsize()}"
+            )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def send_nowait(self, chat_id: int, text: str, **kwargs) -> bool:
+        """Ставит сообщение в очередь; False, если очередь переполнена"""
+        try:
+            self._queue.put_nowait(OutgoingMessage(chat_id, text, kwargs))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def send(self, chat_id: int, text: str, **kwargs):
+        """Ставит сообщение в очередь, ожидая свободного места"""
+        await self._queue.put(OutgoingMessage(chat_id, text, kwargs))
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._deliver(item)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Ошибка отправки в чат {item.chat_id}: {e!r}")
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, item: OutgoingMessage):
+        await self._call(
+            item.chat_id,
+            lambda: self._bot.send_message(item.chat_id, item.text, **item.kwargs),
+        )
+
+    async def _call(self, chat_id: int, request: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполняет запрос к Telegram под лимитами; None, если он не удался"""
+        for _ in range(self.max_attempts):
+            await self._wait_turn(chat_id)
+            try:
+                result = await request()
+                self.sent += 1
+                return result
+            except TelegramRetryAfter as e:
+                # Telegram просит паузу: останавливаем все отправки
+                self.retried += 1
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + e.retry_after
+                )
+                logger.warning(f"Flood control Telegram: пауза {e.retry_after} с")
+            except TelegramForbiddenError:
+                # Пользователь заблокировал бота - повторять бессмысленно
+                self.failed += 1
+                return None
+            except TelegramAPIError as e:
+                self.failed += 1
+                logger.error(f"Telegram отклонил запрос в чат {chat_id}: {e}")
+                return None
+        self.failed += 1
+        return None
+
+    async def reply(self, chat_id: int, text: str, **kwargs) -> Optional[Message]:
+        """Отправляет ответ без очереди; None, если отправить не удалось"""
+        return await self._call(
+            chat_id, lambda: self._bot.send_message(chat_id, text, **kwargs)
+        )
+
+    async def edit(
+        self, chat_id: int, message_id: int, text: str, **kwargs
+    ) -> Optional[Any]:
+        """Заменяет текст уже отправленного сообщения"""
+        result = await self._call(
+            chat_id,
+            lambda: self._bot.edit_message_text(
+                text=text, chat_id=chat_id, message_id=message_id, **kwargs
+            ),
+        )
+        if result is not None:
+            self.edited += 1
+        return result
+
+    async def reply_progress(
+        self,
+        chat_id: int,
+        placeholder: str,
+        result: Awaitable[str],
+        message_thread_id: Optional[int] = None,
+        business_connection_id: Optional[str] = None,
+        **kwargs,
+    ) -> Optional[Any]:
+        """Ответ на долгий запрос: заглушка, а потом правка ее на месте
+
+        Если результат готов за placeholder_delay (например, из кэша),
+        заглушка не отправляется и ответ уходит одним сообщением.
+        """
+        target = {
+            "message_thread_id": message_thread_id,
+            "business_connection_id": business_connection_id,
+        }
+        task = asyncio.ensure_future(result)
+        try:
+            done, _ = await asyncio.wait({task}, timeout=self.placeholder_delay)
+            if task in done:
+                self.placeholders_skipped += 1
+                return await self.reply(chat_id, task.result(), **target, **kwargs)
+
+            sent = await self.reply(chat_id, placeholder, **target)
+            text = await task
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        if sent is None:
+            return await self.reply(chat_id, text, **target, **kwargs)
+        # Правка адресуется по id сообщения, тема форума ей не нужна
+        edited = await self.edit(
+            chat_id,
+            sent.message_id,
+            text,
+            business_connection_id=business_connection_id,
+            **kwargs,
+        )
+        if edited is None:
+            # Заглушку удалили или правку отклонили: ответ не должен пропасть
+            return await self.reply(chat_id, text, **target, **kwargs)
+        return edited
+
+    async def _wait_turn(self, chat_id: int):
+        """Ждет, пока отправку разрешают и общий лимит, и лимит чата"""
+        while True:
+            now = time.monotonic()
+            ready_at = self._chat_ready_at.get(chat_id, 0.0)
+            delay = max(
+                self._paused_until - now,
+                ready_at - self.per_chat_slack - now,
+                self._bucket.time_until_available(),
+            )
+            if delay <= 0 and self._bucket.try_acquire():
+                break
+            await asyncio.sleep(max(delay, 0.005))
+
+        self._chat_ready_at[chat_id] = max(ready_at, now) + self.per_chat_interval
+        if len(self._chat_ready_at) > 50000:
+            self._chat_ready_at = {
+                chat: ready
+                for chat, ready in self._chat_ready_at.items()
+                if ready > now
+            }
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "edited": self.edited,
+            "placeholders_skipped": self.placeholders_skipped,
+        }
+
+
+# Создаем экземпляр очереди для импорта
+message_sender = MessageSender()
@@ -0,0 +1,129 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import sqlite3
+import time
+from typing import Any, List, Optional, Tuple
+
+from config import SHARED_CACHE_PATH, WEATHER_CACHE_STALE_TTL, WEATHER_CACHE_TTL
+
+
+logger = logging.getLogger(__name__)
+
+
+class SharedWeatherCache:
+    """Кэш погоды второго уровня в SQLite, общий для процессов бота
+
+    Процесс сначала смотрит в свой WeatherCache, затем сюда и только потом
+    идет в API, так что город, загруженный одним процессом, не запрашивается
+    повторно остальными. Время хранится по часам системы (time.time()).
+    """
+
+    def __init__(
+        self,
+        path: str = SHARED_CACHE_PATH,
+        max_age: float = WEATHER_CACHE_TTL + WEATHER_CACHE_STALE_TTL,
+    ):
+        self.path = path
+        self.max_age = max_age
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="shared-cache"
+        )
+
+        self.hits = 0
+        self.misses = 0
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def start(self):
+        await self._run(self._open)
+
+    def _open(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute("PRAGMA busy_timeout=2000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS weather_cache ("
+            "key TEXT PRIMARY KEY, "
+            "stored_at REAL NOT NULL, "
+            "payload TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS weather_cache_stored_at "
+            "ON weather_cache (stored_at)"
+        )
+        self._conn.commit()
+
+    async def close(self):
+        if self._conn is not None:
+            await self._run(self._purge)
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+    async def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Возвращает (значение, возраст в секундах) или None"""
+        try:
+            row = await self._run(self._get, key)
+        except sqlite3.Error as e:
+            logger.warning(f"Общий кэш недоступен: {e!r}")
+            return None
+        if row is None:
+            self.misses += 1
+            return None
+        stored_at, payload = row
+        age = max(0.0, time.time() - stored_at)
+        if age > self.max_age:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(payload), age
+
+    def _get(self, key: str) -> Optional[Tuple[float, str]]:
+        return self._conn.execute(
+            "SELECT stored_at, payload FROM weather_cache WHERE key = ?", (key,)
+        ).fetchone()
+
+    async def changed_since(self, since: float) -> List[Tuple[str, float, Any]]:
+        """Записи, сохраненные позже since: (ключ, время записи, значение)"""
+        try:
+            rows = await self._run(self._changed_since, since)
+        except sqlite3.Error as e:
+            logger.warning(f"Общий кэш недоступен: {e!r}")
+            return []
+        return [(key, stored_at, json.loads(row)) for key, stored_at, row in rows]
+
+    def _changed_since(self, since: float) -> List[Tuple[str, float, str]]:
+        return self._conn.execute(
+            "SELECT key, stored_at, payload FROM weather_cache WHERE stored_at > ?",
+            (since,),
+        ).fetchall()
+
+    async def set(self, key: str, value: Any):
+        try:
+            await self._run(self._set, key, json.dumps(value))
+        except sqlite3.Error as e:
+            logger.warning(f"Не удалось записать в общий кэш: {e!r}")
+
+    def _set(self, key: str, payload: str):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO weather_cache (key, stored_at, payload) "
+                "VALUES (?, ?, ?)",
+                (key, time.time(), payload),
+            )
+
+    def _purge(self):
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM weather_cache WHERE stored_at < ?",
+                (time.time() - self.max_age,),
+            )
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,53 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, TypeVar
+
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Объединяет одновременные вызовы с одинаковым ключом в один"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        # Счетчики: реальные вызовы и вызовы, присоединившиеся к уже идущему
+        self.calls = 0
+        self.deduplicated = 0
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._inflight
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        """Выполняет func один раз на ключ; остальные ждут тот же результат"""
+        # shield: отмена одного ожидающего не отменяет общий запрос
+        return await asyncio.shield(self.start(key, func))
+
+    def start(self, key: str, func: Callable[[], Awaitable[T]]) -> asyncio.Future:
+        """Как do(), но сразу занимает ключ и возвращает future без ожидания"""
+        future = self._inflight.get(key)
+        if future is not None:
+            self.deduplicated += 1
+            return future
+        self.calls += 1
+        future = asyncio.ensure_future(func())
+        self._inflight[key] = future
+        future.add_done_callback(lambda f: self._forget(key, f))
+        return future
+
+    def _forget(self, key: str, future: asyncio.Future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # Забираем исключение, даже если все ожидающие были отменены
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> dict:
+        return {
+            "inflight": len(self._inflight),
+            "calls": self.calls,
+            "deduplicated": self.deduplicated,
+        }
@@ -0,0 +1,311 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import logging
+import sqlite3
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+
+from config import (
+    SUBSCRIPTION_CONCURRENCY,
+    SUBSCRIPTION_DELIVERY_WINDOW,
+    SUBSCRIPTION_RETRY_INTERVAL,
+    SUBSCRIPTION_TIMEZONE,
+    USER_DB_PATH,
+)
+from services.exceptions import WeatherError
+from services.weather_service import WeatherQuery, WeatherService, weather_service
+
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionStore:
+    """Подписки чатов на ежедневную погоду: SQLite и индекс по минуте суток"""
+
+    def __init__(self, path: str = USER_DB_PATH):
+        self.path = path
+        # В многопроцессном режиме подписки меняют и другие процессы,
+        # поэтому минуту перед рассылкой перечитываем из базы
+        self.shared = False
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="subscriptions"
+        )
+        # минута суток -> {chat_id: город}
+        self._by_minute: Dict[int, Dict[int, str]] = {}
+        # chat_id -> минута суток
+        self._chat_minute: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._chat_minute)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def start(self):
+        """Открывает базу и загружает все подписки в память"""
+        rows = await self._run(self._open)
+        for chat_id, city, minute in rows:
+            self._index(chat_id, city, minute)
+        logger.info(f"Загружено подписок: {len(rows)}")
+
+    def _open(self) -> List[Tuple[int, str, int]]:
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS subscriptions ("
+            "chat_id INTEGER PRIMARY KEY, "
+            "city TEXT NOT NULL, "
+            "minute INTEGER NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS subscriptions_minute ON subscriptions (minute)"
+        )
+        self._conn.commit()
+        return self._conn.execute(
+            "SELECT chat_id, city, minute FROM subscriptions"
+        ).fetchall()
+
+    async def close(self):
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+    async def subscribe(self, chat_id: int, city: str, minute: int):
+        """Создает или заменяет подписку чата"""
+        await self._run(self._save, chat_id, city, minute)
+        self._unindex(chat_id)
+        self._index(chat_id, city, minute)
+
+    def _save(self, chat_id: int, city: str, minute: int):
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO subscriptions (chat_id, city, minute, created_at) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT(chat_id) DO UPDATE SET "
+                "city = excluded.city, minute = excluded.minute",
+                (chat_id, city, minute, time.time()),
+            )
+
+    async def unsubscribe(self, chat_id: int) -> bool:
+        """Удаляет подписку; False, если ее не было"""
+        if chat_id not in self._chat_minute:
+            return False
+        await self._run(self._delete, chat_id)
+        self._unindex(chat_id)
+        return True
+
+    def _delete(self, chat_id: int):
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM subscriptions WHERE chat_id = ?", (chat_id,)
+            )
+
+    def get(self, chat_id: int) -> Optional[Tuple[str, int]]:
+        minute = self._chat_minute.get(chat_id)
+        if minute is None:
+            return None
+        return self._by_minute[minute][chat_id], minute
+
+    async def reload_minute(self, minute: int):
+        """Перечитывает из базы подписчиков минуты minute (только в shared)"""
+        if not self.shared:
+            return
+        rows = await self._run(self._load_minute, minute)
+        for chat_id in list(self._by_minute.get(minute, {})):
+            self._unindex(chat_id)
+        for chat_id, city in rows:
+            self._unindex(chat_id)
+            self._index(chat_id, city, minute)
+
+    def _load_minute(self, minute: int) -> List[Tuple[int, str]]:
+        return self._conn.execute(
+            "SELECT chat_id, city FROM subscriptions WHERE minute = ?", (minute,)
+        ).fetchall()
+
+    def due(self, minute: int) -> Dict[int, str]:
+        """Подписчики, которым пора отправить погоду: {chat_id: город}"""
+        return self._by_minute.get(minute, {})
+
+    def _index(self, chat_id: int, city: str, minute: int):
+        self._by_minute.setdefault(minute, {})[chat_id] = city
+        self._chat_minute[chat_id] = minute
+
+    def _unindex(self, chat_id: int):
+        minute = self._chat_minute.pop(chat_id, None)
+        if minute is not None:
+            slot = self._by_minute[minute]
+            slot.pop(chat_id, None)
+            if not slot:
+                del self._by_minute[minute]
+
+
+class SubscriptionScheduler:
+    """Раз в минуту рассылает погоду подписчикам, запрашивая каждый город один раз"""
+
+    def __init__(
+        self,
+        store: SubscriptionStore,
+        service: WeatherService,
+        timezone: str = SUBSCRIPTION_TIMEZONE,
+        concurrency: int = SUBSCRIPTION_CONCURRENCY,
+        delivery_window: float = SUBSCRIPTION_DELIVERY_WINDOW,
+        retry_interval: float = SUBSCRIPTION_RETRY_INTERVAL,
+    ):
+        self.store = store
+        self.service = service
+        self.timezone = ZoneInfo(timezone)
+        self.concurrency = concurrency
+        self.delivery_window = delivery_window
+        self.retry_interval = retry_interval
+        self._sender = None
+        self._task: Optional[asyncio.Task] = None
+        self._slots: Set[asyncio.Task] = set()
+
+        self.slots_run = 0
+        self.messages_queued = 0
+        self.cities_fetched = 0
+        self.cities_failed = 0
+        self.retries = 0
+
+    async def start(self, sender):
+        """sender - очередь исходящих сообщений с методом send()"""
+        self._sender = sender
+        self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        tasks = list(self._slots)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _now(self) -> datetime:
+        return datetime.now(self.timezone)
+
+    async def _loop(self):
+        last = self._now().replace(second=0, microsecond=0)
+        while True:
+            next_slot = last + timedelta(minutes=1)
+            await asyncio.sleep(max(0.0, (next_slot - self._now()).total_seconds()))
+            # Если цикл проснулся с опозданием, догоняем пропущенные минуты;
+            # минуты идут задачами, чтобы долгая рассылка не задерживала следующую
+            current = self._now().replace(second=0, microsecond=0)
+            while last < current:
+                last += timedelta(minutes=1)
+                task = asyncio.create_task(self._run_slot_logged(last))
+                self._slots.add(task)
+                task.add_done_callback(self._slots.discard)
+
+    async def _run_slot_logged(self, slot: datetime):
+        try:
+            await self.run_slot(slot.hour * 60 + slot.minute)
+        except Exception as e:
+            logger.error(f"Ошибка рассылки за {slot:%H:%M}: {e!r}")
+
+    async def run_slot(self, minute: int):
+        """Рассылает погоду всем подписчикам минуты minute
+
+        Города загружаются фоновыми запросами (по id пачками /group), которые
+        не ждут бюджет и оставляют резерв пользователям; недозагруженные
+        повторяются до конца окна рассылки, после чего запрашиваются обычным
+        путем с последними известными данными. Подписчик получает либо
+        погоду, либо сообщение об ошибке.
+        """
+        await self.store.reload_minute(minute)
+        due = self.store.due(minute)
+        if not due:
+            return
+        self.slots_run += 1
+
+        # Группируем подписчиков по ключу кэша: один запрос на город
+        pending: Dict[str, Tuple[str, WeatherQuery, List[int]]] = {}
+        for chat_id, city in list(due.items()):
+            try:
+                query = self.service.resolve(city)
+            except WeatherError as e:
+                logger.warning(f"Рассылка: город {city!r} не распознан: {e}")
+                self.cities_failed += 1
+                await self._send(chat_id, str(e))
+                continue
+            pending.setdefault(query.key, (city, query, []))[2].append(chat_id)
+        cities = len(pending)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.delivery_window
+        await self._deliver_cached(pending)
+        while pending and loop.time() < deadline:
+            await self.service.refresh_many([query for _, query, _ in pending.values()])
+            await self._deliver_cached(pending)
+            if pending:
+                self.retries += 1
+                await asyncio.sleep(
+                    min(self.retry_interval, max(0.0, deadline - loop.time()))
+                )
+
+        # Окно вышло: последняя попытка с ожиданием бюджета и запасными данными
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def deliver(city: str, chats: List[int]):
+            async with semaphore:
+                try:
+                    text = await self.service.get_weather(city)
+                except WeatherError as e:
+                    logger.warning(f"Рассылка для {city} не удалась: {e}")
+                    self.cities_failed += 1
+                    for chat_id in chats:
+                        await self._send(chat_id, str(e))
+                    return
+            self.cities_fetched += 1
+            await self._send_weather(chats, text)
+
+        await asyncio.gather(
+            *(deliver(city, chats) for city, _, chats in pending.values())
+        )
+        logger.info(
+            f"Рассылка {minute // 60:02d}:{minute % 60:02d}: "
+            f"подписчиков {len(due)}, городов {cities}"
+        )
+
+    async def _deliver_cached(
+        self, pending: Dict[str, Tuple[str, WeatherQuery, List[int]]]
+    ):
+        """Отправляет и убирает из pending города, свежие данные которых уже в кэше"""
+        for key, (_, query, chats) in list(pending.items()):
+            text = self.service.cached_weather(query)
+            if text is None:
+                continue
+            del pending[key]
+            self.cities_fetched += 1
+            await self._send_weather(chats, text)
+
+    async def _send_weather(self, chats: List[int], text: str):
+        text = f"☀️ <b>Ежедневная погода</b>\n\n{text}"
+        for chat_id in chats:
+            await self._send(chat_id, text)
+
+    async def _send(self, chat_id: int, text: str):
+        await self._sender.send(chat_id, text)
+        self.messages_queued += 1
+
+    def stats(self) -> dict:
+        return {
+            "subscriptions": len(self.store),
+            "slots_run": self.slots_run,
+            "cities_fetched": self.cities_fetched,
+            "cities_failed": self.cities_failed,
+            "retries": self.retries,
+            "messages_queued": self.messages_queued,
+        }
+
+
+# Создаем экземпляры для импорта
+subscription_store = SubscriptionStore()
+subscription_scheduler = SubscriptionScheduler(subscription_store, weather_service)
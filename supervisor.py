@@ -0,0 +1,486 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import aiohttp
+from aiohttp import web
+from config import (
+    BOT_MODE,
+    PORT,
+    SEND_GLOBAL_RATE,
+    TELEGRAM_API_URL,
+    TG_KEY,
+    WEATHER_CALLS_BURST,
+    WEATHER_CALLS_PER_MINUTE,
+    WEBHOOK_BASE_URL,
+    WEBHOOK_HOST,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WORKER_DRAIN_TIMEOUT,
+    WORKER_METRICS_INTERVAL,
+)
+from services.rate_limiter import SharedQuotaGovernor, SharedQuotaState
+
+
+logger = logging.getLogger(__name__)
+
+# Как часто супервизор проверяет, живы ли процессы-обработчики
+WORKER_CHECK_INTERVAL = 2
+# Таймаут long polling запроса getUpdates, секунды
+POLL_TIMEOUT = 25
+
+
+def update_chat_id(update: dict) -> int:
+    """Чат, к которому относится обновление; по нему выбирается процесс
+
+    Все обновления одного чата попадают в один процесс, поэтому их порядок
+    сохраняется. Города, сохраненные в другом процессе (например, в группе
+    и в личном чате), кэш настроек подтягивает при сверке с базой.
+    """
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or value.get("message", {}).get("chat")
+        if chat:
+            return chat["id"]
+        sender = value.get("from")
+        if sender:
+            return sender["id"]
+    return update.get("update_id", 0)
+
+
+def merge_worker_metrics(texts: Dict[int, str]) -> List[str]:
+    """Метрики процессов в одном ответе /metrics с меткой worker
+
+    Формат Prometheus требует, чтобы строки одной метрики шли подряд после
+    ее HELP и TYPE, поэтому строки всех процессов группируются по метрикам.
+    """
+    headers: Dict[str, List[str]] = {}
+    samples: Dict[str, List[str]] = {}
+    for index, text in sorted(texts.items()):
+        family = ""
+        for line in text.splitlines():
+            if line.startswith("# HELP ") or line.startswith("# TYPE "):
+                family = line.split(" ", 3)[2]
+                header = headers.setdefault(family, [])
+                if len(header) < 2 and line not in header:
+                    header.append(line)
+                continue
+            if not line or line.startswith("#"):
+                continue
+            series, _, value = line.rpartition(" ")
+            if series.endswith("}"):
+                series = f'{series[:-1]},worker="{index}"}}'
+            else:
+                series = f'{series}{{worker="{index}"}}'
+            samples.setdefault(family, []).append(f"{series} {value}")
+
+    lines = []
+    for family in dict.fromkeys([*headers, *samples]):
+        lines.extend(headers.get(family, ()))
+        lines.extend(samples.get(family, ()))
+    return lines
+
+
+class ChatSequencer:
+    """Обрабатывает обновления параллельно, но в пределах чата - по порядку"""
+
+    def __init__(self):
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._pending: Dict[int, int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def submit(self, chat_id: int, coro):
+        task = asyncio.create_task(self._run(chat_id, coro))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, chat_id: int, coro):
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        self._pending[chat_id] = self._pending.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                await coro
+        except Exception as e:
+            logger.error(f"Ошибка обработки обновления чата {chat_id}: {e!r}")
+        finally:
+            self._pending[chat_id] -= 1
+            if not self._pending[chat_id]:
+                del self._pending[chat_id]
+                del self._locks[chat_id]
+
+    async def drain(self, timeout: float):
+        """Ждет завершения начатой обработки не дольше timeout"""
+        if not self._tasks:
+            return
+        done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        if pending:
+            logger.warning(f"Не дождались обработки обновлений: {len(pending)}")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def _push_metrics(index: int, metrics: Any):
+    """Периодически отдает супервизору метрики процесса для его /metrics"""
+    from web.health import metrics_text
+
+    while True:
+        metrics.put((index, metrics_text()))
+        await asyncio.sleep(WORKER_METRICS_INTERVAL)
+
+
+async def _worker_main(
+    index: int,
+    workers: int,
+    updates: Any,
+    quota_state: SharedQuotaState,
+    metrics: Any,
+):
+    from aiogram import Dispatcher
+    from aiogram.types import Update
+    from bot.sender import message_sender
+    from main import create_bot, setup_handlers, start_services, stop_services
+    from services.alerts import alert_store
+    from services.archive import weather_archive
+    from services.metrics import runtime
+    from services.rate_limiter import SharedQuotaGovernor
+    from services.shared_cache import SharedWeatherCache
+    from services.subscriptions import subscription_store
+    from services.user_store import user_store
+    from services.weather_service import weather_service
+
+    # Бюджет OpenWeatherMap и лимит отправки Telegram общие на все процессы
+    weather_service.quota = SharedQuotaGovernor(quota_state)
+    weather_service.shared_cache = SharedWeatherCache()
+    await weather_service.shared_cache.start()
+    message_sender.set_global_rate(SEND_GLOBAL_RATE / workers)
+    subscription_store.shared = True
+    alert_store.shared = True
+    user_store.shared = True
+    weather_archive.shared = True
+
+    bot = create_bot()
+    dp = Dispatcher()
+    setup_handlers(dp)
+    # Рассылку и прогрев кэша выполняет только первый процесс
+    await start_services(bot, background=index == 0)
+    runtime.mark_running(f"worker-{index}")
+    logger.info(f"Обработчик {index} запущен (pid {os.getpid()})")
+
+    sequencer = ChatSequencer()
+    loop = asyncio.get_running_loop()
+    metrics_task = asyncio.create_task(_push_metrics(index, metrics))
+    try:
+        while True:
+            raw = await loop.run_in_executor(None, updates.get)
+            if raw is None:
+                break
+            try:
+                update = Update.model_validate(raw, context={"bot": bot})
+            except Exception as e:
+                logger.error(f"Некорректное обновление {raw.get('update_id')}: {e!r}")
+                continue
+            sequencer.submit(update_chat_id(raw), dp.feed_update(bot, update))
+        logger.info(f"Обработчик {index} завершает работу: {len(sequencer)} в работе")
+        await sequencer.drain(WORKER_DRAIN_TIMEOUT)
+    finally:
+        metrics_task.cancel()
+        # Не ждать при выходе, пока супервизор дочитает очередь метрик
+        metrics.cancel_join_thread()
+        await stop_services()
+        await weather_service.shared_cache.close()
+        await bot.session.close()
+
+
+def worker_entry(
+    index: int, workers: int, updates: Any, quota_state: Any, metrics: Any
+):
+    """Точка входа процесса-обработчика"""
+    logging.basicConfig(level=logging.INFO)
+    # Остановкой управляет супервизор через очередь
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(_worker_main(index, workers, updates, quota_state, metrics))
+
+
+class WorkerSlot:
+    """Процесс-обработчик и его очередь обновлений"""
+
+    def __init__(self, process: Any, queue: Any):
+        self.process = process
+        self.queue = queue
+        self.routed = 0
+
+
+class Supervisor:
+    """Принимает обновления Telegram и раздает их процессам по chat id"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.ctx = multiprocessing.get_context("spawn")
+        self.quota_state = SharedQuotaState(
+            self.ctx, capacity=min(WEATHER_CALLS_BURST, WEATHER_CALLS_PER_MINUTE)
+        )
+        # Только для чтения общего бюджета в /health
+        self.quota = SharedQuotaGovernor(self.quota_state)
+        # Процессы присылают сюда свои метрики: (номер, текст Prometheus)
+        self.metrics_queue = self.ctx.Queue()
+        self.worker_metrics: Dict[int, Tuple[str, float]] = {}
+        self.slots: List[Optional[WorkerSlot]] = [None] * workers
+        self.started_at = 0.0
+        self.last_poll_at = 0.0
+        self.restarts = 0
+        self._stopping = asyncio.Event()
+        self._restarting = False
+
+    def _spawn(self, index: int, queue: Any = None) -> WorkerSlot:
+        queue = queue if queue is not None else self.ctx.Queue()
+        process = self.ctx.Process(
+            target=worker_entry,
+            args=(index, self.workers, queue, self.quota_state, self.metrics_queue),
+            name=f"weather-bot-worker-{index}",
+        )
+        process.start()
+        return WorkerSlot(process, queue)
+
+    def route(self, update: dict):
+        slot = self.slots[update_chat_id(update) % self.workers]
+        slot.routed += 1
+        slot.queue.put(update)
+
+    async def _join(self, slot: WorkerSlot, timeout: float):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, slot.process.join, timeout)
+        if slot.process.is_alive():
+            logger.warning(f"{slot.process.name} не завершился, останавливаем")
+            slot.process.terminate()
+            await loop.run_in_executor(None, slot.process.join, 5)
+
+    async def rolling_restart(self):
+        """Перезапускает процессы по одному, не теряя обновлений
+
+        Новый процесс получает свежую очередь сразу, старый дорабатывает
+        свою. Порядок обновлений одного чата на стыке не гарантируется.
+        """
+        if self._restarting:
+            return
+        self._restarting = True
+        try:
+            for index in range(self.workers):
+                old = self.slots[index]
+                self.slots[index] = self._spawn(index)
+                old.queue.put(None)
+                await self._join(old, WORKER_DRAIN_TIMEOUT + 10)
+                self.restarts += 1
+            logger.info("Перезапуск обработчиков завершен")
+        finally:
+            self._restarting = False
+
+    async def _watch_workers(self):
+        """Поднимает упавшие процессы с той же очередью"""
+        while not self._stopping.is_set():
+            await asyncio.sleep(WORKER_CHECK_INTERVAL)
+            if self._restarting:
+                continue
+            for index, slot in enumerate(self.slots):
+                if not self._stopping.is_set() and not slot.process.is_alive():
+                    logger.error(
+                        f"{slot.process.name} завершился с кодом "
+                        f"{slot.process.exitcode}, перезапускаем"
+                    )
+                    self.slots[index] = self._spawn(index, slot.queue)
+                    self.restarts += 1
+
+    async def _collect_metrics(self):
+        """Принимает метрики процессов; None в очереди останавливает прием"""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await loop.run_in_executor(None, self.metrics_queue.get)
+            if item is None:
+                return
+            index, text = item
+            self.worker_metrics[index] = (text, time.time())
+
+    def metrics_lines(self) -> List[str]:
+        """Метрики супервизора и последние метрики каждого процесса"""
+        now = time.time()
+        lines = ["# TYPE bot_worker_alive gauge"]
+        for index, slot in enumerate(self.slots):
+            alive = 1 if slot.process.is_alive() else 0
+            lines.append(f'bot_worker_alive{{worker="{index}"}} {alive}')
+        lines.append("# TYPE bot_worker_routed_updates gauge")
+        for index, slot in enumerate(self.slots):
+            lines.append(f'bot_worker_routed_updates{{worker="{index}"}} {slot.routed}')
+        lines.append("# TYPE bot_worker_metrics_age_seconds gauge")
+        for index, (_, received_at) in sorted(self.worker_metrics.items()):
+            age = round(now - received_at, 3)
+            lines.append(f'bot_worker_metrics_age_seconds{{worker="{index}"}} {age}')
+        lines.append("# TYPE bot_worker_restarts gauge")
+        lines.append(f"bot_worker_restarts {self.restarts}")
+        texts = {index: text for index, (text, _) in self.worker_metrics.items()}
+        lines.extend(merge_worker_metrics(texts))
+        return lines
+
+    def _quota_snapshot(self) -> dict:
+        snapshot = self.quota.snapshot()
+        # Счетчики запросов у каждого процесса свои (см. /metrics), здесь их нет
+        for key in ("granted", "waited", "rejected", "throttled_by_upstream"):
+            del snapshot[key]
+        return snapshot
+
+    async def _poll(self, session: aiohttp.ClientSession):
+        """Long polling в супервизоре: getUpdates без разбора обновлений"""
+        api = f"{TELEGRAM_API_URL}/bot{TG_KEY}"
+        async with session.post(
+            f"{api}/deleteWebhook", json={"drop_pending_updates": True}
+        ) as response:
+            await response.read()
+
+        offset = 0
+        delay = 1.0
+        while not self._stopping.is_set():
+            try:
+                async with session.post(
+                    f"{api}/getUpdates",
+                    json={"offset": offset, "timeout": POLL_TIMEOUT},
+                    timeout=aiohttp.ClientTimeout(total=POLL_TIMEOUT + 10),
+                ) as response:
+                    payload = await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"getUpdates не удался: {e!r}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+                continue
+            if not payload.get("ok"):
+                logger.error(f"getUpdates вернул ошибку: {payload}")
+                await asyncio.sleep(payload.get("parameters", {}).get("retry_after", 5))
+                continue
+            delay = 1.0
+            self.last_poll_at = time.time()
+            for update in payload["result"]:
+                offset = update["update_id"] + 1
+                self.route(update)
+
+    async def _webhook(self, request: web.Request) -> web.Response:
+        secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token")
+        if WEBHOOK_SECRET and secret != WEBHOOK_SECRET:
+            return web.Response(status=401)
+        self.route(await request.json())
+        return web.Response()
+
+    def _health_payload(self) -> Tuple[dict, int]:
+        alive = [slot.process.is_alive() for slot in self.slots]
+        if BOT_MODE == "polling":
+            receiving = time.time() - self.last_poll_at < POLL_TIMEOUT + 35
+        else:
+            receiving = True
+        ready = all(alive) and receiving
+        payload = {
+            "status": "healthy" if ready else "unavailable",
+            "mode": f"{BOT_MODE}/supervisor",
+            "checks": {"workers_alive": all(alive), "receiving_updates": receiving},
+            "workers": [
+                {
+                    "pid": slot.process.pid,
+                    "alive": is_alive,
+                    "routed": slot.routed,
+                }
+                for slot, is_alive in zip(self.slots, alive)
+            ],
+            "restarts": self.restarts,
+            "quota": self._quota_snapshot(),
+            "uptime": round(time.time() - self.started_at),
+        }
+        return payload, 200 if ready else 503
+
+    async def _home(self, request: web.Request) -> web.Response:
+        return web.Response(text="🤖 Weather Bot is running!")
+
+    async def _health(self, request: web.Request) -> web.Response:
+        payload, status = self._health_payload()
+        return web.json_response(payload, status=status)
+
+    async def _ping(self, request: web.Request) -> web.Response:
+        return web.Response(text="pong")
+
+    async def _metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text="\n".join(self.metrics_lines()) + "\n",
+            content_type="text/plain",
+            charset="utf-8",
+        )
+
+    def _create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/", self._home)
+        app.router.add_get("/health", self._health)
+        app.router.add_get("/ping", self._ping)
+        app.router.add_get("/metrics", self._metrics)
+        if BOT_MODE == "webhook":
+            app.router.add_post(WEBHOOK_PATH, self._webhook)
+        return app
+
+    async def run(self):
+        self.started_at = time.time()
+        self.slots = [self._spawn(index) for index in range(self.workers)]
+        logger.info(f"Запущено обработчиков: {self.workers}")
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._stopping.set)
+        loop.add_signal_handler(
+            signal.SIGHUP, lambda: asyncio.ensure_future(self.rolling_restart())
+        )
+
+        runner = web.AppRunner(self._create_app())
+        await runner.setup()
+        await web.TCPSite(runner, WEBHOOK_HOST, PORT).start()
+
+        session = aiohttp.ClientSession()
+        tasks = [asyncio.create_task(self._watch_workers())]
+        collector = asyncio.create_task(self._collect_metrics())
+        try:
+            if BOT_MODE == "webhook":
+                params = {"url": f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}"}
+                if WEBHOOK_SECRET:
+                    params["secret_token"] = WEBHOOK_SECRET
+                async with session.post(
+                    f"{TELEGRAM_API_URL}/bot{TG_KEY}/setWebhook", json=params
+                ) as response:
+                    logger.info(f"setWebhook: {await response.text()}")
+            else:
+                tasks.append(asyncio.create_task(self._poll(session)))
+            await self._stopping.wait()
+        finally:
+            logger.info("Останавливаем прием обновлений и обработчики...")
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await runner.cleanup()
+            await session.close()
+            await self.shutdown()
+            # Поток, ждущий очередь метрик, отмена не прерывает
+            self.metrics_queue.put(None)
+            await collector
+
+    async def shutdown(self):
+        """Просит процессы доработать очереди и ждет их завершения"""
+        for slot in self.slots:
+            slot.queue.put(None)
+        await asyncio.gather(
+            *(self._join(slot, WORKER_DRAIN_TIMEOUT + 10) for slot in self.slots)
+        )
+        logger.info("Все обработчики остановлены")
+
+
+def run_supervisor(workers: int):
+    """Запускает бота в workers процессах под управлением супервизора"""
+    asyncio.run(Supervisor(workers).run())
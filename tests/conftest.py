@@ -0,0 +1,47 @@
+import os
+import sys
+import types
+
+import pytest
+
+
+# config.py требует токены при импорте; тестам хватает заглушек
+os.environ.setdefault("TG_KEY", "123456:test")
+os.environ.setdefault("API_KEY", "test")
+
+# Модули лежат в корне репозитория, но импортируют друг друга как пакеты
+# bot, services и web; без каталогов пакетов собираем их из корня
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+for package in ("bot", "services", "web"):
+    if package not in sys.modules and not os.path.isdir(os.path.join(ROOT, package)):
+        module = types.ModuleType(package)
+        module.__path__ = [ROOT]
+        sys.modules[package] = module
+
+
+@pytest.fixture(autouse=True)
+def fresh_singletons(monkeypatch):
+    """Общие экземпляры получают пустые кэши и восстанавливаются после теста"""
+    from bot.sender import message_sender
+    from services.hot_cities import HotCityTracker
+    from services.weather_cache import WeatherCache
+    from services.weather_service import weather_service
+
+    for name in ("cache", "forecasts", "_not_found"):
+        cache = getattr(weather_service, name)
+        monkeypatch.setattr(
+            weather_service,
+            name,
+            WeatherCache(cache.maxsize, cache.ttl, cache.stale_ttl),
+        )
+    tracker = weather_service.hot_cities
+    monkeypatch.setattr(
+        weather_service,
+        "hot_cities",
+        HotCityTracker(tracker.half_life, tracker.max_keys),
+    )
+    monkeypatch.setattr(weather_service, "quota", weather_service.quota)
+    monkeypatch.setattr(weather_service, "shared_cache", weather_service.shared_cache)
+    monkeypatch.setattr(message_sender, "_bot", message_sender._bot)
@@ -0,0 +1,112 @@
+import asyncio
+import random
+
+from services.alerts import AlertEvaluator, AlertStore, ThresholdBucket
+from services.shared_cache import SharedWeatherCache
+from services.weather_model import WeatherReading
+from services.weather_service import WeatherService, weather_service
+
+
+def test_build_matches_incremental_add():
+    rng = random.Random(1)
+    thresholds = [float(rng.randint(-30, 30)) for _ in range(500)]
+    rule_ids = list(range(500))
+    for op in ("<", ">"):
+        incremental = ThresholdBucket(op)
+        for rule_id, threshold in zip(rule_ids, thresholds):
+            incremental.add(rule_id, threshold)
+        built = ThresholdBucket.build(op, thresholds, rule_ids, [1] * 500)
+        assert built.thresholds == incremental.thresholds
+        assert built.rule_ids == incremental.rule_ids
+        fired = built.evaluate(0.5, 1.0)
+        assert sorted(fired) == sorted(incremental.evaluate(0.5, 1.0))
+
+
+def test_rebuild_sorts_each_bucket_once(monkeypatch):
+    builds = []
+    build = ThresholdBucket.build.__func__
+
+    def counting_build(cls, op, thresholds, rule_ids, armed):
+        builds.append(len(thresholds))
+        return build(cls, op, thresholds, rule_ids, armed)
+
+    def no_add(self, rule_id, threshold, armed=True):
+        raise AssertionError("вставка по одному правилу при пересборке")
+
+    monkeypatch.setattr(ThresholdBucket, "build", classmethod(counting_build))
+    monkeypatch.setattr(ThresholdBucket, "add", no_add)
+    rng = random.Random(2)
+    rows = [
+        (rule_id, 1, "Москва", "id:524901", "Москва", field, "<", rng.random())
+        for rule_id, field in enumerate(["temp", "wind"] * 5000)
+    ]
+    rules, by_city, _ = AlertStore._build(rows, set())
+    assert sorted(builds) == [5000, 5000]
+    assert len(rules) == 10000
+    thresholds = by_city["id:524901"]["temp", "<"].thresholds
+    assert list(thresholds) == sorted(thresholds)
+
+
+def test_reload_keeps_fired_rules_disarmed(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "alerts.db")
+        writer, reader = AlertStore(path), AlertStore(path)
+        reader.shared = True
+        await writer.start()
+        await reader.start()
+        query = weather_service.resolve("Москва")
+
+        first = await writer.add(1, "Москва", query, "temp", "<", -10)
+        await reader.reload()
+        bucket = reader.buckets(query.key)["temp", "<"]
+        assert bucket.evaluate(-12, 1.0) == [first.id]
+
+        second = await writer.add(2, "Москва", query, "temp", "<", -5)
+        await reader.reload()
+        bucket = reader.buckets(query.key)["temp", "<"]
+        assert bucket.evaluate(-12, 1.0) == [second.id]
+
+        await writer.close()
+        await reader.close()
+
+    asyncio.run(scenario())
+
+
+def test_readings_of_other_workers_reach_evaluator(tmp_path):
+    class FakeSender:
+        def __init__(self):
+            self.sent = []
+
+        def send_nowait(self, chat_id, text):
+            self.sent.append(chat_id)
+            return True
+
+    async def scenario():
+        store = AlertStore(str(tmp_path / "alerts.db"))
+        await store.start()
+        query = weather_service.resolve("Москва")
+        await store.add(1, "Москва", query, "temp", ">", 25)
+
+        # Общий кэш двух процессов: первый проверяет правила, второй загрузил город
+        own = SharedWeatherCache(str(tmp_path / "shared.db"))
+        other = SharedWeatherCache(str(tmp_path / "shared.db"))
+        await own.start()
+        await other.start()
+        service = WeatherService()
+        service.shared_cache = own
+        evaluator = AlertEvaluator(store, service)
+        evaluator._sender = FakeSender()
+
+        hot = WeatherReading("Ясно", 30.0, 31.0, 40, 1010, 2.0, 0, 1000)
+        await other.set(query.key, hot.to_row())
+        await evaluator.poll_shared()
+        # Повторный опрос не проверяет то же показание еще раз
+        await evaluator.poll_shared()
+
+        for resource in (own, other, store):
+            await resource.close()
+        return evaluator
+
+    evaluator = asyncio.run(scenario())
+    assert evaluator._sender.sent == [1]
+    assert evaluator.readings_checked == 1
@@ -0,0 +1,30 @@
+import asyncio
+
+from services.archive import RECORD, WeatherArchive
+from services.weather_model import WeatherReading
+
+
+def reading(observed_at):
+    return WeatherReading("Ясно", 10.0, 9.0, 50, 1000, 1.0, 0, observed_at)
+
+
+def test_shared_writers_keep_file_ordered_without_duplicates(tmp_path):
+    async def scenario():
+        # Два процесса-обработчика: у каждого свой архив над одним каталогом
+        first, second = WeatherArchive(str(tmp_path)), WeatherArchive(str(tmp_path))
+        for archive in (first, second):
+            archive.shared = True
+            await archive.start()
+        for observed_at in (100, 200, 300):
+            first.append("id:1", reading(observed_at))
+        await first.close()
+        for observed_at in (200, 300, 250, 400):
+            second.append("id:1", reading(observed_at))
+        await second.close()
+        return first.appended + second.appended, first.skipped + second.skipped
+
+    appended, skipped = asyncio.run(scenario())
+    data = (tmp_path / "id%3A1.bin").read_bytes()
+    times = [row[0] for row in RECORD.iter_unpack(data)]
+    assert times == [100, 200, 300, 400]
+    assert (appended, skipped) == (4, 3)
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from services.cities import city_index, looks_like_city, split_country, within_edits
+from services.exceptions import CityNotFoundError
+from services.weather_cache import WeatherCache
+from services.weather_service import weather_service
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Krasnogorsk",
+        "Petropavlovsk",
+        "Rostov Veliky",
+        "Orsk",
+        "Tulsa",
+        "Pinsk",
+        "Nome",
+        "Тура",
+        "Munchen",
+    ],
+)
+def test_similar_but_different_city_goes_to_api(text):
+    query = weather_service.resolve(text)
+    assert query.params == {"q": text}
+
+
+def test_typo_is_only_a_hint_after_api_404(monkeypatch):
+    calls = []
+
+    async def fetch(url, search, parse=None):
+        calls.append(search)
+        raise CityNotFoundError(search["q"])
+
+    monkeypatch.setattr(weather_service, "_fetch", fetch)
+    monkeypatch.setattr(
+        weather_service, "_not_found", WeatherCache(maxsize=10, ttl=60)
+    )
+    with pytest.raises(CityNotFoundError) as error:
+        asyncio.run(weather_service.get_weather("Londonn"))
+    assert calls == [{"q": "Londonn"}]
+    assert error.value.suggestions[0] == "Лондон"
+
+    # Повторный ввод отвечается из кэша 404 без запроса к API
+    with pytest.raises(CityNotFoundError):
+        weather_service.resolve("Londonn")
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize("text", ["asdf 123", "привет!!!", "x"])
+def test_not_a_city_is_rejected(text):
+    with pytest.raises(CityNotFoundError):
+        weather_service.resolve(text)
+
+
+def test_country_code_is_accepted():
+    assert looks_like_city("London, GB")
+    assert looks_like_city("Moscow,RU")
+    assert looks_like_city("Portland, OR, US")
+    assert split_country("Moscow,ru") == ("Moscow", "RU")
+    assert split_country("Rostov Veliky") == ("Rostov Veliky", None)
+
+
+def test_country_code_resolves_known_city_locally():
+    moscow = city_index.resolve("Moscow")
+    assert weather_service.resolve("Moscow,RU") == weather_service.resolve("Moscow")
+    assert weather_service.resolve("Moscow, RU").params == {"id": moscow.id}
+
+
+def test_country_code_of_other_country_goes_to_api():
+    query = weather_service.resolve("Moscow, US")
+    assert query.params == {"q": "Moscow, US"}
+
+
+def test_within_edits():
+    assert within_edits("mosocw", "moscow", 1)
+    assert within_edits("londn", "london", 1)
+    assert not within_edits("krasnogorsk", "krasnoyarsk", 1)
+    assert not within_edits("kazanlak", "kazan", 1)
@@ -0,0 +1,35 @@
+import time
+
+from services.forecast import ForecastSeries
+
+
+def forecast_data(start: int, steps: int) -> dict:
+    return {
+        "city": {"timezone": 0},
+        "list": [
+            {
+                "dt": start + i * 3 * 3600,
+                "main": {"temp": float(i)},
+                "weather": [{"description": "ясно"}],
+            }
+            for i in range(steps)
+        ],
+    }
+
+
+def test_render_memo_follows_the_clock_without_new_data(monkeypatch):
+    midnight = 1_700_006_400  # 15.11.2023 00:00 UTC
+    now = [midnight + 12 * 3600]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    series = ForecastSeries()
+    series.merge(ForecastSeries.parse(forecast_data(midnight, 24)))
+
+    daily = series.render("Москва", 3)
+    hourly = series.render("Москва", 1)
+    assert series.render("Москва", 3) is daily
+    assert "15.11" in daily
+
+    # Данные не обновлялись, но наступили новые сутки
+    now[0] = midnight + 24 * 3600 + 60
+    assert "15.11" not in series.render("Москва", 3)
+    assert series.render("Москва", 1) != hourly
@@ -0,0 +1,34 @@
+from services.hot_cities import HotCityTracker
+
+
+def test_size_stays_bounded():
+    tracker = HotCityTracker(max_keys=1000)
+    tracker.pin("default", "default")
+    for _ in range(50):
+        tracker.record("popular", "popular")
+    for number in range(20000):
+        tracker.record(number, number)
+        assert len(tracker) <= 1000
+
+    assert "popular" in tracker.top(1)
+    assert tracker.top(1)[0] == "default"
+    assert len(tracker._items) <= 1001
+
+
+def test_eviction_is_amortized_when_full():
+    tracker = HotCityTracker(max_keys=10000)
+    for number in range(10000):
+        tracker.record(number, number)
+    passes = []
+    evict = tracker._evict
+
+    def counting_evict():
+        passes.append(len(tracker))
+        evict()
+
+    tracker._evict = counting_evict
+    for number in range(10000, 30000):
+        tracker.record(number, number)
+    # Каждый проход освобождает десятую часть лимита: один на 1000 новых городов
+    assert len(passes) <= 20000 // 1000
+    assert len(tracker) <= 10000
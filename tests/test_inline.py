@@ -0,0 +1,37 @@
+import asyncio
+
+from services.inline import inline_search
+from services.weather_model import WeatherReading
+from services.weather_service import weather_service
+
+
+PAYLOAD = {
+    "weather": [{"description": "ясно", "icon": "01d"}],
+    "main": {"temp": 1.5, "feels_like": -1, "humidity": 80, "pressure": 1012},
+    "wind": {"speed": 3},
+    "sys": {"sunrise": 1699970000, "sunset": 1700000000},
+    "name": "X",
+    "coord": {"lat": 1, "lon": 2},
+    "dt": 1700000000,
+    "id": 1,
+    "timezone": 10800,
+}
+
+
+def test_empty_inline_query_never_returns_locations():
+    reading = WeatherReading.from_api(PAYLOAD)
+    # Точка посреди океана: ближайшего города нет, заголовок - координаты
+    lat, lon = -48.8767, -123.3933
+    location = weather_service.resolve_location(lat, lon)
+    assert location.key.startswith("gh:")
+    weather_service.cache.set(location.key, reading)
+    city = weather_service.resolve("Москва")
+    weather_service.cache.set(city.key, reading)
+
+    for _ in range(5):
+        asyncio.run(weather_service.get_weather_at(lat, lon))
+    asyncio.run(weather_service.get_weather("Москва"))
+
+    items = inline_search.search("")
+    assert [item.query.key for item in items] == [city.key]
+    assert all(not item.query.key.startswith("gh:") for item in items)
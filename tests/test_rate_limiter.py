@@ -0,0 +1,20 @@
+from services.rate_limiter import QuotaGovernor, TokenBucket
+
+
+def test_available_does_not_change_bucket_state():
+    bucket = TokenBucket(rate=1, capacity=10)
+    bucket.tokens = 2
+    state = (bucket.tokens, bucket._updated)
+    assert 2 <= bucket.available <= 10
+    assert (bucket.tokens, bucket._updated) == state
+
+
+def test_snapshot_is_read_only():
+    quota = QuotaGovernor(per_minute=60, per_day=100, burst=5)
+    assert quota.try_acquire()
+    state = (quota.bucket.tokens, quota.bucket._updated, quota.used_today)
+    snapshot = quota.snapshot()
+    assert snapshot["used_today"] == 1
+    assert snapshot["remaining_today"] == 99
+    assert (quota.bucket.tokens, quota.bucket._updated, quota.used_today) == state
+
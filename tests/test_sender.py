@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Chat, Message
+
+from bot.handlers import handlers
+from bot.sender import MessageSender, message_sender
+
+
+class FakeBot:
+    def __init__(self):
+        self.calls = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls.append(("send", chat_id, text, kwargs))
+        return SimpleNamespace(message_id=len(self.calls))
+
+    async def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        self.calls.append(("edit", chat_id, text, kwargs))
+        return True
+
+
+def topic_message(text: str) -> Message:
+    return Message(
+        message_id=10,
+        date=datetime.now(),
+        chat=Chat(id=-1001, type="supergroup", is_forum=True),
+        message_thread_id=7,
+        is_topic_message=True,
+        text=text,
+    )
+
+
+def test_answer_stays_in_forum_topic():
+    bot = FakeBot()
+    message_sender._bot = bot
+    asyncio.run(handlers._answer(topic_message("/help"), "ok"))
+    assert bot.calls == [
+        (
+            "send",
+            -1001,
+            "ok",
+            {"message_thread_id": 7, "business_connection_id": None},
+        )
+    ]
+
+
+def test_progress_placeholder_and_answer_stay_in_forum_topic():
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "погода"
+
+    bot = FakeBot()
+    sender = MessageSender(placeholder_delay=0.01)
+    sender._bot = bot
+    asyncio.run(
+        sender.reply_progress(
+            -1001, "⏳", slow(), message_thread_id=7, business_connection_id="b1"
+        )
+    )
+    assert bot.calls == [
+        ("send", -1001, "⏳", {"message_thread_id": 7, "business_connection_id": "b1"}),
+        ("edit", -1001, "погода", {"business_connection_id": "b1"}),
+    ]
+
+
+def test_progress_answer_is_sent_when_edit_fails():
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "погода"
+
+    class NoEditBot(FakeBot):
+        async def edit_message_text(self, text, chat_id, message_id, **kwargs):
+            self.calls.append(("edit", chat_id, text, kwargs))
+            raise TelegramBadRequest(method=None, message="message to edit not found")
+
+    bot = NoEditBot()
+    sender = MessageSender(placeholder_delay=0.01)
+    sender._bot = bot
+    asyncio.run(sender.reply_progress(-1001, "⏳", slow(), message_thread_id=7))
+    assert bot.calls[-1] == (
+        "send",
+        -1001,
+        "погода",
+        {"message_thread_id": 7, "business_connection_id": None},
+    )
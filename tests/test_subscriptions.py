@@ -0,0 +1,95 @@
+import asyncio
+
+from services.exceptions import QuotaExceededError
+from services.rate_limiter import QuotaGovernor
+from services.subscriptions import SubscriptionScheduler
+from services.weather_service import WeatherService
+
+
+CITIES = ["Москва", "Лондон", "Париж", "Берлин", "Мадрид", "Казань"]
+
+
+class FakeStore:
+    def __init__(self, due):
+        self._due = due
+
+    async def reload_minute(self, minute):
+        pass
+
+    def due(self, minute):
+        return self._due
+
+
+class FakeSender:
+    def __init__(self):
+        self.sent = {}
+
+    async def send(self, chat_id, text):
+        self.sent[chat_id] = text
+
+
+def api_item(city_id):
+    return {
+        "id": city_id,
+        "main": {"temp": 10, "feels_like": 9, "humidity": 50, "pressure": 1000},
+        "weather": [{"description": "ясно"}],
+        "wind": {"speed": 1},
+        "sys": {"sunset": 0},
+        "dt": 1,
+    }
+
+
+def make_scheduler(due, fetch, delivery_window):
+    service = WeatherService()
+    service.archive = None
+    service._fetch = fetch
+    service.quota = QuotaGovernor(per_minute=6000, per_day=6000, burst=1000)
+    scheduler = SubscriptionScheduler(
+        FakeStore(due), service, delivery_window=delivery_window, retry_interval=0.01
+    )
+    scheduler._sender = FakeSender()
+    return scheduler
+
+
+def test_slot_retries_misses_through_group_requests():
+    group_calls = []
+
+    async def fetch(url, search, parse=None):
+        if "," not in str(search.get("id", "")):
+            raise QuotaExceededError()
+        group_calls.append(search["id"])
+        # Первые два пакетных запроса упираются в лимит API
+        if len(group_calls) <= 2:
+            raise QuotaExceededError()
+        ids = [int(city_id) for city_id in search["id"].split(",")]
+        return parse({"list": [api_item(city_id) for city_id in ids]})
+
+    due = {index: city for index, city in enumerate(CITIES)}
+    due[100] = "Москва"
+    due[101] = "12345"
+    scheduler = make_scheduler(due, fetch, delivery_window=5)
+    asyncio.run(scheduler.run_slot(9 * 60))
+
+    sent = scheduler._sender.sent
+    assert set(sent) == set(due)
+    for chat_id, city in due.items():
+        if chat_id == 101:
+            assert "Ежедневная погода" not in sent[chat_id]
+        else:
+            assert city in sent[chat_id]
+    assert len(group_calls) == 3
+    assert scheduler.retries == 2
+    assert scheduler.cities_failed == 1
+
+
+def test_slot_reports_cities_without_data_after_window():
+    async def fetch(url, search, parse=None):
+        raise QuotaExceededError()
+
+    scheduler = make_scheduler({1: "Москва", 2: "Лондон"}, fetch, delivery_window=0)
+    asyncio.run(scheduler.run_slot(9 * 60))
+
+    sent = scheduler._sender.sent
+    assert set(sent) == {1, 2}
+    assert all("Ежедневная погода" not in text for text in sent.values())
+    assert scheduler.cities_failed == 2
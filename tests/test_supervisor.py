@@ -0,0 +1,24 @@
+from supervisor import merge_worker_metrics
+
+
+WORKER_TEXT = """# HELP bot_updates_total Полученные обновления Telegram
+# TYPE bot_updates_total counter
+bot_updates_total {updates}
+# TYPE weather_circuit_open gauge
+weather_circuit_open{{endpoint="http://api/weather"}} 0
+"""
+
+
+def test_worker_metrics_are_labelled_and_grouped():
+    lines = merge_worker_metrics(
+        {1: WORKER_TEXT.format(updates=5), 0: WORKER_TEXT.format(updates=3)}
+    )
+    assert lines == [
+        "# HELP bot_updates_total Полученные обновления Telegram",
+        "# TYPE bot_updates_total counter",
+        'bot_updates_total{worker="0"} 3',
+        'bot_updates_total{worker="1"} 5',
+        "# TYPE weather_circuit_open gauge",
+        'weather_circuit_open{endpoint="http://api/weather",worker="0"} 0',
+        'weather_circuit_open{endpoint="http://api/weather",worker="1"} 0',
+    ]
@@ -0,0 +1,36 @@
+import asyncio
+
+from services.user_store import SQLiteUserPrefsBackend, UserPrefsStore
+
+
+def test_shared_stores_see_each_others_cities(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "prefs.db")
+        first = UserPrefsStore(SQLiteUserPrefsBackend(path), revalidate_interval=0)
+        second = UserPrefsStore(SQLiteUserPrefsBackend(path), revalidate_interval=0)
+        first.shared = second.shared = True
+        await first.start()
+        await second.start()
+
+        # Второй процесс уже закэшировал "город не выбран" и первый город
+        assert await second.get_city(1) == second.default_city
+        first.set_city(2, "Москва")
+        await first.flush()
+        assert await second.get_city(2) == "Москва"
+
+        first.set_city(1, "Казань")
+        first.set_city(2, "Тверь")
+        await first.flush()
+        assert await second.get_city(1) == "Казань"
+        assert await second.get_city(2) == "Тверь"
+
+        # Свое несохраненное изменение важнее чужого сохраненного
+        second.set_city(2, "Омск")
+        first.set_city(2, "Томск")
+        await first.flush()
+        assert await second.get_city(2) == "Омск"
+
+        await first.close()
+        await second.close()
+
+    asyncio.run(scenario())
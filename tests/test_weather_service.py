@@ -0,0 +1,62 @@
+import asyncio
+
+from services.rate_limiter import QuotaGovernor
+from services.weather_service import WeatherService
+
+
+def api_item(city_id):
+    return {
+        "id": city_id,
+        "main": {"temp": 10, "feels_like": 9, "humidity": 50, "pressure": 1000},
+        "weather": [{"description": "ясно"}],
+        "wind": {"speed": 1},
+        "sys": {"sunset": 0},
+        "dt": 1,
+    }
+
+
+def make_service(calls):
+    service = WeatherService()
+    service.archive = None
+
+    async def fetch(url, search, parse=None):
+        calls.append(url)
+        await asyncio.sleep(0.01)
+        if url == service.group_url:
+            ids = [int(city_id) for city_id in search["id"].split(",")]
+            return parse({"list": [api_item(city_id) for city_id in ids]})
+        return parse(api_item(search["id"]))
+
+    service._fetch = fetch
+    return service
+
+
+def test_weather_during_group_request_joins_it():
+    calls = []
+    service = make_service(calls)
+    moscow, london = service.resolve("Москва"), service.resolve("Лондон")
+
+    async def scenario():
+        group = asyncio.create_task(service.refresh_many([moscow, london]))
+        await asyncio.sleep(0)
+        text = await service.get_weather("Москва")
+        await group
+        return text
+
+    assert "Москва" in asyncio.run(scenario())
+    assert calls == [service.group_url]
+
+
+def test_refresh_many_does_not_wait_for_quota():
+    calls = []
+    service = make_service(calls)
+    service.quota = QuotaGovernor(per_minute=1, per_day=100, burst=1)
+    service.quota.bucket.tokens = 0
+    queries = [service.resolve(city) for city in ("Москва", "Лондон", "Париж")]
+
+    async def scenario():
+        await asyncio.wait_for(service.refresh_many(queries), timeout=1)
+
+    asyncio.run(scenario())
+    assert calls == []
+    assert all(service.cache.peek(query.key) is None for query in queries)
@@ -0,0 +1,278 @@
+from abc import ABC, abstractmethod
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import (
+    DEFAULT_CITY,
+    USER_DB_PATH,
+    USER_PREFS_BATCH_SIZE,
+    USER_PREFS_CACHE_SIZE,
+    USER_PREFS_FLUSH_INTERVAL,
+    USER_PREFS_REVALIDATE_INTERVAL,
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Запас по времени для записей, начатых до сверки, а зафиксированных после
+SYNC_MARGIN = 30
+
+
+class UserPrefsBackend(ABC):
+    """Интерфейс постоянного хранилища настроек пользователей"""
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def load_city(self, user_id: int) -> Optional[str]:
+        """Возвращает сохраненный город пользователя или None"""
+
+    @abstractmethod
+    async def load_recent(self, limit: int) -> List[Tuple[int, str]]:
+        """Возвращает города недавно активных пользователей"""
+
+    @abstractmethod
+    async def save_cities(self, items: Dict[int, str]):
+        """Сохраняет пачку изменений одной транзакцией"""
+
+    async def data_version(self) -> int:
+        """Версия данных; меняется, когда их изменил другой процесс"""
+        return 0
+
+    async def load_changed(self, since: float) -> List[Tuple[int, str]]:
+        """Города, сохраненные после момента since (time.time())"""
+        return []
+
+
+class SQLiteUserPrefsBackend(UserPrefsBackend):
+    """Хранилище в SQLite; файл можно разделять между процессами бота"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        # Все обращения к соединению идут через один поток
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="user-prefs"
+        )
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def open(self):
+        await self._run(self._open)
+
+    def _open(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        # WAL и busy_timeout позволяют нескольким процессам писать в один файл
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_prefs ("
+            "user_id INTEGER PRIMARY KEY, "
+            "city TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    async def close(self):
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+    async def load_city(self, user_id: int) -> Optional[str]:
+        return await self._run(self._load_city, user_id)
+
+    def _load_city(self, user_id: int) -> Optional[str]:
+        row = self._conn.execute(
+            "SELECT city FROM user_prefs WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    async def load_recent(self, limit: int) -> List[Tuple[int, str]]:
+        return await self._run(self._load_recent, limit)
+
+    def _load_recent(self, limit: int) -> List[Tuple[int, str]]:
+        return self._conn.execute(
+            "SELECT user_id, city FROM user_prefs ORDER BY updated_at DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+
+    async def save_cities(self, items: Dict[int, str]):
+        await self._run(self._save_cities, items)
+
+    async def data_version(self) -> int:
+        return await self._run(self._data_version)
+
+    def _data_version(self) -> int:
+        # Меняется, только когда базу изменило другое соединение
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    async def load_changed(self, since: float) -> List[Tuple[int, str]]:
+        return await self._run(self._load_changed, since)
+
+    def _load_changed(self, since: float) -> List[Tuple[int, str]]:
+        return self._conn.execute(
+            "SELECT user_id, city FROM user_prefs WHERE updated_at > ?", (since,)
+        ).fetchall()
+
+    def _save_cities(self, items: Dict[int, str]):
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO user_prefs (user_id, city, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET "
+                "city = excluded.city, updated_at = excluded.updated_at",
+                [(user_id, city, now) for user_id, city in items.items()],
+            )
+
+
+class UserPrefsStore:
+    """Города пользователей: LRU в памяти и отложенная пакетная запись
+
+    В многопроцессном режиме (shared) кэш раз в revalidate_interval
+    сверяется с PRAGMA data_version и подтягивает города, сохраненные
+    другими процессами.
+    """
+
+    def __init__(
+        self,
+        backend: UserPrefsBackend,
+        default_city: str = DEFAULT_CITY,
+        cache_size: int = USER_PREFS_CACHE_SIZE,
+        flush_interval: float = USER_PREFS_FLUSH_INTERVAL,
+        batch_size: int = USER_PREFS_BATCH_SIZE,
+        revalidate_interval: float = USER_PREFS_REVALIDATE_INTERVAL,
+    ):
+        self.backend = backend
+        self.default_city = default_city
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.revalidate_interval = revalidate_interval
+        # В многопроцессном режиме города меняют и другие процессы
+        self.shared = False
+
+        # None в кэше означает "пользователь не выбирал город"
+        self._cache: "OrderedDict[int, Optional[str]]" = OrderedDict()
+        self._pending: Dict[int, str] = {}
+        self._flush_requested = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._data_version = 0
+        self.revalidated = 0
+        # Когда кэш последний раз сверялся с базой: monotonic и time.time()
+        self._checked_at = 0.0
+        self._synced_at = 0.0
+
+    async def start(self):
+        """Открывает хранилище и прогревает кэш недавними пользователями"""
+        await self.backend.open()
+        self._data_version = await self.backend.data_version()
+        self._checked_at, self._synced_at = time.monotonic(), time.time()
+        for user_id, city in reversed(await self.backend.load_recent(self.cache_size)):
+            self._remember(user_id, city)
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        logger.info(f"Настройки пользователей загружены: {len(self._cache)}")
+
+    async def close(self):
+        """Записывает несохраненные изменения и закрывает хранилище"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        await self.backend.close()
+
+    async def get_city(self, user_id: int) -> str:
+        """Возвращает город пользователя или город по умолчанию"""
+        if user_id in self._pending:
+            return self._pending[user_id]
+        if self.shared:
+            await self._revalidate()
+        if user_id in self._cache:
+            self._cache.move_to_end(user_id)
+            city = self._cache[user_id]
+        else:
+            city = await self.backend.load_city(user_id)
+            self._remember(user_id, city)
+        return city or self.default_city
+
+    def set_city(self, user_id: int, city: str):
+        """Сохраняет город; запись на диск выполняется в фоне пачками"""
+        self._remember(user_id, city)
+        self._pending[user_id] = city
+        if len(self._pending) >= self.batch_size:
+            self._flush_requested.set()
+
+    async def flush(self):
+        """Записывает накопленные изменения одной транзакцией"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            await self.backend.save_cities(batch)
+        except Exception as e:
+            logger.error(f"Не удалось сохранить настройки пользователей: {e}")
+            # Возвращаем пачку, не затирая изменения, сделанные во время записи
+            batch.update(self._pending)
+            self._pending = batch
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._flush_requested.wait(), timeout=self.flush_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    async def _revalidate(self):
+        """Обновляет кэш, если базу с последней сверки меняли другие процессы"""
+        now = time.monotonic()
+        if now - self._checked_at < self.revalidate_interval:
+            return
+        self._checked_at = now
+        version = await self.backend.data_version()
+        if version == self._data_version:
+            return
+        self._data_version = version
+        since, self._synced_at = self._synced_at, time.time()
+        changed = await self.backend.load_changed(since - SYNC_MARGIN)
+        for user_id, city in changed:
+            # Свои несохраненные изменения новее; некэшированные не нужны
+            if user_id in self._cache and user_id not in self._pending:
+                self._cache[user_id] = city
+        self.revalidated += 1
+
+    def _remember(self, user_id: int, city: Optional[str]):
+        self._cache[user_id] = city
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "pending": len(self._pending),
+            "revalidated": self.revalidated,
+        }
+
+
+# Создаем экземпляр хранилища для импорта
+user_store = UserPrefsStore(SQLiteUserPrefsBackend(USER_DB_PATH))
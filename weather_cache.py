@@ -0,0 +1,82 @@
+from collections import OrderedDict
+import time
+from typing import Any, Optional, Tuple
+
+
+class WeatherCache:
+    """Ограниченный LRU-кэш с TTL и режимом stale-while-revalidate"""
+
+    def __init__(self, maxsize: int, ttl: float, stale_ttl: float = 0.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+        # Счетчики для оценки эффективности кэша
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[Tuple[Any, bool]]:
+        """Возвращает (значение, устарело ли оно) или None при промахе"""
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        stored_at, value = item
+        age = time.monotonic() - stored_at
+        if age > self.ttl + self.stale_ttl:
+            # Запись остается до вытеснения как последнее известное значение
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        if age > self.ttl:
+            self.stale_hits += 1
+            return value, True
+
+        self.hits += 1
+        return value, False
+
+    def peek(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Возвращает (значение, возраст в секундах) без учета TTL и счетчиков"""
+        item = self._data.get(key)
+        if item is None:
+            return None
+        stored_at, value = item
+        return value, time.monotonic() - stored_at
+
+    def set(self, key: str, value: Any, age: float = 0.0):
+        """Сохраняет значение и вытесняет самые старые записи
+
+        age - сколько секунд назад значение было получено (например, из кэша
+        другого процесса).
+        """
+        self._data[key] = (time.monotonic() - age, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        """Статистика попаданий в кэш"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (
+                round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0
+            ),
+        }
@@ -0,0 +1,150 @@
+from datetime import datetime
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+try:
+    # orjson заметно быстрее разбирает ответы API, но необязателен
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+
+LOCALES = ("ru", "en")
+VARIANTS = ("full", "compact", "inline")
+
+# Шаблоны собираются один раз при импорте: locale, variant -> str.format
+_TEMPLATES: Dict[Tuple[str, str], Callable[..., str]] = {
+    ("ru", "full"): (
+        "🌤 <b>Погода в {city}</b>\n\n"
+        "• <b>Состояние:</b> {description}\n"
+        "• <b>Температура:</b> {temp:g} °C\n"
+        "• <b>Ощущается как:</b> {feels_like:g} °C\n"
+        "• <b>Влажность:</b> {humidity}%\n"
+        "• <b>Давление:</b> {pressure} гПа\n"
+        "• <b>Скорость ветра:</b> {wind_speed:g} м/с\n"
+        "• <b>Закат:</b> {sunset}\n"
+    ).format,
+    ("ru", "compact"): (
+        "🌤 <b>{city}</b>: {temp:g} °C, {description}, "
+        "ветер {wind_speed:g} м/с"
+    ).format,
+    # Описание под названием города в inline-подсказке
+    ("ru", "inline"): "{temp:g} °C, {description}".format,
+    ("en", "full"): (
+        "🌤 <b>Weather in {city}</b>\n\n"
+        "• <b>Conditions:</b> {description}\n"
+        "• <b>Temperature:</b> {temp:g} °C\n"
+        "• <b>Feels like:</b> {feels_like:g} °C\n"
+        "• <b>Humidity:</b> {humidity}%\n"
+        "• <b>Pressure:</b> {pressure} hPa\n"
+        "• <b>Wind speed:</b> {wind_speed:g} m/s\n"
+        "• <b>Sunset:</b> {sunset}\n"
+    ).format,
+    ("en", "compact"): (
+        "🌤 <b>{city}</b>: {temp:g} °C, {description}, wind {wind_speed:g} m/s"
+    ).format,
+    ("en", "inline"): "{temp:g} °C, {description}".format,
+}
+
+
+class WeatherReading:
+    """Текущая погода в городе: только поля, которые показывает бот
+
+    Хранится в кэше вместо полного JSON-ответа API. Готовые тексты
+    запоминаются, поэтому одна запись рендерится один раз.
+    """
+
+    __slots__ = (
+        "description",
+        "temp",
+        "feels_like",
+        "humidity",
+        "pressure",
+        "wind_speed",
+        "sunset",
+        "observed_at",
+        "_rendered",
+    )
+
+    def __init__(
+        self,
+        description: str,
+        temp: float,
+        feels_like: float,
+        humidity: int,
+        pressure: int,
+        wind_speed: float,
+        sunset: int,
+        observed_at: int,
+    ):
+        self.description = description
+        self.temp = temp
+        self.feels_like = feels_like
+        self.humidity = humidity
+        self.pressure = pressure
+        self.wind_speed = wind_speed
+        self.sunset = sunset
+        self.observed_at = observed_at
+        # Создается при первом рендере
+        self._rendered: Optional[Dict[Tuple[str, str, str], str]] = None
+
+    @classmethod
+    def from_api(cls, data: dict) -> "WeatherReading":
+        """Создает запись из ответа /weather (или элемента списка /group)"""
+        main = data["main"]
+        return cls(
+            description=data["weather"][0]["description"].capitalize(),
+            temp=float(main["temp"]),
+            feels_like=float(main["feels_like"]),
+            humidity=int(main["humidity"]),
+            pressure=int(main["pressure"]),
+            wind_speed=float(data["wind"]["speed"]),
+            sunset=int(data["sys"]["sunset"]),
+            observed_at=int(data.get("dt", 0)),
+        )
+
+    @classmethod
+    def from_json(cls, raw: bytes) -> "WeatherReading":
+        return cls.from_api(json_loads(raw))
+
+    def to_row(self) -> list:
+        """Поля записи списком, например, для общего кэша процессов"""
+        return [
+            self.description,
+            self.temp,
+            self.feels_like,
+            self.humidity,
+            self.pressure,
+            self.wind_speed,
+            self.sunset,
+            self.observed_at,
+        ]
+
+    @classmethod
+    def from_row(cls, row: Sequence) -> "WeatherReading":
+        return cls(*row)
+
+    def render(self, city: str, variant: str = "full", locale: str = "ru") -> str:
+        """Текст сообщения; результат запоминается для пары вариант/город"""
+        key = (locale, variant, city)
+        if self._rendered is None:
+            self._rendered = {}
+        text = self._rendered.get(key)
+        if text is None:
+            template = _TEMPLATES.get((locale, variant)) or _TEMPLATES["ru", variant]
+            text = self._rendered[key] = template(
+                city=city,
+                description=self.description,
+                temp=self.temp,
+                feels_like=self.feels_like,
+                humidity=self.humidity,
+                pressure=self.pressure,
+                wind_speed=self.wind_speed,
+                sunset=datetime.fromtimestamp(self.sunset).strftime("%H:%M:%S"),
+            )
+        return text
+
+    def __repr__(self) -> str:
+        return (
+            f"WeatherReading({self.description!r}, temp={self.temp}, "
+            f"observed_at={self.observed_at})"
+        )
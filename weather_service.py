@@ -1,56 +1,675 @@
-from datetime import datetime
+import asyncio
+import html
+import logging
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
 
-from config import API_KEY, WEATHER_API_URL
-import requests
+import aiohttp
+from config import (
+    API_KEY,
+    ARCHIVE_ENABLED,
+    ARCHIVE_FALLBACK_MAX_AGE,
+    FORECAST_CACHE_SIZE,
+    FORECAST_CACHE_TTL,
+    HTTP_KEEPALIVE_TIMEOUT,
+    HTTP_POOL_SIZE,
+    LOCATION_GEOHASH_PRECISION,
+    LOCATION_NEAREST_KM,
+    WEATHER_API_URL,
+    WEATHER_CACHE_SIZE,
+    WEATHER_CACHE_STALE_TTL,
+    WEATHER_CACHE_TTL,
+    WEATHER_CONNECT_TIMEOUT,
+    WEATHER_GROUP_SIZE,
+    WEATHER_NOT_FOUND_TTL,
+    WEATHER_QUEUE_DEADLINE,
+    WEATHER_REQUEST_TIMEOUT,
+    WEATHER_USER_RESERVE,
+)
+from services.archive import weather_archive
+from services.cities import (
+    City,
+    city_index,
+    geohash,
+    geohash_center,
+    looks_like_city,
+    normalize_city,
+    split_country,
+)
+from services.exceptions import (
+    CircuitOpenError,
+    CityNotFoundError,
+    QuotaExceededError,
+    UpstreamError,
+    UpstreamUnavailableError,
+    WeatherError,
+)
+from services.forecast import ForecastSeries
+from services.hot_cities import HotCityTracker
+from services.metrics import upstream_latency, upstream_responses
+from services.rate_limiter import QuotaGovernor
+from services.resilience import CircuitBreaker, retry_with_backoff
+from services.single_flight import SingleFlight
+from services.weather_cache import WeatherCache
+from services.weather_model import WeatherReading, json_loads
+
+
+logger = logging.getLogger(__name__)
+
+# Сколько правок отделяет опечатку от известного города для подсказки после 404
+TYPO_MAX_EDITS = 1
+
+
+class WeatherQuery(NamedTuple):
+    """Запрос к API: ключ кэша, заголовок ответа и параметры поиска"""
+
+    key: str
+    title: str
+    params: dict
+
+
+class CityWeather(NamedTuple):
+    """Результат по одному городу из get_weather_many"""
+
+    city: str
+    title: str
+    reading: Optional[WeatherReading]
+    error: Optional[WeatherError]
 
 
 class WeatherService:
     def __init__(self):
         self.api_key = API_KEY
         self.base_url = WEATHER_API_URL
+        # Пакетный запрос текущей погоды по списку id
+        self.group_url = WEATHER_API_URL.rsplit("/", 1)[0] + "/group"
+        self.forecast_url = WEATHER_API_URL.rsplit("/", 1)[0] + "/forecast"
+        self.timeout = aiohttp.ClientTimeout(
+            total=WEATHER_REQUEST_TIMEOUT, connect=WEATHER_CONNECT_TIMEOUT
+        )
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.cache = WeatherCache(
+            maxsize=WEATHER_CACHE_SIZE,
+            ttl=WEATHER_CACHE_TTL,
+            stale_ttl=WEATHER_CACHE_STALE_TTL,
+        )
+        # Ряды прогнозов; истекшие записи остаются для инкрементального слияния
+        self.forecasts = WeatherCache(
+            maxsize=FORECAST_CACHE_SIZE, ttl=FORECAST_CACHE_TTL
+        )
+        # Названия, на которые API уже ответил 404
+        self._not_found = WeatherCache(
+            maxsize=WEATHER_CACHE_SIZE, ttl=WEATHER_NOT_FOUND_TTL
+        )
+        # Бюджет запросов: поминутный лимит и суточная квота
+        self.quota = QuotaGovernor()
+        # Одновременные запросы одного города идут к API одним вызовом
+        self._flight = SingleFlight()
+        # Популярность городов для фонового прогрева
+        self.hot_cities = HotCityTracker()
+        # Выключатели по эндпоинтам API
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        # Фоновые обновления устаревших записей: ключ кэша -> задача
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        # Общий кэш процессов (SharedWeatherCache) в многопроцессном режиме
+        self.shared_cache = None
+        # Архив наблюдений: история и запасной источник при недоступности API
+        self.archive = weather_archive if ARCHIVE_ENABLED else None
+        # Кого уведомлять о каждом новом показании из API (оповещения)
+        self._refresh_listeners: List[Callable[[str, WeatherReading], None]] = []
+
+    async def start(self):
+        """Создает общую HTTP-сессию с пулом keep-alive соединений"""
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_SIZE,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector, timeout=self.timeout
+        )
+        logger.info("HTTP-сессия для OpenWeatherMap создана")
+
+    async def warm_up(self):
+        """Заранее открывает соединение с API, чтобы первый запрос не ждал TLS
+
+        HEAD без ключа не расходует квоту; ответ не важен, соединение
+        остается в пуле keep-alive.
+        """
+        try:
+            async with self.session.head(
+                self.base_url, allow_redirects=False, timeout=self.timeout
+            ):
+                pass
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Не удалось заранее соединиться с OpenWeatherMap: {e!r}")
+
+    async def close(self):
+        """Закрывает HTTP-сессию и отменяет фоновые обновления"""
+        for task in list(self._refreshing.values()):
+            task.cancel()
+        self._refreshing.clear()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("HTTP-сессия для OpenWeatherMap закрыта")
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            raise RuntimeError("WeatherService не запущен: вызовите start()")
+        return self._session
+
+    def resolve(self, city: str) -> WeatherQuery:
+        """Определяет, как запрашивать город у API"""
+        name, country = split_country(city)
+        match = city_index.resolve(name)
+        if match is not None and country in (None, match.country):
+            return self.resolve_city(match)
+
+        # Не-города и названия, на которые API уже ответил 404, отсекаем без API;
+        # похожесть на известный город не повод отказать (Орск - не опечатка Омска)
+        if (
+            not looks_like_city(city)
+            or self._not_found.get(normalize_city(city)) is not None
+        ):
+            raise self._city_not_found(city)
+        return WeatherQuery(key=normalize_city(city), title=city, params={"q": city})
+
+    def resolve_city(self, city: City) -> WeatherQuery:
+        """Запрос для города из локального индекса"""
+        if city.id:
+            return WeatherQuery(
+                key=f"id:{city.id}", title=city.name, params={"id": city.id}
+            )
+        return WeatherQuery(
+            key=f"geo:{city.lat:.4f},{city.lon:.4f}",
+            title=city.name,
+            params={"lat": city.lat, "lon": city.lon},
+        )
+
+    def resolve_location(self, lat: float, lon: float) -> WeatherQuery:
+        """Запрос для координат: все точки одной ячейки geohash делят запись
+
+        API запрашивается по центру ячейки, а заголовком служит ближайший
+        известный город.
+        """
+        cell = geohash(lat, lon, LOCATION_GEOHASH_PRECISION)
+        center_lat, center_lon = geohash_center(cell)
+        nearest = city_index.nearest(lat, lon, LOCATION_NEAREST_KM)
+        title = nearest[0].name if nearest else f"{lat:.2f}, {lon:.2f}"
+        return WeatherQuery(
+            key=f"gh:{cell}",
+            title=title,
+            params={"lat": round(center_lat, 4), "lon": round(center_lon, 4)},
+        )
+
+    @staticmethod
+    def _city_not_found(city: str) -> CityNotFoundError:
+        suggestions = [match.name for match in city_index.suggest(city)]
+        # Город в одной опечатке от введенного - первая подсказка
+        typo = city_index.near_match(split_country(city)[0], TYPO_MAX_EDITS)
+        if typo is not None and typo.name not in suggestions:
+            suggestions.insert(0, typo.name)
+        return CityNotFoundError(city, suggestions)
+
+    async def get_weather(self, city: str) -> str:
+        """Получает данные о погоде для указанного города
+
+        Бросает WeatherError, если данных нет даже в кэше.
+        """
+        city = city.strip()
+        return await self._weather_text(city, self.resolve(city))
+
+    async def get_weather_at(self, lat: float, lon: float) -> str:
+        """Погода по координатам (геопозиция из Telegram)"""
+        query = self.resolve_location(lat, lon)
+        return await self._weather_text(query.title, query)
+
+    async def _weather_text(self, city: str, query: WeatherQuery) -> str:
+        reading, age = await self._get_reading(city, query)
+        # Учитываем только найденные города (404 не прогреваем), а координаты
+        # пользователя не попадают в популярное: его видят все в пустом inline
+        if not query.key.startswith("gh:"):
+            self.hot_cities.record(query.key, query)
+        if age:
+            return self._format_stale_data(reading, query.title, age)
+        return reading.render(query.title)
+
+    async def _get_reading(
+        self, city: str, query: WeatherQuery
+    ) -> Tuple[WeatherReading, float]:
+        """Погода из кэша или API и ее возраст, если API недоступен (иначе 0)"""
+        cached = self.cache.get(query.key)
+        if cached is not None:
+            reading, is_stale = cached
+            if is_stale:
+                self._schedule_refresh(query)
+            return reading, 0.0
+
+        try:
+            return await self._load(query), 0.0
+        except CityNotFoundError:
+            self._not_found.set(query.key, True)
+            raise self._city_not_found(city)
+        except (QuotaExceededError, UpstreamError) as e:
+            # Лучше последние известные данные с пометкой возраста, чем отказ
+            last_known = self.cache.peek(query.key)
+            if last_known is None and self.archive is not None:
+                archived = await self.archive.latest(query.key)
+                if archived is not None and archived[1] <= ARCHIVE_FALLBACK_MAX_AGE:
+                    last_known = archived
+            if last_known is None:
+                raise
+            logger.warning(f"Отдаем сохраненные данные для {query.title}: {e!r}")
+            return last_known
+
+    def cached_weather(self, query: WeatherQuery) -> Optional[str]:
+        """Текст свежей погоды из кэша без обращения к API; None при промахе"""
+        cached = self.cache.peek(query.key)
+        if cached is None or cached[1] >= self.cache.ttl:
+            return None
+        return cached[0].render(query.title)
+
+    async def get_weather_many(self, cities: Sequence[str]) -> List[CityWeather]:
+        """Погода для нескольких городов с минимумом запросов к API
+
+        Города из кэша не запрашиваются, известные по id загружаются
+        пакетными запросами /group, остальные - параллельно по одному.
+        """
+        resolved: List[Tuple[str, Optional[WeatherQuery], Optional[WeatherError]]] = []
+        for city in cities:
+            city = city.strip()
+            try:
+                query = self.resolve(city)
+            except WeatherError as e:
+                resolved.append((city, None, e))
+                continue
+            self.hot_cities.record(query.key, query)
+            resolved.append((city, query, None))
+
+        missing: Dict[str, WeatherQuery] = {}
+        for _, query, _ in resolved:
+            if query is None or "id" not in query.params:
+                continue
+            cached = self.cache.peek(query.key)
+            if cached is None or cached[1] > self.cache.ttl + self.cache.stale_ttl:
+                missing[query.key] = query
+        await self._load_group(list(missing.values()))
+
+        async def collect(city, query, error) -> CityWeather:
+            if query is None:
+                return CityWeather(city, city, None, error)
+            try:
+                reading, _ = await self._get_reading(city, query)
+            except WeatherError as e:
+                return CityWeather(city, query.title, None, e)
+            return CityWeather(city, query.title, reading, None)
+
+        return list(await asyncio.gather(*(collect(*item) for item in resolved)))
 
-    def get_weather(self, city: str) -> str:
-        """Получает данные о погоде для указанного города"""
+    async def _load_group(self, queries: List[WeatherQuery], wait: bool = True):
+        """Загружает в кэш города по id пачками; ошибки оставляют их промахами
+
+        Каждый город пачки занимает в single-flight свой ключ, поэтому
+        одновременный запрос того же города ждет пачку, а не идет в API.
+        """
+        # Города, которые уже загружаются, дождутся своего запроса
+        queries = [query for query in queries if query.key not in self._flight]
+        # Один город дешевле обычным запросом, он же объединяется с /weather
+        if len(queries) < 2:
+            return
+        for start in range(0, len(queries), WEATHER_GROUP_SIZE):
+            chunk = queries[start : start + WEATHER_GROUP_SIZE]
+            batch = asyncio.ensure_future(self._fetch_group(chunk, wait))
+            # Ключи занимаем сразу, до первого переключения цикла событий
+            flights = [
+                self._flight.start(
+                    query.key,
+                    lambda query=query: self._take_from_group(query, batch, wait),
+                )
+                for query in chunk
+            ]
+            results = await asyncio.gather(
+                *(asyncio.shield(flight) for flight in flights),
+                return_exceptions=True,
+            )
+            errors = [result for result in results if isinstance(result, Exception)]
+            for error in errors:
+                if not isinstance(error, WeatherError):
+                    raise error
+            if errors:
+                logger.warning(
+                    f"Пакетный запрос не удался, грузим по одному: {errors[0]!r}"
+                )
+
+    async def _fetch_group(
+        self, chunk: List[WeatherQuery], wait: bool
+    ) -> Dict[str, WeatherReading]:
+        ids = ",".join(str(query.params["id"]) for query in chunk)
+        readings = await retry_with_backoff(
+            lambda: self._call(self.group_url, {"id": ids}, wait, parse=_parse_group),
+            retry_on=(UpstreamUnavailableError,),
+            no_retry_on=(CircuitOpenError,),
+        )
+        return dict(readings)
+
+    async def _take_from_group(
+        self, query: WeatherQuery, batch: "asyncio.Future", wait: bool
+    ) -> WeatherReading:
+        """Показание города из пакетного ответа; если его там нет - обычный запрос"""
+        # shield: отмена одного города не отменяет запрос всей пачки
+        readings = await asyncio.shield(batch)
+        reading = readings.get(query.key)
+        if reading is None:
+            return await self._fetch_and_store(query, wait)
+        await self._store(query.key, reading)
+        return reading
+
+    async def get_forecast(self, city: str, days: int) -> str:
+        """Прогноз на days дней; для одного дня - по шагам на ближайшие сутки"""
+        city = city.strip()
+        query = self.resolve(city)
+
+        cached = self.forecasts.get(query.key)
+        if cached is not None:
+            return cached[0].render(query.title, days)
+
+        try:
+            series = await self._load_forecast(query)
+        except CityNotFoundError:
+            self._not_found.set(query.key, True)
+            raise self._city_not_found(city)
+        except (QuotaExceededError, UpstreamError) as e:
+            last_known = self.forecasts.peek(query.key)
+            if last_known is None:
+                raise
+            logger.warning(f"Отдаем сохраненный прогноз для {query.title}: {e!r}")
+            series, age = last_known
+            return series.render(query.title, days) + (
+                f"\n\n⚠️ <i>Прогноз получен {int(age // 60)} мин назад</i>"
+            )
+        return series.render(query.title, days)
+
+    async def get_history(self, city: str, days: int) -> str:
+        """Статистика архивных наблюдений за последние days дней"""
+        city = city.strip()
+        query = self.resolve(city)
+        stats = None
+        if self.archive is not None:
+            stats = await self.archive.history(query.key, time.time() - days * 86400)
+        if stats is None:
+            return (
+                f"📈 Для <b>{query.title}</b> пока нет наблюдений за {days} дн.\n"
+                "История копится, когда бот запрашивает погоду в этом городе."
+            )
+        return stats.render(query.title, days)
+
+    async def _load_forecast(self, query: WeatherQuery) -> ForecastSeries:
+        """Загружает прогноз и вливает его в уже сохраненный ряд города"""
+
+        async def fetch_and_merge() -> ForecastSeries:
+            parsed = await retry_with_backoff(
+                lambda: self._call(
+                    self.forecast_url, query.params, True, parse=ForecastSeries.parse
+                ),
+                retry_on=(UpstreamUnavailableError,),
+                no_retry_on=(CircuitOpenError,),
+            )
+            last_known = self.forecasts.peek(query.key)
+            series = last_known[0] if last_known is not None else ForecastSeries()
+            series.merge(parsed)
+            self.forecasts.set(query.key, series)
+            return series
+
+        return await self._flight.do(f"forecast:{query.key}", fetch_and_merge)
+
+    async def _load(self, query: WeatherQuery, wait: bool = True) -> WeatherReading:
+        """Загружает погоду в кэш, объединяя одновременные запросы
+
+        Пользовательские запросы ждут токен бюджета до WEATHER_QUEUE_DEADLINE,
+        фоновые - не ждут. Временные ошибки повторяются с задержкой.
+        """
+        return await self._flight.do(
+            query.key, lambda: self._fetch_and_store(query, wait)
+        )
+
+    async def _fetch_and_store(self, query: WeatherQuery, wait: bool) -> WeatherReading:
+        if self.shared_cache is not None:
+            # Другой процесс мог загрузить этот город совсем недавно
+            shared = await self.shared_cache.get(query.key)
+            if shared is not None and shared[1] < self.cache.ttl:
+                row, age = shared
+                reading = WeatherReading.from_row(row)
+                self.cache.set(query.key, reading, age=age)
+                return reading
+
+        reading = await retry_with_backoff(
+            lambda: self._call(
+                self.base_url, query.params, wait, parse=WeatherReading.from_api
+            ),
+            retry_on=(UpstreamUnavailableError,),
+            no_retry_on=(CircuitOpenError,),
+        )
+        await self._store(query.key, reading)
+        return reading
+
+    async def _store(self, key: str, reading: WeatherReading):
+        """Новое показание из API: в кэш, слушателям и в общий кэш процессов"""
+        self.cache.set(key, reading)
+        self._on_refresh(key, reading)
+        if self.shared_cache is not None:
+            await self.shared_cache.set(key, reading.to_row())
+
+    def add_refresh_listener(self, callback: Callable[[str, WeatherReading], None]):
+        """callback(ключ, показание) вызывается после каждой загрузки из API"""
+        self._refresh_listeners.append(callback)
+
+    def remove_refresh_listener(
+        self, callback: Callable[[str, WeatherReading], None]
+    ):
+        if callback in self._refresh_listeners:
+            self._refresh_listeners.remove(callback)
+
+    def _on_refresh(self, key: str, reading: WeatherReading):
+        """Вызывается для каждого нового показания, полученного от API"""
+        if self.archive is not None:
+            self.archive.append(key, reading)
+        for callback in self._refresh_listeners:
+            try:
+                callback(key, reading)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика нового показания {key}: {e!r}")
+
+    def _breaker(self, url: str) -> CircuitBreaker:
+        breaker = self._breakers.get(url)
+        if breaker is None:
+            breaker = self._breakers[url] = CircuitBreaker(url)
+        return breaker
+
+    async def _call(
+        self,
+        url: str,
+        search: dict,
+        wait: bool,
+        parse: Optional[Callable[[dict], Any]] = None,
+    ) -> Any:
+        """Один запрос к API через выключатель и бюджет запросов
+
+        parse разбирает ответ внутри запроса: ошибка формата считается сбоем
+        сервиса так же, как обрыв соединения.
+        """
+        breaker = self._breaker(url)
+        breaker.check()
+
+        if wait:
+            granted = await self.quota.acquire(WEATHER_QUEUE_DEADLINE)
+        else:
+            # Фоновые запросы не выбирают бюджет до дна: часть оставляем пользователям
+            granted = self.quota.try_acquire(WEATHER_USER_RESERVE)
+        if not granted:
+            # Запрос так и не ушел, поэтому пробный слот выключателя освобождаем
+            breaker.release()
+            raise QuotaExceededError()
+
+        try:
+            data = await self._fetch(url, search, parse)
+        except UpstreamUnavailableError:
+            breaker.record_failure()
+            raise
+        except WeatherError:
+            # API ответил осмысленно (404, 429, 4xx) - он доступен
+            breaker.record_success()
+            raise
+        except Exception:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            # Запрос отменен: исход неизвестен, пробный слот освобождаем
+            breaker.release()
+            raise
+        breaker.record_success()
+        return data
+
+    async def _fetch(
+        self, url: str, search: dict, parse: Optional[Callable[[dict], Any]] = None
+    ) -> Any:
+        """Запрашивает данные у OpenWeatherMap и переводит ошибки в WeatherError"""
+        params = {
+            **search,
+            "appid": self.api_key,
+            "units": "metric",
+            "lang": "ru",
+        }
+        endpoint = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            async with self.session.get(url, params=params) as response:
+                upstream_latency.labels(endpoint).observe(time.perf_counter() - started)
+                upstream_responses.labels(endpoint, response.status).inc()
+                if response.status == 404:
+                    raise CityNotFoundError(str(search.get("q", "")))
+                if response.status == 429:
+                    self.quota.penalize(float(response.headers.get("Retry-After", 60)))
+                    raise QuotaExceededError()
+                if response.status >= 500:
+                    raise UpstreamUnavailableError()
+                if response.status >= 400:
+                    logger.error(
+                        f"OpenWeatherMap ответил {response.status}: "
+                        f"{await response.text()}"
+                    )
+                    raise UpstreamError()
+                try:
+                    data = await response.json(loads=json_loads)
+                    return parse(data) if parse is not None else data
+                except (ValueError, KeyError, IndexError, TypeError) as e:
+                    # Обрезанный или неожиданный ответ - тоже сбой сервиса
+                    upstream_responses.labels(endpoint, "invalid").inc()
+                    logger.error(f"Некорректный ответ OpenWeatherMap: {e!r}")
+                    raise UpstreamUnavailableError() from e
+        except asyncio.TimeoutError as e:
+            upstream_responses.labels(endpoint, "timeout").inc()
+            raise UpstreamUnavailableError() from e
+        except aiohttp.ClientError as e:
+            upstream_responses.labels(endpoint, "error").inc()
+            raise UpstreamUnavailableError() from e
+
+    def _schedule_refresh(self, query: WeatherQuery):
+        """Запускает одно фоновое обновление устаревшей записи"""
+        if query.key in self._refreshing:
+            return
+        task = asyncio.create_task(self.refresh(query))
+        self._refreshing[query.key] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(query.key, None))
+
+    async def refresh(self, query: WeatherQuery) -> bool:
+        """Обновляет запись в кэше без ожидания бюджета; True при успехе"""
         try:
-            params = {
-                "q": city,
-                "appid": self.api_key,
-                "units": "metric",
-                "lang": "ru",
-            }
-
-            response = requests.get(self.base_url, params=params)
-            response.raise_for_status()
-            data = response.json()
-
-            return self._format_weather_data(data, city)
-
-        except requests.exceptions.HTTPError as e:
-            if response.status_code == 404:
-                return f"❌ Город '{city}' не найден. Проверьте правильность написания."
-            else:
-                return f"❌ Ошибка при получении данных: {e}"
+            await self._load(query, wait=False)
+            return True
+        except QuotaExceededError:
+            logger.debug(f"Нет бюджета на обновление {query.title}")
         except Exception as e:
-            return f"❌ Ошибка: {e}"
-
-    def _format_weather_data(self, data: dict, city: str) -> str:
-        """Форматирует данные о погоде в читаемый вид"""
-        weather_info = f"🌤 <b>Погода в {city}</b>\n\n"
-        weather_info += (
-            f"• <b>Состояние:</b> {data['weather'][0]['description'].capitalize()}\n"
-        )
-        weather_info += f"• <b>Температура:</b> {data['main']['temp']} °C\n"
-        weather_info += f"• <b>Ощущается как:</b> {data['main']['feels_like']} °C\n"
-        weather_info += f"• <b>Влажность:</b> {data['main']['humidity']}%\n"
-        weather_info += f"• <b>Давление:</b> {data['main']['pressure']} гПа\n"
-        weather_info += f"• <b>Скорость ветра:</b> {data['wind']['speed']} м/с\n"
-
-        # Время заката
-        sunset_timestamp = data["sys"]["sunset"]
-        sunset_time = datetime.fromtimestamp(sunset_timestamp).strftime("%H:%M:%S")
-        weather_info += f"• <b>Закат:</b> {sunset_time}\n"
-
-        return weather_info
+            logger.warning(f"Не удалось обновить погоду для {query.title}: {e!r}")
+        return False
+
+    async def refresh_many(self, queries: Sequence[WeatherQuery]):
+        """Фоновое обновление нескольких городов: по id пачками, прочие по одному
+
+        Свежие записи пропускаются, бюджет не ждем: чего не хватило, останется
+        промахом до следующего раза.
+        """
+        stale = [query for query in queries if self._needs_refresh(query)]
+        await self._load_group(
+            [query for query in stale if "id" in query.params], wait=False
+        )
+        rest = [query for query in stale if self._needs_refresh(query)]
+        await asyncio.gather(*(self.refresh(query) for query in rest))
+
+    def _needs_refresh(self, query: WeatherQuery) -> bool:
+        cached = self.cache.peek(query.key)
+        return cached is None or cached[1] >= self.cache.ttl
+
+    def stats(self) -> dict:
+        """Счетчики сервиса для мониторинга"""
+        stats = {
+            "cache": self.cache.stats(),
+            "forecasts": self.forecasts.stats(),
+            "upstream": self._flight.stats(),
+            "refreshing": len(self._refreshing),
+            "quota": self.quota.snapshot(),
+            "circuit_breakers": {
+                url: breaker.snapshot() for url, breaker in self._breakers.items()
+            },
+        }
+        if self.shared_cache is not None:
+            stats["shared_cache"] = self.shared_cache.stats()
+        if self.archive is not None:
+            stats["archive"] = self.archive.stats()
+        return stats
+
+    def format_comparison(self, results: Sequence[CityWeather]) -> str:
+        """Компактная таблица погоды по нескольким городам"""
+        rows = [f"{'Город':<14} {'°C':>5} {'Ощущ':>5} {'Влаж':>4} {'Ветер':>5}"]
+        for result in results:
+            name = result.title
+            if len(name) > 14:
+                name = name[:13] + "…"
+            if result.reading is None:
+                if isinstance(result.error, CityNotFoundError):
+                    status = "не найден"
+                else:
+                    status = "нет данных"
+                rows.append(f"{name:<14} {status}")
+                continue
+            reading = result.reading
+            rows.append(
+                f"{name:<14} {reading.temp:>5.1f} {reading.feels_like:>5.1f} "
+                f"{reading.humidity:>3}% {reading.wind_speed:>5.1f}"
+            )
+        table = html.escape("\n".join(rows))
+        return f"📊 <b>Сравнение погоды</b>\n\n<pre>{table}</pre>"
+
+    def _format_stale_data(
+        self, reading: WeatherReading, city: str, age: float
+    ) -> str:
+        """Форматирует сохраненные данные с пометкой об их возрасте"""
+        minutes = max(1, int(age // 60))
+        return reading.render(city) + (
+            "\n⚠️ <i>Сервис погоды недоступен, "
+            f"данные получены {minutes} мин назад</i>"
+        )
+
+
+def _parse_group(data: dict) -> List[Tuple[str, WeatherReading]]:
+    """Ответ /group: пары (ключ кэша, показание)"""
+    return [
+        (f"id:{item['id']}", WeatherReading.from_api(item))
+        for item in data.get("list", ())
+    ]
 
 
 # Создаем экземпляр сервиса для импорта
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from typing import Callable, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+from config import (
+    PORT,
+    WEBHOOK_BASE_URL,
+    WEBHOOK_HOST,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+)
+from web.health import health_payload, metrics_text
+
+
+logger = logging.getLogger(__name__)
+
+
+async def home(request: web.Request) -> web.Response:
+    return web.json_response(
+        {"status": "Bot is running", "service": "Weather Telegram Bot"}
+    )
+
+
+async def health(request: web.Request) -> web.Response:
+    payload, status = health_payload()
+    return web.json_response(payload, status=status)
+
+
+async def ping(request: web.Request) -> web.Response:
+    return web.Response(text="pong")
+
+
+async def metrics(request: web.Request) -> web.Response:
+    return web.Response(
+        text=metrics_text(), content_type="text/plain", charset="utf-8"
+    )
+
+
+def create_webhook_app(bot: Bot, dp: Dispatcher) -> web.Application:
+    """Создает aiohttp приложение: вебхук Telegram и служебные маршруты"""
+    app = web.Application()
+    app.router.add_get("/", home)
+    app.router.add_get("/health", health)
+    app.router.add_get("/ping", ping)
+    app.router.add_get("/metrics", metrics)
+
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET
+    ).register(app, path=WEBHOOK_PATH)
+
+    return app
+
+
+async def run_webhook(
+    bot: Bot,
+    dp: Dispatcher,
+    port: int = PORT,
+    on_ready: Optional[Callable[[], None]] = None,
+):
+    """Запускает веб-сервер в текущем event loop и регистрирует вебхук
+
+    on_ready вызывается, когда сервер слушает порт и вебхук установлен.
+    """
+    app = create_webhook_app(bot, dp)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, port)
+    await site.start()
+    logger.info(f"Веб-сервер запущен на {WEBHOOK_HOST}:{port}")
+
+    # Повторная регистрация того же URL безопасна, поэтому ее могут
+    # выполнять все реплики за балансировщиком
+    await bot.set_webhook(
+        WEBHOOK_BASE_URL + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logger.info(f"Вебхук установлен: {WEBHOOK_BASE_URL}{WEBHOOK_PATH}")
+    if on_ready is not None:
+        on_ready()
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()